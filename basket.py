@@ -0,0 +1,319 @@
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Canonical dtypes for basket frames kept in session state. Categoricals store
+# each distinct symbol/name once, prices are float32 with NaN for missing
+# values (instead of 'N/A' strings) and quantities are int32.
+BASKET_DTYPES = {
+    'Symbol': 'category',
+    'Name': 'category',
+    'Price': 'float32',
+    'FetchedPrice': 'float32',
+    'Score': 'float32',
+    'Quantity': 'int32',
+    'Selected': 'bool'
+}
+
+# Value used for a numeric basket column when a row doesn't provide one
+BASKET_DEFAULTS = {
+    'Price': float('nan'),
+    'FetchedPrice': float('nan'),
+    'Score': float('nan'),
+    'Quantity': 1,
+    'Selected': True
+}
+
+# Coerce a column to numbers, treating 'N/A', blanks and thousands separators as missing
+def to_numeric(series):
+    if pd.api.types.is_numeric_dtype(series):
+        return pd.to_numeric(series, errors='coerce')
+    return pd.to_numeric(series.astype(str).str.replace(',', ''), errors='coerce')
+
+# Apply the canonical basket schema to a stocks DataFrame
+def normalize_basket(df):
+    """Return a copy of df using the compact dtypes from BASKET_DTYPES.
+
+    Every entry point that stores a basket in session state (CSV upload,
+    manual adds, price fetches, optimisation and the selection editor)
+    passes through here so all sessions hold the same representation.
+    """
+    if df is None:
+        return None
+
+    df = df.reset_index(drop=True)
+
+    if 'Symbol' in df.columns:
+        df['Symbol'] = df['Symbol'].astype(str).str.strip().astype('category')
+    if 'Name' in df.columns:
+        df['Name'] = df['Name'].astype('category')
+    for col in ('Price', 'FetchedPrice', 'Score'):
+        if col in df.columns:
+            df[col] = to_numeric(df[col]).astype('float32')
+    if 'Quantity' in df.columns:
+        df['Quantity'] = to_numeric(df['Quantity']).fillna(1).astype('int32')
+    if 'Selected' in df.columns:
+        df['Selected'] = pd.Series(np.where(df['Selected'].isna(), True, df['Selected']), index=df.index).astype(bool)
+
+    return df
+
+class BasketBuffer:
+    """Append-optimised, symbol-keyed storage for a basket.
+
+    Numeric columns live in preallocated NumPy arrays that double in
+    capacity when full, other columns in Python lists, and a dict maps each
+    symbol to its row. Adding a stock and checking for duplicates are
+    therefore O(1) (amortised) however large the basket grows. A DataFrame
+    in the canonical schema is only built by to_frame(), and is cached
+    until the next change.
+    """
+
+    def __init__(self, columns=('Symbol', 'Quantity', 'Selected'), capacity=16):
+        self._capacity = capacity
+        self._size = 0
+        self._index = {}
+        self._columns = {}
+        self._frame = None
+        # Bumped on every change, so callers can tell whether to save the basket again
+        self.version = 0
+
+        for name in columns:
+            self._add_column(name)
+
+    @classmethod
+    def from_frame(cls, df):
+        buffer = cls(columns=['Symbol'] + [col for col in df.columns if col != 'Symbol'])
+        buffer.extend(df)
+        return buffer
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, symbol):
+        return str(symbol).strip() in self._index
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def symbols(self):
+        return self._columns['Symbol']
+
+    def position(self, symbol):
+        """Row position of symbol, or None"""
+        return self._index.get(str(symbol).strip())
+
+    def _add_column(self, name):
+        if name in BASKET_DEFAULTS:
+            self._columns[name] = np.full(self._capacity, BASKET_DEFAULTS[name], dtype=BASKET_DTYPES[name])
+        else:
+            self._columns[name] = [None] * self._size
+
+    def _reserve(self, extra):
+        needed = self._size + extra
+        if needed <= self._capacity:
+            return
+
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+
+        for name, storage in self._columns.items():
+            if isinstance(storage, np.ndarray):
+                grown = np.full(capacity, BASKET_DEFAULTS[name], dtype=storage.dtype)
+                grown[:self._size] = storage[:self._size]
+                self._columns[name] = grown
+
+        self._capacity = capacity
+
+    def _coerce(self, name, value):
+        default = BASKET_DEFAULTS[name]
+        if value is None:
+            return default
+        if name == 'Selected':
+            return bool(value)
+        try:
+            value = float(str(value).replace(',', '')) if isinstance(value, str) else float(value)
+        except ValueError:
+            return default
+        if np.isnan(value) and name == 'Quantity':
+            return default
+        return value
+
+    def append(self, row):
+        """Add one stock (a dict of column values); returns False if the symbol is already present"""
+        symbol = str(row['Symbol']).strip()
+        if symbol in self._index:
+            return False
+
+        for name in row:
+            if name not in self._columns:
+                self._add_column(name)
+        self._reserve(1)
+
+        position = self._size
+        for name, storage in self._columns.items():
+            value = symbol if name == 'Symbol' else row.get(name)
+            if isinstance(storage, np.ndarray):
+                storage[position] = self._coerce(name, value)
+            else:
+                storage.append(value)
+
+        self._index[symbol] = position
+        self._size += 1
+        self._frame = None
+        self.version += 1
+        return True
+
+    def extend(self, df):
+        """Append the rows of df whose symbols are not in the basket yet; returns how many were added"""
+        df = normalize_basket(df)
+        if df is None or df.empty:
+            return 0
+
+        symbols = df['Symbol'].astype(str)
+        new_rows = ~symbols.isin(list(self._index)) & ~symbols.duplicated()
+        df = df[new_rows]
+        added = len(df)
+        if added == 0:
+            return 0
+
+        for name in df.columns:
+            if name not in self._columns:
+                self._add_column(name)
+        self._reserve(added)
+
+        start = self._size
+        for name, storage in self._columns.items():
+            if name in df.columns:
+                values = df[name]
+                if isinstance(storage, np.ndarray):
+                    storage[start:start + added] = values.to_numpy(dtype=storage.dtype, na_value=BASKET_DEFAULTS[name])
+                else:
+                    storage.extend(values.astype(object).where(values.notna(), None).tolist())
+            elif not isinstance(storage, np.ndarray):
+                storage.extend([None] * added)
+
+        self._index.update(zip(df['Symbol'].astype(str), range(start, start + added)))
+        self._size += added
+        self._frame = None
+        self.version += 1
+        return added
+
+    def get_value(self, symbol, name):
+        """One cell, or None if the symbol or column isn't in the basket"""
+        position = self.position(symbol)
+        if position is None or name not in self._columns:
+            return None
+        return self._columns[name][position]
+
+    def set_value(self, symbol, name, value):
+        """Update one cell in place; returns False if the symbol isn't in the basket"""
+        position = self.position(symbol)
+        if position is None:
+            return False
+
+        if name not in self._columns:
+            self._add_column(name)
+
+        storage = self._columns[name]
+        if isinstance(storage, np.ndarray):
+            storage[position] = self._coerce(name, value)
+        else:
+            storage[position] = value
+
+        self._frame = None
+        self.version += 1
+        return True
+
+    def update_rows(self, edits):
+        """Apply {position: {column: value}} edits in place, as a data_editor
+        reports them; returns how many cells changed. Unknown positions and
+        the Symbol column (the basket's key) are skipped."""
+        changed = 0
+        for position, row in edits.items():
+            position = int(position)
+            if not 0 <= position < self._size:
+                continue
+            for name, value in row.items():
+                if name == 'Symbol':
+                    continue
+                if name not in self._columns:
+                    self._add_column(name)
+                storage = self._columns[name]
+                storage[position] = self._coerce(name, value) if isinstance(storage, np.ndarray) else value
+                changed += 1
+
+        if changed:
+            self._frame = None
+            self.version += 1
+        return changed
+
+    def column(self, name):
+        """A read-only view of one column's values (a copy for non-numeric columns)"""
+        storage = self._columns[name]
+        if isinstance(storage, np.ndarray):
+            view = storage[:self._size]
+            view.flags.writeable = False
+            return view
+        return list(storage)
+
+    def set_column(self, name, values, positions=None):
+        """Set a column (or the rows at positions) to values, a scalar or an array, in one vectorized write"""
+        if name == 'Symbol':
+            raise ValueError("Symbols are the basket's key and can't be overwritten")
+        if name not in self._columns:
+            self._add_column(name)
+
+        storage = self._columns[name]
+        rows = slice(0, self._size) if positions is None else np.asarray(positions, dtype='int64')
+        if isinstance(storage, np.ndarray):
+            values = np.asarray(values, dtype='float64') if name != 'Selected' else np.asarray(values, dtype=bool)
+            if name == 'Quantity':
+                values = np.where(np.isnan(values), BASKET_DEFAULTS[name], values)
+            storage[rows] = values
+        else:
+            indices = range(self._size) if positions is None else rows.tolist()
+            values = [values] * len(indices) if np.ndim(values) == 0 else list(values)
+            for index, value in zip(indices, values):
+                storage[index] = value
+
+        self._frame = None
+        self.version += 1
+
+    def to_frame(self):
+        """The basket as a DataFrame in the canonical schema (cached until the next change)"""
+        if self._frame is None:
+            data = {}
+            for name, storage in self._columns.items():
+                if isinstance(storage, np.ndarray):
+                    data[name] = storage[:self._size].copy()
+                elif BASKET_DTYPES.get(name) == 'category':
+                    data[name] = pd.Categorical(storage)
+                else:
+                    data[name] = pd.Series(storage)
+            self._frame = pd.DataFrame(data)
+        return self._frame
+
+    def __getstate__(self):
+        # The cached frame is rebuilt on demand, so don't pickle it
+        state = self.__dict__.copy()
+        state['_frame'] = None
+        return state
+
+    @property
+    def nbytes(self):
+        """Approximate memory held by the buffer and its cached frame"""
+        total = 0
+        for storage in self._columns.values():
+            if isinstance(storage, np.ndarray):
+                total += storage.nbytes
+            else:
+                # List of pointers plus the distinct objects they reference
+                total += 8 * len(storage) + sum(len(str(value)) + 49 for value in set(map(str, storage)))
+        total += 100 * len(self._index)
+        if self._frame is not None:
+            total += int(self._frame.memory_usage(deep=True).sum())
+        return total
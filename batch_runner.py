@@ -0,0 +1,233 @@
+"""Run the CSV-to-orders pipeline from the command line, without the web UI.
+
+Reads a basket CSV, fills in missing prices, optionally sizes quantities to
+a budget, places (or dry-runs) the orders and writes the results as CSV or
+JSON. Suitable for cron-scheduled rebalances:
+
+    python batch_runner.py basket.csv --budget 50000 --output results.csv
+    python batch_runner.py basket.csv --username alice --allocation-pct 90 --no-dry-run
+
+Credentials come from --api-key/--access-token (or the KITE_API_KEY and
+KITE_ACCESS_TOKEN environment variables), or from the access token the app
+cached for --username, valid until Kite's next daily reset. Orders are
+dry runs unless --no-dry-run is given.
+"""
+import argparse
+import logging
+import os
+import sys
+
+import trading_core
+from basket import to_numeric
+from execution import SlicedExecution, aggregate_child_fills, plan_child_orders
+from rebalance import plan_rebalance
+from state_backend import STATE_BACKEND_URL, open_state_backend
+from token_cache import TokenCache, load_cipher
+from trading_core import Reporter
+
+# Prints progress and messages to stderr
+class ConsoleReporter(Reporter):
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def progress(self, done, total, message=""):
+        if not self.quiet:
+            print(f"[{done}/{total}] {message}", file=sys.stderr)
+
+    def info(self, message):
+        if not self.quiet:
+            print(message, file=sys.stderr)
+
+    def warning(self, message):
+        print(f"Warning: {message}", file=sys.stderr)
+
+    def error(self, message):
+        print(f"Error: {message}", file=sys.stderr)
+
+# API key and access token for a user, from the app's encrypted token cache
+def load_user_token(username, state_url=STATE_BACKEND_URL):
+    record = TokenCache(open_state_backend(state_url), load_cipher()).load(username)
+    if record is None:
+        raise ValueError(f"No valid access token for {username}; log in through the app first")
+
+    return record['api_key'], record['access_token']
+
+def connect(args):
+    api_key = args.api_key or os.environ.get("KITE_API_KEY")
+    access_token = args.access_token or os.environ.get("KITE_ACCESS_TOKEN")
+
+    if args.username:
+        api_key, access_token = load_user_token(args.username, args.state_backend)
+
+    if not api_key or not access_token:
+        return None
+
+    from kiteconnect import KiteConnect
+
+    kite = KiteConnect(api_key=api_key)
+    kite.set_access_token(access_token)
+    return kite
+
+# GTT trigger and limit prices per symbol, from TriggerPrice/LimitPrice columns
+def gtt_details_from_basket(stocks_df):
+    missing = [col for col in ('TriggerPrice', 'LimitPrice') if col not in stocks_df.columns]
+    if missing:
+        raise ValueError(f"GTT orders need these CSV columns: {missing}")
+
+    symbols = stocks_df['Symbol'].astype(str)
+    return {
+        'trigger_price': dict(zip(symbols, to_numeric(stocks_df['TriggerPrice']).fillna(0))),
+        'limit_price': dict(zip(symbols, to_numeric(stocks_df['LimitPrice']).fillna(0)))
+    }
+
+def write_results(orders_df, output):
+    if output is None or output == '-':
+        orders_df.to_csv(sys.stdout, index=False, na_rep='N/A')
+    elif output.endswith('.json'):
+        orders_df.to_json(output, orient='records', indent=2)
+    else:
+        orders_df.to_csv(output, index=False, na_rep='N/A')
+
+def run(args, reporter):
+    stocks_df = trading_core.read_csv(args.csv, reporter)
+    if stocks_df is None:
+        return 2
+
+    kite = connect(args)
+    if kite is None and not args.dry_run:
+        reporter.error("Live orders need Kite credentials (--username, or --api-key and --access-token)")
+        return 2
+
+    if kite is not None:
+        try:
+            stocks_df, _ = trading_core.resolve_basket_symbols(kite, stocks_df, reporter=reporter)
+        except Exception as e:
+            reporter.warning(f"Could not resolve symbols against the instrument list: {str(e)}")
+
+    stocks_df = trading_core.fill_missing_prices(kite, stocks_df)
+
+    budget = args.budget
+    if budget is None and args.allocation_pct is not None:
+        if kite is None:
+            reporter.error("--allocation-pct needs Kite credentials to read the account balance")
+            return 2
+        balance = trading_core.get_account_balance(kite)
+        if not balance or 'Available Cash' not in balance:
+            reporter.error("Could not retrieve account balance")
+            return 2
+        budget = balance['Available Cash'] * args.allocation_pct / 100
+
+    if budget is not None:
+        stocks_df, message = trading_core.calculate_optimal_quantities(stocks_df, budget)
+        reporter.info(message)
+
+    if args.trim_to_margin:
+        if kite is None:
+            reporter.error("--trim-to-margin needs Kite credentials")
+            return 2
+        balance = trading_core.get_account_balance(kite)
+        if not balance or 'Available Cash' not in balance:
+            reporter.error("Could not retrieve account balance")
+            return 2
+        legs = len(stocks_df)
+        stocks_df, _, summary = trading_core.trim_to_margin(kite, stocks_df, balance['Available Cash'])
+        reporter.info(f"Basket needs ₹{summary['total']:.2f} (margin and charges) for {len(stocks_df)} of {legs} legs")
+
+    if args.rebalance:
+        if kite is None:
+            reporter.error("--rebalance needs Kite credentials to read holdings")
+            return 2
+        stocks_df, summary = plan_rebalance(kite, stocks_df, args.exit_unlisted)
+        reporter.info(f"Rebalance: {summary['sells']} sells (₹{summary['sell_value']:.2f}), "
+                      f"{summary['buys']} buys (₹{summary['buy_value']:.2f}), {summary['unchanged']} legs unchanged")
+    
+    gtt_details = gtt_details_from_basket(stocks_df) if args.order_type == "GTT" else None
+    
+    if args.order_type == "LIMIT":
+        if kite is None:
+            reporter.error("LIMIT orders need Kite credentials to quote prices and circuit limits")
+            return 2
+        stocks_df = trading_core.price_limit_orders(kite, stocks_df, args.limit_offset, args.limit_base, reporter=reporter)
+        flagged = stocks_df['Band Flag'].notna()
+        for symbol, flag in zip(stocks_df['Symbol'][flagged], stocks_df['Band Flag'][flagged]):
+            reporter.warning(f"{symbol}: {flag}{' (skipped)' if args.skip_flagged else ''}")
+        if args.skip_flagged:
+            stocks_df = stocks_df[~flagged]
+
+    if args.order_type == "MARKET" and (args.max_slice or args.freeze_qty or args.twap_minutes):
+        children_df = plan_child_orders(stocks_df, args.max_slice, args.freeze_qty, args.twap_minutes * 60, args.twap_slices)
+        reporter.info(f"Sending {len(children_df)} child orders for {len(stocks_df)} stocks")
+        children_df = SlicedExecution(kite, children_df, args.dry_run).run()
+        orders_df = aggregate_child_fills(children_df) if args.parents_only else children_df
+        failed = int((children_df['Order ID'] == 'Failed').sum())
+        successful = len(children_df) - failed
+        sent_df = children_df
+    else:
+        successful, failed, orders_df = trading_core.place_orders(
+            kite, stocks_df, args.order_type, args.dry_run, gtt_details, reporter=reporter
+        )
+        sent_df = orders_df
+
+    if not args.dry_run and args.order_type != "GTT":
+        trading_core.append_order_journal([
+            {'event': 'placed', 'order_id': order_id, 'symbol': symbol, 'quantity': int(quantity), 'side': side, 'source': 'batch_runner'}
+            for order_id, symbol, quantity, side, status in zip(
+                sent_df['Order ID'], sent_df['Symbol'], sent_df['Quantity'],
+                sent_df['Side'].astype(str) if 'Side' in sent_df.columns else ['BUY'] * len(sent_df), sent_df['Status']
+            )
+            if status == 'Success'
+        ], args.username)
+
+    write_results(orders_df, args.output)
+    reporter.info(f"{successful} successful, {failed} failed{' (dry run)' if args.dry_run else ''}")
+
+    return 0 if failed == 0 else 1
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Place a basket of orders from a CSV file")
+    parser.add_argument('csv', help="Basket CSV with at least a Symbol column")
+    parser.add_argument('--order-type', choices=['MARKET', 'LIMIT', 'GTT'], default='MARKET')
+    parser.add_argument('--dry-run', action=argparse.BooleanOptionalAction, default=True,
+                        help="Only simulate the orders (default); --no-dry-run places them")
+    sizing = parser.add_mutually_exclusive_group()
+    sizing.add_argument('--budget', type=float, help="Size quantities to spend about this much")
+    sizing.add_argument('--allocation-pct', type=float, help="Size quantities to this %% of available cash")
+    parser.add_argument('--trim-to-margin', action='store_true',
+                        help="Check the basket with Kite's margin API and trim quantities to fit the available cash")
+    limit = parser.add_argument_group("limit pricing (LIMIT only)")
+    limit.add_argument('--limit-offset', type=float, default=0.0, help="Limit price as %% +/- from the base price")
+    limit.add_argument('--limit-base', choices=['LTP', 'Price'], default='LTP',
+                       help="Price limits off the last traded price or the CSV Price column")
+    limit.add_argument('--skip-flagged', action='store_true',
+                       help="Leave out legs clamped to the circuit band or without a price")
+    parser.add_argument('--rebalance', action='store_true',
+                        help="Treat quantities as target holdings and only trade the difference, sells first")
+    parser.add_argument('--exit-unlisted', action='store_true',
+                        help="With --rebalance, also sell holdings that are not in the basket")
+    slicing = parser.add_argument_group("order slicing (MARKET only)")
+    slicing.add_argument('--max-slice', type=int, help="Max shares per child order")
+    slicing.add_argument('--freeze-qty', type=int, help="Exchange freeze quantity; child orders stay below it")
+    slicing.add_argument('--twap-minutes', type=float, default=0, help="Spread each stock's child orders over this many minutes")
+    slicing.add_argument('--twap-slices', type=int, default=1, help="Minimum child orders per stock when using TWAP")
+    slicing.add_argument('--parents-only', action='store_true', help="Write one aggregated row per stock instead of one per child order")
+    parser.add_argument('--username', help="Use the access token stored for this app user")
+    parser.add_argument('--state-backend', default=STATE_BACKEND_URL, help="State backend URL of the app (see STATE_BACKEND_URL)")
+    parser.add_argument('--api-key')
+    parser.add_argument('--access-token')
+    parser.add_argument('--output', '-o', help="Results file (.csv or .json); CSV to stdout by default")
+    parser.add_argument('--quiet', '-q', action='store_true', help="Only print warnings and errors")
+    args = parser.parse_args(argv)
+    
+    if args.rebalance and (args.order_type == "GTT" or args.trim_to_margin or args.max_slice or args.freeze_qty or args.twap_minutes):
+        parser.error("--rebalance works with MARKET or LIMIT orders, without --trim-to-margin or slicing")
+
+    logging.basicConfig(level=logging.WARNING if args.quiet else logging.INFO)
+
+    try:
+        return run(args, ConsoleReporter(args.quiet))
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
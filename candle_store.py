@@ -0,0 +1,295 @@
+"""Local store of historical candles, filled incrementally from Kite.
+
+Candles for one (instrument_token, interval) live in their own directory
+as one raw binary file per column (date as epoch seconds, open, high, low,
+close, volume) plus a meta.json with the row count and the time range that
+has been fetched. Reads memory-map the column files and slice them by date,
+so charts and screens get NumPy views of the page cache, not copies.
+
+Each request only fetches what the store is missing: the range before the
+stored start, if an earlier start is asked for, and the tail since the
+last stored candle (refetched, since it may still have been forming).
+Requests for the same series are single-flight: while one thread fetches,
+the others wait for it and then read the stored result instead of calling
+the API again. A lock file per series extends this to the other worker
+processes sharing the store. All fetches in a process share one rate
+limiter sized for Kite's historical data limit.
+"""
+import datetime
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import zoneinfo
+
+from lazy_imports import lazy_import
+from trading_core import RateLimiter
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger('zerodha_trading_tool.candles')
+
+CANDLE_STORE_DIR = os.environ.get("CANDLE_STORE_DIR", "candle_store")
+
+# Kite allows 3 historical data requests per second
+HISTORICAL_RATE_LIMIT = 3
+
+# Kite's dates are exchange-local
+MARKET_TZ = zoneinfo.ZoneInfo("Asia/Kolkata")
+
+# Column name and on-disk dtype, in file order
+CANDLE_COLUMNS = (
+    ('date', 'int64'),
+    ('open', 'float64'),
+    ('high', 'float64'),
+    ('low', 'float64'),
+    ('close', 'float64'),
+    ('volume', 'int64'),
+)
+
+INTERVAL_SECONDS = {
+    'minute': 60,
+    '3minute': 180,
+    '5minute': 300,
+    '10minute': 600,
+    '15minute': 900,
+    '30minute': 1800,
+    '60minute': 3600,
+    'day': 86400,
+}
+
+# Longest range Kite returns in one historical_data call, per interval
+MAX_DAYS_PER_REQUEST = {
+    'minute': 60,
+    '3minute': 100,
+    '5minute': 100,
+    '10minute': 100,
+    '15minute': 200,
+    '30minute': 200,
+    '60minute': 400,
+    'day': 2000,
+}
+
+# The tail is refetched at most this often (still-forming candles change)
+TAIL_REFRESH_SECONDS = 60
+
+def to_epoch(value):
+    """Epoch seconds for a date or datetime; naive values are exchange time."""
+    if isinstance(value, (int, float)):
+        return int(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=MARKET_TZ)
+    return int(value.timestamp())
+
+def from_epoch(seconds):
+    """Naive exchange-time datetime, the form historical_data expects."""
+    return datetime.datetime.fromtimestamp(seconds, MARKET_TZ).replace(tzinfo=None)
+
+# Instrument token of an NSE symbol, from the instrument list
+def instrument_token(symbol, instruments):
+    symbol = str(symbol).strip().upper()
+    if hasattr(instruments, 'lookup'):
+        # Mapped instrument table: binary search instead of a scan
+        inst = instruments.lookup(symbol)
+        if inst is not None:
+            return int(inst['instrument_token'])
+        instruments = []
+    for inst in instruments or []:
+        if inst['tradingsymbol'] == symbol:
+            return int(inst['instrument_token'])
+    raise ValueError(f"{symbol} not found in the NSE instrument list")
+
+# Read-only columns of one series between two dates
+class Candles:
+    """NumPy views (memory-mapped where possible) of date, open, high, low,
+    close and volume. date is datetime64[s] in UTC; to_frame() returns a
+    copy indexed by exchange time for display."""
+
+    def __init__(self, columns):
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.columns['date'])
+
+    def __getattr__(self, name):
+        try:
+            return self.__dict__['columns'][name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def to_frame(self):
+        index = pd.to_datetime(self.columns['date'], utc=True).tz_convert(MARKET_TZ)
+        return pd.DataFrame({name: self.columns[name] for name, _ in CANDLE_COLUMNS[1:]}, index=pd.Index(index, name='date'))
+
+# Process-wide candle store shared by all sessions
+class CandleStore:
+    def __init__(self, root=CANDLE_STORE_DIR, rate=HISTORICAL_RATE_LIMIT):
+        self.root = root
+        self.rate_limiter = RateLimiter(rate)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock(self, key):
+        with self._locks_lock:
+            return self._locks.setdefault(key, threading.Lock())
+
+    @staticmethod
+    def _tmp(path):
+        # Per process, so a writer never replaces another process's half-written file
+        return f"{path}.{os.getpid()}.tmp"
+
+    def _path(self, instrument_token, interval, name):
+        return os.path.join(self.root, interval, str(instrument_token), name)
+
+    def _load_meta(self, instrument_token, interval):
+        try:
+            with open(self._path(instrument_token, interval, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_meta(self, instrument_token, interval, meta):
+        path = self._path(instrument_token, interval, 'meta.json')
+        with open(self._tmp(path), 'w') as f:
+            json.dump(meta, f)
+        os.replace(self._tmp(path), path)
+
+    def _column(self, instrument_token, interval, name, dtype, rows):
+        if rows == 0:
+            return np.empty(0, dtype=dtype)
+        return np.memmap(self._path(instrument_token, interval, f'{name}.bin'), dtype=dtype, mode='r', shape=(rows,))
+
+    def _fetch(self, kite, instrument_token, interval, start, end):
+        """Candles from start to end (epoch seconds) as a dict of arrays, in
+        as many calls as Kite's per-request range limit needs."""
+        step = MAX_DAYS_PER_REQUEST[interval] * 86400
+        records = []
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + step - 1)
+            self.rate_limiter.wait()
+            records.extend(kite.historical_data(instrument_token, from_epoch(chunk_start), from_epoch(chunk_end), interval))
+            chunk_start = chunk_end + 1
+
+        logger.info(f"Fetched {len(records)} {interval} candles for {instrument_token}")
+        columns = {'date': np.array([to_epoch(record['date']) for record in records], dtype='int64')}
+        for name, dtype in CANDLE_COLUMNS[1:]:
+            columns[name] = np.array([record.get(name, 0) for record in records], dtype=dtype)
+
+        # Chunk boundaries can repeat a candle; keep the last copy of each date
+        dates = columns['date']
+        if len(dates) and np.any(np.diff(dates) <= 0):
+            _, last = np.unique(dates[::-1], return_index=True)
+            keep = len(dates) - 1 - last
+            columns = {name: values[keep] for name, values in columns.items()}
+        return columns
+
+    def _write(self, instrument_token, interval, columns, offset):
+        """Write columns starting at row offset, overwriting any rows after it.
+
+        Files are never truncated, since readers may still map the old
+        length; rows past meta['rows'] are simply ignored.
+        """
+        for name, dtype in CANDLE_COLUMNS:
+            path = self._path(instrument_token, interval, f'{name}.bin')
+            with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+                f.seek(offset * np.dtype(dtype).itemsize)
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+
+    def _replace(self, instrument_token, interval, columns):
+        """Write complete columns to new files and swap them in; readers of
+        the old files keep their (now unlinked) mapping."""
+        for name, dtype in CANDLE_COLUMNS:
+            path = self._path(instrument_token, interval, f'{name}.bin')
+            with open(self._tmp(path), 'wb') as f:
+                f.write(np.ascontiguousarray(columns[name], dtype=dtype).tobytes())
+            os.replace(self._tmp(path), path)
+
+    def _update(self, kite, instrument_token, interval, start, end):
+        meta = self._load_meta(instrument_token, interval)
+        now = time.time()
+
+        if meta is None:
+            columns = self._fetch(kite, instrument_token, interval, start, end)
+            self._replace(instrument_token, interval, columns)
+            self._save_meta(instrument_token, interval, {'rows': len(columns['date']), 'start': start, 'end': end, 'fetched_at': now})
+            return
+
+        if start < meta['start']:
+            # Earlier history: fetch the head and rewrite the series with it in front
+            head = self._fetch(kite, instrument_token, interval, start, meta['start'] - 1)
+            rows = meta['rows']
+            stored = {name: self._column(instrument_token, interval, name, dtype, rows) for name, dtype in CANDLE_COLUMNS}
+            self._replace(instrument_token, interval, {name: np.concatenate([head[name], stored[name]]) for name in stored})
+            meta.update(rows=rows + len(head['date']), start=start)
+            self._save_meta(instrument_token, interval, meta)
+
+        refresh = min(INTERVAL_SECONDS[interval], TAIL_REFRESH_SECONDS)
+        if end > meta['end'] and (end - meta['end'] >= refresh or now - meta['fetched_at'] >= refresh):
+            # Tail: refetch from the last stored candle, which may have been incomplete
+            rows = meta['rows']
+            dates = self._column(instrument_token, interval, 'date', 'int64', rows)
+            tail_start = int(dates[-1]) if rows else meta['end']
+            tail = self._fetch(kite, instrument_token, interval, tail_start, end)
+            offset = int(np.searchsorted(dates, tail_start, side='left'))
+            self._write(instrument_token, interval, tail, offset)
+            meta.update(rows=offset + len(tail['date']), end=end, fetched_at=now)
+            self._save_meta(instrument_token, interval, meta)
+
+    def candles(self, kite, instrument_token, interval, from_date, to_date=None):
+        """Candles of instrument_token from from_date to to_date (default now).
+
+        Missing ranges are fetched with kite first; concurrent calls for
+        the same series, in this process or another, wait for one fetch
+        instead of each making their own.
+        """
+        if interval not in INTERVAL_SECONDS:
+            raise ValueError(f"Unsupported interval: {interval}")
+
+        end = min(to_epoch(to_date), int(time.time())) if to_date is not None else int(time.time())
+        start = to_epoch(from_date)
+
+        os.makedirs(self._path(instrument_token, interval, ''), exist_ok=True)
+        with self._lock((instrument_token, interval)), open(self._path(instrument_token, interval, '.lock'), 'w') as lock_file:
+            # Other worker processes updating the series wait here, then find it up to date
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self._update(kite, instrument_token, interval, start, end)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        return self.read(instrument_token, interval, start, end)
+
+    def read(self, instrument_token, interval, from_date, to_date=None):
+        """Stored candles only, without calling the API; None if the series
+        has never been fetched."""
+        meta = self._load_meta(instrument_token, interval)
+        if meta is None:
+            return None
+
+        start = to_epoch(from_date)
+        end = to_epoch(to_date) if to_date is not None else int(time.time())
+
+        columns = {name: self._column(instrument_token, interval, name, dtype, meta['rows']) for name, dtype in CANDLE_COLUMNS}
+        first = np.searchsorted(columns['date'], start, side='left')
+        last = np.searchsorted(columns['date'], end, side='right')
+        columns = {name: values[first:last] for name, values in columns.items()}
+        columns['date'] = columns['date'].view('datetime64[s]')
+        return Candles(columns)
+
+    def cached_series(self):
+        """(instrument_token, interval, rows) for every stored series."""
+        series = []
+        if not os.path.isdir(self.root):
+            return series
+        for interval in sorted(os.listdir(self.root)):
+            for token in sorted(os.listdir(os.path.join(self.root, interval))):
+                meta = self._load_meta(token, interval)
+                if meta is not None:
+                    series.append((int(token), interval, meta['rows']))
+        return series
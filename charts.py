@@ -0,0 +1,111 @@
+"""Server-side downsampling and rendering of price charts.
+
+Candles from the candle store are reduced to about as many points as the
+chart has pixels before anything is sent to the browser: line charts with
+Largest-Triangle-Three-Buckets (LTTB), which keeps the visual shape of the
+close series, and candlestick charts by merging runs of candles into OHLC
+buckets. A multi-year minute series thus becomes a few hundred points.
+"""
+from lazy_imports import lazy_import
+from candle_store import MARKET_TZ
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+alt = lazy_import('altair')
+
+# Display range -> (days of history, candle interval)
+CHART_RANGES = {
+    '1D': (1, 'minute'),
+    '1W': (7, 'minute'),
+    '1M': (30, 'minute'),
+    '1Y': (365, 'day'),
+    '5Y': (5 * 365, 'day'),
+}
+
+# Horizontal pixels per candlestick body (including the gap)
+CANDLE_PIXELS = 4
+
+# Indices of the points LTTB keeps to draw y over x with threshold points
+def lttb(x, y, threshold):
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+
+    # First and last points are always kept; the rest are split into buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype('int64')
+    kept = np.empty(threshold, dtype='int64')
+    kept[0] = 0
+    kept[-1] = n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        # The next bucket's average is the third corner of the triangle
+        next_end = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean() if next_end > end else x[-1]
+        avg_y = y[end:next_end].mean() if next_end > end else y[-1]
+
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        kept[bucket + 1] = previous
+
+    return kept
+
+# Merge consecutive candles into at most buckets candles
+def ohlc_buckets(candles, buckets):
+    """Returns a dict of date, open, high, low, close and volume arrays.
+
+    Each bucket takes its first candle's date and open, the highest high,
+    the lowest low, its last close and the summed volume.
+    """
+    n = len(candles)
+    if buckets >= n:
+        return {name: np.asarray(values) for name, values in candles.columns.items()}
+
+    starts = np.unique(np.linspace(0, n, buckets, endpoint=False).astype('int64'))
+    ends = np.append(starts[1:], n) - 1
+    return {
+        'date': np.asarray(candles.date)[starts],
+        'open': np.asarray(candles.open)[starts],
+        'high': np.maximum.reduceat(candles.high, starts),
+        'low': np.minimum.reduceat(candles.low, starts),
+        'close': np.asarray(candles.close)[ends],
+        'volume': np.add.reduceat(candles.volume, starts),
+    }
+
+# Chart-sized series for candles drawn width pixels wide
+def downsample(candles, width, kind="line"):
+    """Returns a small DataFrame with exchange-time dates.
+
+    Line charts keep about one close per pixel (LTTB); candlestick charts
+    keep one OHLC bucket per CANDLE_PIXELS pixels.
+    """
+    if kind == "candles":
+        data = ohlc_buckets(candles, max(1, width // CANDLE_PIXELS))
+        df = pd.DataFrame({name: data[name] for name in ('open', 'high', 'low', 'close')})
+        dates = data['date']
+    else:
+        dates = np.asarray(candles.date)
+        kept = lttb(dates.astype('int64'), candles.close, width)
+        df = pd.DataFrame({'close': np.asarray(candles.close)[kept]})
+        dates = dates[kept]
+
+    df.insert(0, 'date', pd.to_datetime(dates, utc=True).tz_convert(MARKET_TZ).tz_localize(None))
+    return df
+
+# Altair chart for a downsampled series
+def render_chart(df, kind="line", title=None, width=600, height=250):
+    base = alt.Chart(df, title=title or alt.Undefined).encode(x=alt.X('date:T', title=None))
+
+    if kind == "candles":
+        color = alt.condition('datum.open <= datum.close', alt.value('#26a69a'), alt.value('#ef5350'))
+        wicks = base.mark_rule().encode(alt.Y('low:Q', title=None, scale=alt.Scale(zero=False)), alt.Y2('high:Q'), color=color)
+        bodies = base.mark_bar(size=max(1, CANDLE_PIXELS - 1)).encode(alt.Y('open:Q'), alt.Y2('close:Q'), color=color)
+        chart = wicks + bodies
+    else:
+        chart = base.mark_line().encode(alt.Y('close:Q', title=None, scale=alt.Scale(zero=False)))
+
+    return chart.properties(width=width, height=height)
@@ -0,0 +1,228 @@
+"""Execution algorithms: split parent orders into child orders and send them.
+
+A plan turns each basket row (the parent) into child orders limited by a
+maximum slice size and/or the exchange freeze quantity, optionally spread
+evenly over a time window (TWAP). SlicedExecution then sends the children
+from a priority queue: the earliest due child goes first, and among
+children due at the same time, lower slice numbers go first, so the first
+slice of every symbol is sent before any symbol's second slice. All
+children share one RateLimiter, so the account's order rate limit holds
+across symbols.
+"""
+import heapq
+import logging
+import threading
+import time
+
+from lazy_imports import lazy_import
+from trading_core import ORDER_RATE_LIMIT, RateLimiter, normalize_orders, submit_order
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerodha_trading_tool.execution')
+
+# Child statuses after which the child won't change without reconciliation
+CHILD_FAILED_STATUSES = {'Failed', 'REJECTED', 'CANCELLED', 'Cancelled'}
+
+# Split one quantity into near-equal slices
+def slice_quantity(quantity, max_slice=None, freeze_qty=None, min_slices=1):
+    """Sizes of the child orders for quantity shares.
+
+    Each slice is at most max_slice and strictly below freeze_qty (orders at
+    or above the freeze quantity are rejected by the exchange). At least
+    min_slices slices are made when there are enough shares.
+    """
+    quantity = int(quantity)
+    if quantity <= 0:
+        return []
+
+    cap = quantity
+    if max_slice:
+        cap = min(cap, int(max_slice))
+    if freeze_qty:
+        cap = min(cap, int(freeze_qty) - 1)
+    if cap <= 0:
+        raise ValueError("Slice limits leave no room for any shares")
+
+    slices = max(-(-quantity // cap), min(int(min_slices), quantity))
+    base, extra = divmod(quantity, slices)
+    return [base + 1] * extra + [base] * (slices - extra)
+
+# Child orders for every row of a basket
+def plan_child_orders(stocks_df, max_slice=None, freeze_qty=None, twap_duration=0, twap_slices=1):
+    """Returns a children DataFrame with one row per child order.
+
+    Columns: Parent (row position in stocks_df), Symbol, Quantity, Slice,
+    Slices, Price and Offset (seconds after the start at which the child
+    is due). With a TWAP duration, a parent's slices are spaced evenly
+    across the window.
+    """
+    prices = stocks_df['Price'] if 'Price' in stocks_df.columns else pd.Series(np.nan, index=stocks_df.index)
+
+    rows = []
+    for parent, (symbol, quantity, price) in enumerate(zip(stocks_df['Symbol'].astype(str), stocks_df['Quantity'], prices)):
+        sizes = slice_quantity(quantity, max_slice, freeze_qty, twap_slices if twap_duration else 1)
+        spacing = twap_duration / len(sizes) if twap_duration and sizes else 0
+        for number, size in enumerate(sizes, start=1):
+            rows.append({
+                'Parent': parent,
+                'Symbol': symbol,
+                'Quantity': size,
+                'Slice': number,
+                'Slices': len(sizes),
+                'Price': price,
+                'Offset': round((number - 1) * spacing, 3)
+            })
+
+    children_df = pd.DataFrame(rows, columns=['Parent', 'Symbol', 'Quantity', 'Slice', 'Slices', 'Price', 'Offset'])
+    return children_df.astype({'Parent': 'int32', 'Quantity': 'int32', 'Slice': 'int32', 'Slices': 'int32', 'Price': 'float32', 'Offset': 'float32'})
+
+# Send planned child orders in priority order on a background thread
+class SlicedExecution:
+    """Runs one execution plan.
+
+    start() sends the children from a daemon thread; run() does the same in
+    the calling thread (used by the batch runner). results() returns the
+    children with their Order ID and Status so far, and can be called
+    while the execution is running.
+    """
+
+    def __init__(self, kite, children_df, dry_run=True, rate_limiter=None, order_type="MARKET"):
+        self.kite = kite
+        self.children_df = children_df.reset_index(drop=True)
+        self.dry_run = dry_run
+        self.order_type = order_type
+        self.rate_limiter = rate_limiter or RateLimiter(ORDER_RATE_LIMIT)
+        self.started_at = None
+        self.finished = False
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._order_ids = [None] * len(self.children_df)
+        self._statuses = ['Pending'] * len(self.children_df)
+        self._sent = 0
+        self._thread = None
+
+    @property
+    def total(self):
+        return len(self.children_df)
+
+    @property
+    def sent(self):
+        return self._sent
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='sliced-execution', daemon=True)
+        self._thread.start()
+        return self
+
+    def cancel(self):
+        self._cancelled.set()
+
+    def run(self):
+        self.started_at = time.time()
+
+        # (due time, slice number, parent, child position): earliest first, then first slices first
+        queue = [
+            (self.started_at + offset, number, parent, position)
+            for position, (offset, number, parent) in enumerate(zip(self.children_df['Offset'], self.children_df['Slice'], self.children_df['Parent']))
+        ]
+        heapq.heapify(queue)
+
+        while queue:
+            due, _, _, position = heapq.heappop(queue)
+
+            # Waiting on the event lets cancel() interrupt a TWAP pause
+            if self._cancelled.wait(max(0.0, due - time.time())):
+                break
+
+            self.rate_limiter.wait()
+            self._send(position)
+
+        with self._lock:
+            if self._cancelled.is_set():
+                self._statuses = ['Cancelled' if status == 'Pending' else status for status in self._statuses]
+            self.finished = True
+
+        logger.info(f"Sliced execution finished: {self._sent} of {self.total} child orders sent")
+        return self.results()
+
+    def _send(self, position):
+        symbol = self.children_df.at[position, 'Symbol']
+        quantity = int(self.children_df.at[position, 'Quantity'])
+
+        try:
+            if self.dry_run:
+                logger.info(f"[DRY RUN] Would place child {self.order_type} order for {quantity} shares of {symbol}")
+                order_id = f"dry-run-{position + 1}"
+                status = 'Dry Run'
+            else:
+                order_id = submit_order(self.kite, symbol, quantity, self.order_type)
+                status = 'Success'
+        except Exception as e:
+            logger.error(f"Error placing child order for {symbol}: {str(e)}")
+            order_id = 'Failed'
+            status = f'Error: {str(e)}'
+
+        with self._lock:
+            self._order_ids[position] = order_id
+            self._statuses[position] = status
+            self._sent += 1
+
+    def results(self):
+        with self._lock:
+            children_df = self.children_df.copy()
+            children_df['Order ID'] = pd.Series(self._order_ids, dtype=object)
+            children_df['Status'] = pd.Series(self._statuses, dtype=object)
+        children_df['Order Type'] = self.order_type
+        return normalize_orders(children_df)
+
+# Roll child orders (and their reconciled fills) up to one row per parent
+def aggregate_child_fills(children_df):
+    """Returns an orders DataFrame with one row per parent.
+
+    Sent Qty counts shares in children that were accepted, Filled Qty and
+    Avg Price (fill-weighted) come from reconciled children, and Status
+    summarises the children: Working while any are pending, then COMPLETE,
+    PARTIAL, Failed, Dry Run or Sent.
+    """
+    children = children_df.copy()
+    statuses = children['Status'].astype(str)
+    failed = statuses.isin(CHILD_FAILED_STATUSES) | statuses.str.startswith('Error')
+
+    children['Sent Qty'] = np.where(failed | (statuses == 'Pending'), 0, children['Quantity'])
+    if 'Filled Qty' not in children.columns:
+        children['Filled Qty'] = 0
+    if 'Avg Price' not in children.columns:
+        children['Avg Price'] = np.nan
+    children['Filled Value'] = children['Filled Qty'] * children['Avg Price'].fillna(0).astype('float64')
+    children['Pending'] = statuses == 'Pending'
+    children['Failed'] = failed
+    children['Dry Run'] = statuses == 'Dry Run'
+    children['Final'] = failed | statuses.isin(['COMPLETE'])
+
+    grouped = children.groupby('Parent', sort=True)
+    parents = pd.DataFrame({
+        'Symbol': grouped['Symbol'].first().astype(str),
+        'Quantity': grouped['Quantity'].sum(),
+        'Slices': grouped['Slice'].count(),
+        'Sent Qty': grouped['Sent Qty'].sum(),
+        'Filled Qty': grouped['Filled Qty'].sum(),
+        'Price': grouped['Price'].first(),
+    })
+    filled_value = grouped['Filled Value'].sum()
+    parents['Avg Price'] = np.where(parents['Filled Qty'] > 0, filled_value / parents['Filled Qty'].where(parents['Filled Qty'] > 0, 1), np.nan)
+    parents['Estimated Cost'] = parents['Price'].astype('float64') * parents['Quantity']
+
+    pending = grouped['Pending'].any()
+    all_failed = grouped['Failed'].all()
+    all_dry_run = grouped['Dry Run'].all()
+    all_final = grouped['Final'].all()
+    parents['Status'] = np.select(
+        [pending, parents['Filled Qty'] >= parents['Quantity'], all_dry_run, all_failed, all_final & (parents['Filled Qty'] > 0)],
+        ['Working', 'COMPLETE', 'Dry Run', 'Failed', 'PARTIAL'],
+        default='Sent'
+    )
+    parents['Order Type'] = children['Order Type'].iloc[0] if len(children) else 'MARKET'
+
+    return normalize_orders(parents.reset_index(drop=True))
@@ -0,0 +1,149 @@
+"""Order book depth estimates of what a MARKET basket would cost.
+
+A dry run only says which orders would be sent. estimate_impact walks each
+leg's quantity through the five price levels of market depth that
+kite.quote returns: buys take the offers (depth['sell']) from the best
+price up, sells hit the bids (depth['buy']). The book of the whole basket
+is held as (legs x levels) arrays, so the walk is a few array operations
+whatever the number of legs:
+
+    before  = cumulative quantity of the levels ahead of each level
+    taken   = clip(wanted - before, 0, level quantity)
+
+The average fill is the taken-weighted price, slippage is measured in
+basis points against the mid price (the last price when one side of the
+book is empty), and quantity beyond the visible depth is reported as
+unfillable. Real fills can still go deeper into the book, so that
+quantity is a warning, not a rejection.
+"""
+import logging
+
+from lazy_imports import lazy_import
+from trading_core import QUOTE_BATCH_SIZE
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger('zerodha_trading_tool.impact')
+
+# Price levels per side in Kite's market depth
+DEPTH_LEVELS = 5
+
+IMPACT_COLUMNS = ['Symbol', 'Side', 'Quantity', 'Reference Price', 'Avg Fill', 'Slippage (bps)',
+                  'Filled Qty', 'Unfillable Qty', 'Levels Used', 'Est. Cost']
+
+# Quotes with market depth for many symbols, in batches
+def fetch_depth_quotes(kite, symbols):
+    """Raw kite.quote entries by symbol; symbols Kite doesn't know are left out."""
+    symbols = list(dict.fromkeys(str(symbol) for symbol in symbols))
+    quotes = {}
+    for start in range(0, len(symbols), QUOTE_BATCH_SIZE):
+        keys = [f"NSE:{symbol}" for symbol in symbols[start:start + QUOTE_BATCH_SIZE]]
+        response = kite.quote(keys)
+        quotes.update((key[4:], response[key]) for key in keys if key in response)
+    return quotes
+
+# One side of the book as (legs x levels) price and quantity arrays
+def depth_arrays(quotes, symbols, side):
+    """side is 'buy' (bids) or 'sell' (offers). Missing levels have a NaN
+    price and zero quantity."""
+    prices = np.full((len(symbols), DEPTH_LEVELS), np.nan)
+    quantities = np.zeros((len(symbols), DEPTH_LEVELS))
+    for row, symbol in enumerate(symbols):
+        levels = ((quotes.get(symbol) or {}).get('depth') or {}).get(side) or []
+        for level, entry in enumerate(levels[:DEPTH_LEVELS]):
+            price, quantity = entry.get('price') or 0, entry.get('quantity') or 0
+            # Kite pads empty levels with zero prices
+            if price > 0 and quantity > 0:
+                prices[row, level] = price
+                quantities[row, level] = quantity
+    return prices, quantities
+
+# Walk wanted quantities through the book, every leg at once
+def walk_depth(prices, quantities, wanted):
+    """Returns (filled, average price, unfilled, levels used) per leg."""
+    wanted = np.asarray(wanted, dtype='float64')
+    before = np.cumsum(quantities, axis=1) - quantities
+    taken = np.clip(wanted[:, None] - before, 0, quantities)
+
+    filled = taken.sum(axis=1)
+    notional = np.where(taken > 0, taken * np.nan_to_num(prices), 0).sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        average = np.where(filled > 0, notional / filled, np.nan)
+    return filled, average, wanted - filled, (taken > 0).sum(axis=1)
+
+# Expected fills of a MARKET basket from market depth
+def estimate_impact(stocks_df, quotes):
+    """Returns one row per leg with IMPACT_COLUMNS.
+
+    Rows are buys unless stocks_df has a Side column. Slippage is positive
+    when the fill is worse than the reference price (above it for buys,
+    below it for sells).
+    """
+    symbols = stocks_df['Symbol'].astype(str).str.strip().str.upper().tolist()
+    wanted = pd.to_numeric(stocks_df['Quantity'], errors='coerce').fillna(0).to_numpy(dtype='float64')
+    sides = stocks_df['Side'].astype(str).str.upper().to_numpy() if 'Side' in stocks_df.columns else np.full(len(symbols), "BUY")
+    selling = sides == "SELL"
+
+    bid_prices, bid_quantities = depth_arrays(quotes, symbols, 'buy')
+    ask_prices, ask_quantities = depth_arrays(quotes, symbols, 'sell')
+
+    # Buys walk the offers and sells the bids
+    prices = np.where(selling[:, None], bid_prices, ask_prices)
+    quantities = np.where(selling[:, None], bid_quantities, ask_quantities)
+    filled, average, unfilled, levels = walk_depth(prices, quantities, wanted)
+
+    last_price = np.array([(quotes.get(symbol) or {}).get('last_price') or np.nan for symbol in symbols], dtype='float64')
+    mid = (bid_prices[:, 0] + ask_prices[:, 0]) / 2
+    reference = np.where(np.isnan(mid), last_price, mid)
+
+    sign = np.where(selling, -1.0, 1.0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        slippage = sign * (average - reference) / reference * 1e4
+
+    return pd.DataFrame({
+        'Symbol': symbols,
+        'Side': sides,
+        'Quantity': wanted.astype('int64'),
+        'Reference Price': reference,
+        'Avg Fill': average,
+        'Slippage (bps)': slippage,
+        'Filled Qty': filled.astype('int64'),
+        'Unfillable Qty': unfilled.astype('int64'),
+        'Levels Used': levels.astype('int64'),
+        'Est. Cost': np.where(filled > 0, filled * average, 0.0)
+    }, columns=IMPACT_COLUMNS)
+
+# Basket-level summary of estimate_impact
+def impact_totals(legs_df):
+    """Dict with the estimated notional, the slippage cost against the
+    reference prices (in rupees and as notional-weighted bps) and the legs
+    and quantity the visible depth can't fill."""
+    filled = legs_df['Filled Qty'].to_numpy(dtype='float64')
+    average = legs_df['Avg Fill'].to_numpy(dtype='float64')
+    reference = legs_df['Reference Price'].to_numpy(dtype='float64')
+    sign = np.where(legs_df['Side'].to_numpy() == "SELL", -1.0, 1.0)
+
+    priced = (filled > 0) & ~np.isnan(reference)
+    notional = float((filled * average)[priced].sum())
+    slippage_cost = float((sign * (average - reference) * filled)[priced].sum())
+    reference_notional = float((filled * reference)[priced].sum())
+
+    return {
+        'legs': len(legs_df),
+        'notional': notional,
+        'slippage_cost': slippage_cost,
+        'slippage_bps': slippage_cost / reference_notional * 1e4 if reference_notional else float('nan'),
+        'short_legs': int((legs_df['Unfillable Qty'] > 0).sum()),
+        'unfillable_qty': int(legs_df['Unfillable Qty'].sum()),
+        'no_depth': int((legs_df['Levels Used'] == 0).sum())
+    }
+
+# Quote the basket once and estimate its market impact
+def simulate_market_basket(kite, stocks_df):
+    """Returns (legs_df, totals); nothing is sent to the exchange."""
+    quotes = fetch_depth_quotes(kite, stocks_df['Symbol'].astype(str).str.strip().str.upper())
+    legs_df = estimate_impact(stocks_df, quotes)
+    totals = impact_totals(legs_df)
+    logger.info(f"Depth estimate for {totals['legs']} legs: {totals['slippage_bps']:.1f} bps, {totals['unfillable_qty']} shares beyond visible depth")
+    return legs_df, totals
@@ -0,0 +1,208 @@
+"""Instrument lists shared by every worker process through memory-mapped files.
+
+kite.instruments() returns the whole exchange dump as a list of dicts,
+and every server process used to hold its own parsed copy. The store
+writes each exchange's list once a day as fixed-width columns (one raw
+.bin file per column plus a meta.json with the row count and string
+widths), sorted by tradingsymbol. Every process memory-maps the same
+files, so the pages are shared through the OS page cache, and a symbol
+lookup is a binary search over the sorted symbol column.
+
+Refreshes are coordinated across processes with a lock file: the first
+worker to find the list out of date downloads it while the others wait
+and then map its result. New lists go to a new version directory and
+meta.json is swapped in atomically, so readers of the previous version
+keep working.
+"""
+import datetime
+import fcntl
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+from lazy_imports import lazy_import
+from candle_store import MARKET_TZ
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger('zerodha_trading_tool.instruments')
+
+INSTRUMENT_STORE_DIR = os.environ.get("INSTRUMENT_STORE_DIR", "instrument_store")
+
+# Kite publishes the day's instrument dump by this time (exchange time)
+INSTRUMENT_REFRESH_TIME = datetime.time(8, 30)
+
+# Column name and on-disk kind, in file order; string widths are set per dump
+INSTRUMENT_COLUMNS = (
+    ('instrument_token', 'int64'),
+    ('exchange_token', 'int64'),
+    ('tradingsymbol', 'S'),
+    ('name', 'S'),
+    ('tick_size', 'float64'),
+    ('lot_size', 'int64'),
+    ('instrument_type', 'S'),
+    ('segment', 'S'),
+    ('exchange', 'S'),
+)
+
+# Start of the instrument list currently published by Kite, as epoch seconds
+def last_refresh(now=None):
+    now = now or datetime.datetime.now(MARKET_TZ)
+    published = datetime.datetime.combine(now.date(), INSTRUMENT_REFRESH_TIME, tzinfo=MARKET_TZ)
+    if now < published:
+        published -= datetime.timedelta(days=1)
+    return published.timestamp()
+
+# Read-only instrument list over memory-mapped columns
+class Instruments:
+    """Sequence of instrument dicts, as kite.instruments() returns, built
+    on access from the mapped columns. Hot paths use lookup() and
+    to_frame() instead of iterating."""
+
+    def __init__(self, columns, version=None):
+        self.columns = columns
+        self.version = version
+
+    def __len__(self):
+        return len(self.columns['tradingsymbol'])
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def _row(self, position):
+        row = {}
+        for name, kind in INSTRUMENT_COLUMNS:
+            value = self.columns[name][position]
+            row[name] = value.decode('utf-8') if kind == 'S' else value.item()
+        return row
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self._row(row) for row in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError(position)
+        return self._row(position)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._row(position)
+
+    def positions(self, symbols):
+        """Row of each symbol (-1 where missing), by binary search."""
+        sorted_symbols = self.columns['tradingsymbol']
+        encoded = [str(symbol).strip().upper().encode('utf-8') for symbol in symbols]
+        keys = np.array(encoded, dtype=sorted_symbols.dtype)
+        rows = np.searchsorted(sorted_symbols, keys)
+        # Keys wider than the column would be truncated into false matches
+        found = (rows < len(sorted_symbols)) & (np.array([len(key) for key in encoded]) <= sorted_symbols.dtype.itemsize)
+        found[found] = sorted_symbols[rows[found]] == keys[found]
+        return np.where(found, rows, -1)
+
+    def lookup(self, symbol):
+        """The instrument dict of a tradingsymbol, or None."""
+        row = int(self.positions([symbol])[0])
+        return self._row(row) if row >= 0 else None
+
+    def to_frame(self, columns=None):
+        """A DataFrame copy of the given columns, strings decoded."""
+        data = {}
+        for name, kind in INSTRUMENT_COLUMNS:
+            if columns is None or name in columns:
+                values = self.columns[name]
+                data[name] = pd.Series(values).str.decode('utf-8') if kind == 'S' else np.asarray(values)
+        return pd.DataFrame(data)
+
+# Process-wide handle on the shared instrument files
+class InstrumentStore:
+    def __init__(self, root=INSTRUMENT_STORE_DIR):
+        self.root = root
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _path(self, exchange, *names):
+        return os.path.join(self.root, exchange, *names)
+
+    def _load_meta(self, exchange):
+        try:
+            with open(self._path(exchange, 'meta.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _write(self, exchange, instruments):
+        """Write a new version of exchange's list and make it current."""
+        frame = pd.DataFrame(instruments, columns=[name for name, _ in INSTRUMENT_COLUMNS])
+        frame['tradingsymbol'] = frame['tradingsymbol'].astype(str).str.upper()
+        # Sorted by symbol for searchsorted; equities first among repeated symbols
+        frame = frame.assign(_equity=frame['instrument_type'] != 'EQ').sort_values(['tradingsymbol', '_equity'], kind='stable')
+
+        version = f"{int(time.time() * 1000)}-{os.getpid()}"
+        os.makedirs(self._path(exchange, version), exist_ok=True)
+        widths = {}
+        for name, kind in INSTRUMENT_COLUMNS:
+            if kind == 'S':
+                values = frame[name].fillna('').astype(str).str.encode('utf-8')
+                widths[name] = max(1, int(values.str.len().max())) if len(values) else 1
+                column = np.array(values.tolist(), dtype=f'S{widths[name]}')
+            else:
+                column = pd.to_numeric(frame[name], errors='coerce').fillna(0).to_numpy(dtype=kind)
+            with open(self._path(exchange, version, f'{name}.bin'), 'wb') as f:
+                f.write(np.ascontiguousarray(column).tobytes())
+
+        meta = {'version': version, 'rows': len(frame), 'widths': widths, 'fetched_at': time.time()}
+        path = self._path(exchange, 'meta.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(path + '.tmp', path)
+
+        # Old versions stay mapped by any reader still using them
+        for entry in os.listdir(self._path(exchange)):
+            if entry != version and os.path.isdir(self._path(exchange, entry)):
+                shutil.rmtree(self._path(exchange, entry), ignore_errors=True)
+
+        logger.info(f"Stored {len(frame)} {exchange} instruments (version {version})")
+        return meta
+
+    def _map(self, exchange, meta):
+        columns = {}
+        for name, kind in INSTRUMENT_COLUMNS:
+            dtype = f"S{meta['widths'][name]}" if kind == 'S' else kind
+            if meta['rows'] == 0:
+                columns[name] = np.empty(0, dtype=dtype)
+            else:
+                columns[name] = np.memmap(self._path(exchange, meta['version'], f'{name}.bin'), dtype=dtype, mode='r', shape=(meta['rows'],))
+        return Instruments(columns, meta['version'])
+
+    def instruments(self, kite, exchange="NSE"):
+        """exchange's instrument list, downloaded with kite only when the
+        stored copy predates Kite's latest daily dump."""
+        meta = self._load_meta(exchange)
+        if meta is None or meta['fetched_at'] < last_refresh():
+            os.makedirs(self._path(exchange), exist_ok=True)
+            with open(self._path(exchange, '.lock'), 'w') as lock_file:
+                # One process downloads; the rest wait here and reuse its files
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    meta = self._load_meta(exchange)
+                    if meta is None or meta['fetched_at'] < last_refresh():
+                        meta = self._write(exchange, kite.instruments(exchange))
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+        # The same table object until the version changes, so indexes built on it are reused
+        with self._lock:
+            table = self._tables.get(exchange)
+            if table is None or table.version != meta['version']:
+                try:
+                    table = self._map(exchange, meta)
+                except FileNotFoundError:
+                    # Another process replaced the version between reading meta and mapping it
+                    table = self._map(exchange, self._load_meta(exchange))
+                self._tables[exchange] = table
+            return table
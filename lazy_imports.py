@@ -0,0 +1,48 @@
+import importlib
+import sys
+import threading
+import types
+
+# Module proxy that defers the real import until an attribute is first used
+class LazyModule(types.ModuleType):
+    """Stands in for a heavy module (pandas, numpy, kiteconnect) at import time.
+
+    The login page never touches the data or broker libraries, so importing
+    them up front only slows down worker start and the first render. The
+    proxy imports the real module on first attribute access and then
+    forwards everything to it.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__['_lazy_module'] = None
+        self.__dict__['_lazy_lock'] = threading.Lock()
+
+    def _load(self):
+        module = self.__dict__['_lazy_module']
+        if module is None:
+            with self.__dict__['_lazy_lock']:
+                module = self.__dict__['_lazy_module']
+                if module is None:
+                    module = importlib.import_module(self.__name__)
+                    self.__dict__['_lazy_module'] = module
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = 'loaded' if self.is_loaded() else 'not loaded'
+        return f"<lazy module '{self.__name__}' ({state})>"
+
+    def is_loaded(self):
+        return self.__dict__['_lazy_module'] is not None or self.__name__ in sys.modules
+
+# Return the module if it's already imported, otherwise a LazyModule for it
+def lazy_import(name):
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name)
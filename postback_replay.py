@@ -0,0 +1,80 @@
+"""Replay recorded Kite order postbacks against a local receiver.
+
+Reads JSON lines as written by the receiver's record file
+({"username": ..., "payload": {...}}) or bare payload objects, and POSTs
+each one to http://HOST:PORT/postback/<username>.
+
+    python postback_replay.py recorded.jsonl --port 8502 --username admin --api-secret SECRET
+
+With --api-secret the checksum is recomputed, so synthetic or edited
+payloads pass verification.
+"""
+import argparse
+import json
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from postback_server import postback_checksum
+
+def replay(path, base_url, username=None, api_secret=None, delay=0.0):
+    sent = failed = 0
+
+    with open(path) as f:
+        for line_no, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+
+            record = json.loads(line)
+            payload = record.get('payload', record)
+            target_user = username or record.get('username')
+            if not target_user:
+                print(f"line {line_no}: no username, skipped", file=sys.stderr)
+                failed += 1
+                continue
+
+            if api_secret:
+                payload['checksum'] = postback_checksum(payload, api_secret)
+
+            request = urllib.request.Request(
+                f"{base_url}/postback/{target_user}",
+                data=json.dumps(payload).encode(),
+                headers={'Content-Type': 'application/json'},
+                method='POST'
+            )
+
+            try:
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status = e.code
+
+            print(f"line {line_no}: order {payload.get('order_id')} {payload.get('status')} -> HTTP {status}")
+            if status == 200:
+                sent += 1
+            else:
+                failed += 1
+
+            if delay:
+                time.sleep(delay)
+
+    return sent, failed
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded Kite order postbacks")
+    parser.add_argument('payloads', help="JSON lines file with recorded postbacks")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    parser.add_argument('--username', help="Override the username each payload is posted for")
+    parser.add_argument('--api-secret', help="Re-sign payloads with this API secret")
+    parser.add_argument('--delay', type=float, default=0.0, help="Seconds to wait between payloads")
+    args = parser.parse_args(argv)
+
+    sent, failed = replay(args.payloads, f"http://{args.host}:{args.port}", args.username, args.api_secret, args.delay)
+    print(f"Replayed {sent} postbacks, {failed} failed")
+    return 0 if failed == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import threading
+import weakref
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger('zerodha_trading_tool.postback')
+
+# Fields of a Kite order postback that are forwarded to subscribers
+POSTBACK_FIELDS = [
+    'order_id', 'tradingsymbol', 'status', 'status_message', 'filled_quantity',
+    'pending_quantity', 'average_price', 'order_timestamp', 'transaction_type', 'quantity'
+]
+
+# Kite signs each postback with sha256(order_id + order_timestamp + api_secret)
+def postback_checksum(payload, api_secret):
+    message = f"{payload.get('order_id', '')}{payload.get('order_timestamp', '')}{api_secret}"
+    return hashlib.sha256(message.encode()).hexdigest()
+
+def verify_postback(payload, api_secret):
+    if not api_secret or not payload.get('checksum'):
+        return False
+    return hmac.compare_digest(postback_checksum(payload, api_secret), str(payload['checksum']))
+
+# In-process publish/subscribe channel for order updates
+class OrderEventBus:
+    """Delivers order events to every subscriber in this process.
+
+    Subscribers are either callbacks or queues. Queues are held weakly so a
+    closed session's queue disappears without an explicit unsubscribe, and
+    both kinds can be restricted to the events of one username.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def subscribe(self, callback, username=None):
+        with self._lock:
+            subscription_id = next(self._ids)
+            self._subscribers[subscription_id] = (callback, username)
+        return subscription_id
+
+    def subscribe_queue(self, events_queue, username=None):
+        queue_ref = weakref.ref(events_queue)
+
+        def deliver(event):
+            target = queue_ref()
+            if target is None:
+                return False
+            target.put(event)
+            return True
+
+        self.subscribe(deliver, username)
+        return events_queue
+
+    def unsubscribe(self, subscription_id):
+        with self._lock:
+            self._subscribers.pop(subscription_id, None)
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self._subscribers.items())
+
+        for subscription_id, (callback, username) in subscribers:
+            if username is not None and event.get('username') != username:
+                continue
+            try:
+                # A callback returning False asks to be removed
+                if callback(event) is False:
+                    self.unsubscribe(subscription_id)
+            except Exception as e:
+                logger.error(f"Error delivering order event: {str(e)}")
+
+class PostbackHandler(BaseHTTPRequestHandler):
+    """Accepts POST /postback/<username> with a Kite order postback body"""
+
+    def do_POST(self):
+        parts = self.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'postback' or not parts[1]:
+            return self._reply(404, "Unknown endpoint")
+        username = parts[1]
+
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            payload = json.loads(self.rfile.read(length))
+            if not isinstance(payload, dict) or 'order_id' not in payload:
+                raise ValueError("payload is not an order postback")
+        except Exception as e:
+            return self._reply(400, f"Invalid payload: {str(e)}")
+
+        api_secret = self.server.secret_lookup(username)
+        if not api_secret:
+            return self._reply(404, "Unknown user")
+        if not verify_postback(payload, api_secret):
+            logger.warning(f"Rejected postback for {username} with bad checksum (order {payload.get('order_id')})")
+            return self._reply(403, "Checksum mismatch")
+
+        if self.server.record_file:
+            with self.server.record_lock, open(self.server.record_file, 'a') as f:
+                f.write(json.dumps({'username': username, 'payload': payload}) + "\n")
+
+        event = {field: payload.get(field) for field in POSTBACK_FIELDS}
+        event['username'] = username
+        self.server.bus.publish(event)
+
+        return self._reply(200, "OK")
+
+    def _reply(self, code, message):
+        body = message.encode()
+        self.send_response(code)
+        self.send_header('Content-Type', 'text/plain')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+# Start the receiver on a daemon thread and return the server
+def start_postback_server(host, port, secret_lookup, bus, record_file=None):
+    """Serve Kite postbacks on host:port.
+
+    secret_lookup(username) returns the api_secret used to verify the
+    checksum, and verified updates are published on bus. With record_file
+    set, accepted payloads are appended as JSON lines for postback_replay.py.
+    """
+    server = ThreadingHTTPServer((host, port), PostbackHandler)
+    server.daemon_threads = True
+    server.secret_lookup = secret_lookup
+    server.bus = bus
+    server.record_file = record_file
+    server.record_lock = threading.Lock()
+
+    thread = threading.Thread(target=server.serve_forever, name='postback-server', daemon=True)
+    thread.start()
+
+    logger.info(f"Listening for order postbacks on http://{host}:{server.server_port}/postback/<username>")
+    return server
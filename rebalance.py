@@ -0,0 +1,100 @@
+"""Rebalance an account to a target basket.
+
+current_holdings reads the account's holdings and positions once.
+rebalance_diff joins them with the target basket on the symbol and works
+out every leg's buy or sell quantity in one pass. Legs already at their
+target are dropped, and sells are ordered before buys, so place_orders
+sends the sells first and the cash they release funds the purchases.
+"""
+import logging
+
+from lazy_imports import lazy_import
+from basket import to_numeric
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerodha_trading_tool.rebalance')
+
+# Delivery shares held per symbol, from holdings and today's CNC positions
+def current_holdings(kite):
+    """Returns a DataFrame indexed by Symbol with Held Qty and Last Price.
+
+    Holdings count settled and T1 shares. Today's delivery trades only show
+    up in the net CNC positions (negative for shares sold today), so those
+    are added on top.
+    """
+    holdings = pd.DataFrame(kite.holdings(), columns=['tradingsymbol', 'quantity', 't1_quantity', 'last_price'])
+    positions = pd.DataFrame(kite.positions().get('net', []), columns=['tradingsymbol', 'quantity', 'product', 'last_price'])
+    positions = positions[positions['product'] == 'CNC']
+
+    held = pd.concat([
+        pd.DataFrame({
+            'Symbol': holdings['tradingsymbol'],
+            'Held Qty': to_numeric(holdings['quantity']).fillna(0) + to_numeric(holdings['t1_quantity']).fillna(0),
+            'Last Price': to_numeric(holdings['last_price'])
+        }),
+        pd.DataFrame({
+            'Symbol': positions['tradingsymbol'],
+            'Held Qty': to_numeric(positions['quantity']).fillna(0),
+            'Last Price': to_numeric(positions['last_price'])
+        })
+    ], ignore_index=True)
+    held['Symbol'] = held['Symbol'].astype(str).str.upper()
+
+    return held.groupby('Symbol').agg({'Held Qty': 'sum', 'Last Price': 'max'}).astype({'Held Qty': 'int64'})
+
+# Orders that move the account from held_df to the target basket
+def rebalance_diff(target_df, held_df, exit_unlisted=False):
+    """Returns (diff_df, summary).
+
+    diff_df has one row per leg that changes: Symbol, Held Qty, Target Qty,
+    Delta, Side, Quantity (shares to trade) and Price, sells first. Held
+    symbols missing from the target are left alone unless exit_unlisted,
+    in which case they are sold in full. summary counts the legs and the
+    approximate value of the sells and buys.
+    """
+    target = pd.DataFrame({
+        'Symbol': target_df['Symbol'].astype(str).str.strip().str.upper().to_numpy(),
+        'Target Qty': to_numeric(target_df['Quantity']).fillna(0).to_numpy(),
+        'Price': to_numeric(target_df['Price']).to_numpy() if 'Price' in target_df.columns else np.nan
+    }).groupby('Symbol', sort=False).agg({'Target Qty': 'sum', 'Price': 'first'})
+
+    joined = target.join(held_df, how='outer' if exit_unlisted else 'left', sort=False)
+
+    held = joined['Held Qty'].fillna(0).to_numpy(dtype='int64')
+    wanted = joined['Target Qty'].fillna(0).to_numpy(dtype='int64')
+    delta = wanted - held
+    price = joined['Price'].where(joined['Price'] > 0, joined['Last Price']).to_numpy(dtype='float64')
+
+    diff_df = pd.DataFrame({
+        'Symbol': joined.index.astype(str),
+        'Held Qty': held,
+        'Target Qty': wanted,
+        'Delta': delta,
+        'Side': np.where(delta < 0, "SELL", "BUY"),
+        'Quantity': np.abs(delta),
+        'Price': price
+    })
+
+    changed = diff_df[diff_df['Delta'] != 0]
+    # Stable sort keeps basket order within the sells and within the buys
+    diff_df = changed.sort_values('Side', ascending=False, kind='stable').reset_index(drop=True)
+
+    value = diff_df['Quantity'] * diff_df['Price']
+    sells = diff_df['Side'] == "SELL"
+    summary = {
+        'legs': len(joined),
+        'unchanged': len(joined) - len(diff_df),
+        'sells': int(sells.sum()),
+        'buys': int((~sells).sum()),
+        'sell_value': float(value[sells].sum()),
+        'buy_value': float(value[~sells].sum())
+    }
+
+    logger.info(f"Rebalance: {summary['sells']} sells, {summary['buys']} buys, {summary['unchanged']} legs unchanged")
+    return diff_df, summary
+
+# Fetch the account's holdings once and diff them against the target basket
+def plan_rebalance(kite, target_df, exit_unlisted=False):
+    return rebalance_diff(target_df, current_holdings(kite), exit_unlisted)
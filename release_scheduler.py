@@ -0,0 +1,156 @@
+import itertools
+import logging
+import threading
+import time
+
+from trading_core import RateLimiter, release_order_requests
+
+logger = logging.getLogger('zerodha_trading_tool.scheduler')
+
+# A validated basket waiting for its release time
+class StagedRelease:
+    """Pre-built order requests for one user, released at release_at (epoch seconds).
+
+    status moves from 'staged' through 'warming' and 'releasing' to 'done',
+    or to 'cancelled'/'failed'. Once done, orders_df holds the results and
+    latency the release-to-acknowledgement timings.
+    """
+
+    def __init__(self, job_id, username, kite, requests, release_at, order_type="MARKET", dry_run=True):
+        self.job_id = job_id
+        self.username = username
+        self.kite = kite
+        self.requests = requests
+        self.release_at = release_at
+        self.order_type = order_type
+        self.dry_run = dry_run
+        self.status = 'staged'
+        self.error = None
+        self.warmed = False
+        self.released_at = None
+        self.orders_df = None
+        self.latency = None
+        self.staged_at = time.time()
+
+# Process-wide timer that releases staged baskets at their scheduled time
+class ReleaseScheduler:
+    """Runs one daemon thread that sleeps until the next staged release.
+
+    warmup_lead seconds before a release, the job's Kite client makes a
+    cheap authenticated call so the HTTPS connection is already open when
+    the orders go out. At release time the pre-built requests are fired
+    through a RateLimiter per job and on_release(job) is called with the
+    results (used by the app to write the order journal). on_status(job) is
+    called after every status change (used to share job status between
+    app replicas).
+    """
+
+    def __init__(self, rate, warmup_lead=5.0, on_release=None, on_status=None):
+        self.rate = rate
+        self.warmup_lead = warmup_lead
+        self.on_release = on_release
+        self.on_status = on_status
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._wakeup = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name='release-scheduler', daemon=True)
+        self._thread.start()
+
+    def stage(self, username, kite, requests, release_at, order_type="MARKET", dry_run=True):
+        with self._wakeup:
+            job = StagedRelease(next(self._ids), username, kite, requests, release_at, order_type, dry_run)
+            self._jobs[job.job_id] = job
+            self._wakeup.notify()
+
+        logger.info(f"Staged release {job.job_id} for {username}: {len(requests)} orders at {time.strftime('%H:%M:%S', time.localtime(release_at))}")
+        self._status_changed(job)
+        return job
+
+    def cancel(self, job_id):
+        with self._wakeup:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ('staged', 'warming'):
+                return False
+            job.status = 'cancelled'
+            self._wakeup.notify()
+        self._status_changed(job)
+        return True
+
+    def discard(self, job_id):
+        with self._wakeup:
+            job = self._jobs.get(job_id)
+            if job is not None and job.status in ('done', 'cancelled', 'failed'):
+                del self._jobs[job_id]
+
+    def jobs(self, username=None):
+        with self._wakeup:
+            jobs = [job for job in self._jobs.values() if username is None or job.username == username]
+        return sorted(jobs, key=lambda job: job.release_at)
+
+    def _status_changed(self, job):
+        if self.on_status is not None:
+            try:
+                self.on_status(job)
+            except Exception as e:
+                logger.error(f"Error in status callback for {job.job_id}: {str(e)}")
+
+    def _next_action(self):
+        """(at, action, job) for the earliest pending warm-up or release"""
+        best = None
+        for job in self._jobs.values():
+            if job.status == 'staged' and not job.warmed:
+                candidate = (job.release_at - self.warmup_lead, 'warm', job)
+            elif job.status in ('staged', 'warming'):
+                candidate = (job.release_at, 'release', job)
+            else:
+                continue
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+        return best
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                action = self._next_action()
+                while action is None or action[0] > time.time():
+                    self._wakeup.wait(None if action is None else action[0] - time.time())
+                    action = self._next_action()
+
+                _, kind, job = action
+                job.status = 'warming' if kind == 'warm' else 'releasing'
+
+            # Each job gets its own thread so baskets due at the same moment go out together
+            target = self._warm if kind == 'warm' else self._release
+            threading.Thread(target=target, args=(job,), name=f'release-{job.job_id}-{kind}', daemon=True).start()
+
+    def _warm(self, job):
+        try:
+            job.kite.profile()
+        except Exception as e:
+            logger.warning(f"Warm-up call for release {job.job_id} failed: {str(e)}")
+        with self._wakeup:
+            job.warmed = True
+            if job.status == 'warming':
+                job.status = 'staged'
+        self._status_changed(job)
+
+    def _release(self, job):
+        job.released_at = time.time()
+        try:
+            job.orders_df, job.latency = release_order_requests(job.kite, job.requests, job.dry_run, RateLimiter(self.rate))
+            job.status = 'done'
+        except Exception as e:
+            logger.error(f"Release {job.job_id} failed: {str(e)}")
+            job.error = str(e)
+            job.status = 'failed'
+            self._status_changed(job)
+            return
+        self._status_changed(job)
+
+        logger.info(f"Release {job.job_id} started {job.released_at - job.release_at:.3f}s after schedule")
+
+        if self.on_release is not None:
+            try:
+                self.on_release(job)
+            except Exception as e:
+                logger.error(f"Error in release callback for {job.job_id}: {str(e)}")
@@ -0,0 +1,240 @@
+"""Indicator screens over the NSE equity universe.
+
+Daily candles of every screened symbol are read from the candle store and
+stacked into (symbols x days) matrices, right-aligned on each symbol's
+latest candle, so every rule is evaluated for a whole block of symbols in
+one NumPy pass. Blocks run on a thread pool (NumPy releases the GIL inside
+its array loops), so a full-universe screen uses all cores.
+
+Rules are plain dicts:
+
+    {'rule': 'ma_cross', 'kind': 'EMA', 'fast': 20, 'slow': 50, 'within': 5}
+    {'rule': 'rsi', 'period': 14, 'below': 30}        (or 'above': 70)
+    {'rule': 'breakout', 'days': 20}
+    {'rule': 'volume_surge', 'days': 20, 'multiple': 2.0}
+
+Each rule also yields a strength (how far past its threshold a symbol is);
+a symbol's Score is its average percentile of those strengths across the
+screened universe, 0-100.
+"""
+import datetime
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from basket import normalize_basket
+from symbols import instrument_frame
+from trading_core import Reporter
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger('zerodha_trading_tool.screener')
+
+# Calendar days of daily candles loaded per symbol (enough for 200-day averages)
+SCREEN_LOOKBACK_DAYS = 400
+
+# Symbols evaluated together by one worker
+SCREEN_CHUNK_SIZE = 256
+
+# Symbols whose last candle is older than this are not trading and are skipped
+STALE_AFTER_DAYS = 7
+
+RULE_DEFAULTS = {
+    'ma_cross': {'kind': 'SMA', 'fast': 20, 'slow': 50, 'within': 5},
+    'rsi': {'period': 14},
+    'breakout': {'days': 20},
+    'volume_surge': {'days': 20, 'multiple': 2.0},
+}
+
+# Cash equities in the NSE instrument list
+def equity_universe(instruments):
+    frame = instrument_frame(instruments, ['tradingsymbol', 'instrument_token', 'instrument_type', 'segment'])
+    frame = frame[(frame['instrument_type'] == 'EQ') & (frame['segment'].fillna('NSE') == 'NSE')]
+    return frame[['tradingsymbol', 'instrument_token']].to_dict('records')
+
+def _validate(rules):
+    checked = []
+    for rule in rules:
+        if rule.get('rule') not in RULE_DEFAULTS:
+            raise ValueError(f"Unknown screening rule: {rule.get('rule')}")
+        rule = {**RULE_DEFAULTS[rule['rule']], **rule}
+        if rule['rule'] == 'rsi' and ('below' in rule) == ('above' in rule):
+            raise ValueError("RSI rules need exactly one of 'below' or 'above'")
+        if rule['rule'] == 'ma_cross' and rule['fast'] >= rule['slow']:
+            raise ValueError("The fast average must be shorter than the slow one")
+        checked.append(rule)
+    if not checked:
+        raise ValueError("No screening rules given")
+    return checked
+
+# Stack candle columns into right-aligned matrices, NaN where a symbol has no history
+def stack_candles(series, days):
+    close = np.full((len(series), days), np.nan)
+    high = np.full((len(series), days), np.nan)
+    volume = np.full((len(series), days), np.nan)
+    for row, candles in enumerate(series):
+        n = min(len(candles), days)
+        if n:
+            close[row, days - n:] = candles.close[-n:]
+            high[row, days - n:] = candles.high[-n:]
+            volume[row, days - n:] = candles.volume[-n:]
+    return close, high, volume
+
+def moving_average(values, period, kind="SMA", tail=1):
+    """The last tail values of a moving average along axis 1."""
+    if kind == "EMA":
+        return ewm(values, 2 / (period + 1), min_periods=period)[:, -tail:]
+    window = values[:, -(period + tail - 1):]
+    if window.shape[1] < period:
+        return np.full((len(values), tail), np.nan)
+    return np.lib.stride_tricks.sliding_window_view(window, period, axis=1).mean(axis=-1)
+
+def ewm(values, alpha, min_periods=1):
+    """Exponentially weighted average along axis 1, seeded at each row's
+    first value; NaN until a row has min_periods values."""
+    out = np.empty_like(values)
+    current = np.full(len(values), np.nan)
+    seen = np.zeros(len(values), dtype='int64')
+    for column in range(values.shape[1]):
+        x = values[:, column]
+        valid = ~np.isnan(x)
+        current = np.where(np.isnan(current), x, np.where(valid, alpha * x + (1 - alpha) * current, current))
+        seen += valid
+        out[:, column] = np.where(seen >= min_periods, current, np.nan)
+    return out
+
+def rsi(close, period=14):
+    """Wilder's RSI of the latest candle for every row."""
+    change = np.diff(close, axis=1)
+    gains = np.where(change > 0, change, np.where(np.isnan(change), np.nan, 0.0))
+    losses = np.where(change < 0, -change, np.where(np.isnan(change), np.nan, 0.0))
+    avg_gain = ewm(gains, 1 / period, min_periods=period)[:, -1]
+    avg_loss = ewm(losses, 1 / period, min_periods=period)[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(avg_loss == 0, np.where(np.isnan(avg_gain), np.nan, 100.0), 100 - 100 / (1 + avg_gain / avg_loss))
+
+# (passed, strength) of every rule for one block of symbols
+def evaluate_rules(close, high, volume, rules):
+    passed = np.zeros((len(rules), len(close)), dtype=bool)
+    strength = np.full((len(rules), len(close)), np.nan)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for position, rule in enumerate(rules):
+            kind = rule['rule']
+            if kind == 'ma_cross':
+                tail = rule['within'] + 1
+                fast = moving_average(close, rule['fast'], rule['kind'], tail)
+                slow = moving_average(close, rule['slow'], rule['kind'], tail)
+                above = fast > slow
+                # Above now, and at or below within the last `within` candles
+                passed[position] = above[:, -1] & (~above[:, :-1]).any(axis=1) & ~np.isnan(slow[:, 0])
+                strength[position] = (fast[:, -1] / slow[:, -1] - 1) * 100
+            elif kind == 'rsi':
+                value = rsi(close, rule['period'])
+                if 'below' in rule:
+                    passed[position] = value < rule['below']
+                    strength[position] = rule['below'] - value
+                else:
+                    passed[position] = value > rule['above']
+                    strength[position] = value - rule['above']
+            elif kind == 'breakout':
+                prior_high = np.max(high[:, -(rule['days'] + 1):-1], axis=1)
+                passed[position] = close[:, -1] > prior_high
+                strength[position] = (close[:, -1] / prior_high - 1) * 100
+            elif kind == 'volume_surge':
+                prior_volume = np.mean(volume[:, -(rule['days'] + 1):-1], axis=1)
+                ratio = volume[:, -1] / prior_volume
+                passed[position] = ratio >= rule['multiple']
+                strength[position] = ratio
+
+    return passed, strength
+
+# Percentile (0-100) of each finite value within its row
+def percentile_ranks(values):
+    ranks = np.full(values.shape, np.nan)
+    for row, series in enumerate(values):
+        finite = np.isfinite(series)
+        count = finite.sum()
+        if count:
+            order = series[finite].argsort().argsort()
+            ranks[row, finite] = 100 * (order + 1) / count
+    return ranks
+
+# Run rules over the whole universe and return a basket of the matches
+def screen_universe(store, kite, instruments, rules, match="all", refresh=False, max_workers=None, reporter=None):
+    """Returns (stocks_df, stats).
+
+    stocks_df has Symbol, Price (last close), Score, Quantity and Selected
+    columns, best score first, ready to use as a basket. Only candles
+    already in the store are used unless refresh, in which case each
+    symbol's series is brought up to date first (rate limited, so slow the
+    first time for the whole universe). stats counts the universe, the
+    symbols with data and the matches, and times the evaluation.
+    """
+    rules = _validate(rules)
+    reporter = reporter or Reporter()
+    universe = equity_universe(instruments)
+    since = datetime.datetime.now() - datetime.timedelta(days=SCREEN_LOOKBACK_DAYS)
+
+    symbols, series = [], []
+    for done, inst in enumerate(universe, start=1):
+        if refresh:
+            reporter.progress(done, len(universe), f"Updating candles for {inst['tradingsymbol']}")
+            try:
+                candles = store.candles(kite, inst['instrument_token'], 'day', since)
+            except Exception as e:
+                logger.warning(f"Could not update candles for {inst['tradingsymbol']}: {str(e)}")
+                candles = store.read(inst['instrument_token'], 'day', since)
+        else:
+            candles = store.read(inst['instrument_token'], 'day', since)
+        if candles is not None and len(candles):
+            symbols.append(inst['tradingsymbol'])
+            series.append(candles)
+
+    stats = {'universe': len(universe), 'with_data': 0, 'matched': 0, 'seconds': 0.0}
+    columns = ['Symbol', 'Price', 'Score', 'Quantity', 'Selected']
+    if not series:
+        return normalize_basket(pd.DataFrame(columns=columns)), stats
+
+    started = time.perf_counter()
+
+    # Leave out symbols that have stopped trading
+    last_dates = np.array([candles.date[-1] for candles in series], dtype='datetime64[s]')
+    fresh = last_dates >= last_dates.max() - np.timedelta64(STALE_AFTER_DAYS, 'D')
+    symbols = [symbol for symbol, keep in zip(symbols, fresh) if keep]
+    series = [candles for candles, keep in zip(series, fresh) if keep]
+
+    days = max(len(candles) for candles in series)
+    chunks = [range(start, min(start + SCREEN_CHUNK_SIZE, len(series))) for start in range(0, len(series), SCREEN_CHUNK_SIZE)]
+
+    def run_chunk(rows):
+        close, high, volume = stack_candles([series[row] for row in rows], days)
+        passed, strength = evaluate_rules(close, high, volume, rules)
+        return passed, strength, close[:, -1]
+
+    with ThreadPoolExecutor(max_workers=max_workers or os.cpu_count()) as pool:
+        results = list(pool.map(run_chunk, chunks))
+
+    passed = np.concatenate([result[0] for result in results], axis=1)
+    strength = np.concatenate([result[1] for result in results], axis=1)
+    price = np.concatenate([result[2] for result in results])
+
+    matched = passed.all(axis=0) if match == "all" else passed.any(axis=0)
+    # Every matched symbol passed at least one rule, so its mean is defined
+    ranks = np.where(passed, percentile_ranks(strength), np.nan)[:, matched]
+    score = np.nanmean(ranks, axis=0) if matched.any() else np.empty(0)
+
+    stocks_df = pd.DataFrame({
+        'Symbol': np.array(symbols, dtype=object)[matched],
+        'Price': price[matched],
+        'Score': np.round(score, 1),
+        'Quantity': 1,
+        'Selected': True
+    }).sort_values('Score', ascending=False, kind='stable')
+
+    stats.update(with_data=len(symbols), matched=int(matched.sum()), seconds=time.perf_counter() - started)
+    logger.info(f"Screen matched {stats['matched']} of {stats['with_data']} symbols in {stats['seconds']:.2f}s")
+    return normalize_basket(stocks_df), stats
@@ -0,0 +1,112 @@
+"""Measure cold and warm startup of the Streamlit app.
+
+Cold numbers come from a fresh interpreter per run (a new server worker):
+the time to import streamlit_app and the time of its first render, which
+is the login page. Warm numbers re-render the login page in an interpreter
+that has already run the script once, as happens on every rerun.
+
+    python startup_benchmark.py --runs 5
+    python startup_benchmark.py --runs 10 --json startup.json
+
+Also reports which heavy libraries were imported by the time the login
+page had rendered; the app loads them lazily, so none should be.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+
+HEAVY_MODULES = ['pandas', 'numpy', 'kiteconnect']
+
+# Runs in a fresh interpreter and prints one JSON line of timings
+PROBE = r"""
+import json, logging, os, sys, time
+logging.disable(logging.WARNING)
+app_file, warm_runs = sys.argv[1], int(sys.argv[2])
+sys.path.insert(0, os.path.dirname(app_file))
+
+start = time.perf_counter()
+import streamlit
+streamlit_import = time.perf_counter() - start
+
+start = time.perf_counter()
+import streamlit_app
+app_import = time.perf_counter() - start
+
+from streamlit.testing.v1 import AppTest
+
+start = time.perf_counter()
+AppTest.from_file(app_file, default_timeout=60).run()
+first_render = time.perf_counter() - start
+
+warm = []
+for _ in range(warm_runs):
+    start = time.perf_counter()
+    AppTest.from_file(app_file, default_timeout=60).run()
+    warm.append(time.perf_counter() - start)
+
+print(json.dumps({
+    'streamlit_import': streamlit_import,
+    'app_import': app_import,
+    'first_render': first_render,
+    'warm_render': warm,
+    'loaded': [name for name in %r if name in sys.modules],
+}))
+""" % (HEAVY_MODULES,)
+
+def run_probe(warm_runs):
+    result = subprocess.run(
+        [sys.executable, '-c', PROBE, APP_FILE, str(warm_runs)],
+        capture_output=True, text=True, cwd=os.path.dirname(APP_FILE)
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Benchmark probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def summarize(values):
+    return {
+        'median_ms': round(statistics.median(values) * 1000, 1),
+        'min_ms': round(min(values) * 1000, 1),
+        'max_ms': round(max(values) * 1000, 1),
+    }
+
+def benchmark(runs=5, warm_runs=5):
+    samples = [run_probe(warm_runs) for _ in range(runs)]
+
+    report = {
+        'runs': runs,
+        'cold_streamlit_import': summarize([s['streamlit_import'] for s in samples]),
+        'cold_app_import': summarize([s['app_import'] for s in samples]),
+        'cold_first_render': summarize([s['first_render'] for s in samples]),
+        'warm_render': summarize([t for s in samples for t in s['warm_render']]),
+        'heavy_modules_loaded': sorted({name for s in samples for name in s['loaded']}),
+    }
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app import and login-page render time")
+    parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to start (cold samples)")
+    parser.add_argument('--warm-runs', type=int, default=5, help="Warm re-renders per interpreter")
+    parser.add_argument('--json', help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    report = benchmark(args.runs, args.warm_runs)
+
+    for key in ('cold_streamlit_import', 'cold_app_import', 'cold_first_render', 'warm_render'):
+        stats = report[key]
+        print(f"{key:24} median {stats['median_ms']:8.1f} ms  (min {stats['min_ms']:.1f}, max {stats['max_ms']:.1f})")
+    loaded = report['heavy_modules_loaded']
+    print(f"{'heavy modules loaded':24} {', '.join(loaded) if loaded else 'none'}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+"""State shared by every app replica: access tokens, baskets and job status.
+
+Streamlit session state lives in one server process, so a user routed to
+another replica used to lose their Kite login and basket. A StateBackend
+keeps what a new session needs to pick up where the last one left off, in
+storage every replica can reach:
+
+    SQLiteBackend   a local SQLite file (WAL mode), for replicas on one host
+    RedisBackend    any Redis-compatible server, for replicas on many hosts
+
+Both are key-value stores with per-key expiry. Access tokens are kept
+encrypted until Kite's daily token reset (see token_cache.py), baskets
+are stored as Arrow IPC streams (compact, typed, and readable without
+unpickling), and scheduled release status is stored as JSON so every
+replica can show a user's jobs.
+
+STATE_BACKEND_URL picks the backend: sqlite:///path/to/file.db (the
+default, app_state.db) or redis://host:port/db (needs the redis package).
+"""
+import abc
+import datetime
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import urllib.parse
+import zoneinfo
+
+from lazy_imports import lazy_import
+from basket import normalize_basket
+
+pa = lazy_import('pyarrow')
+redis = lazy_import('redis')
+
+logger = logging.getLogger('zerodha_trading_tool.state')
+
+STATE_BACKEND_URL = os.environ.get("STATE_BACKEND_URL", "sqlite:///app_state.db")
+
+# Kite invalidates every access token at this time each morning (exchange time)
+KITE_TOKEN_RESET_TIME = datetime.time(6, 0)
+KITE_TIMEZONE = zoneinfo.ZoneInfo("Asia/Kolkata")
+
+# Saved baskets are kept this long after their last change
+BASKET_TTL_SECONDS = 7 * 86400
+
+# Status of scheduled releases is kept this long after its last change
+JOB_TTL_SECONDS = 2 * 86400
+
+# Epoch seconds of the next daily access token reset
+def token_expiry(now=None):
+    now = now or datetime.datetime.now(KITE_TIMEZONE)
+    reset = datetime.datetime.combine(now.date(), KITE_TOKEN_RESET_TIME, tzinfo=KITE_TIMEZONE)
+    if reset <= now:
+        reset += datetime.timedelta(days=1)
+    return reset.timestamp()
+
+# Text as one segment of a colon-separated key: ':' and '%' are escaped, so a
+# prefix scan for "token:alice:" can't match the keys of user "alice:x"
+def key_segment(text):
+    return urllib.parse.quote(str(text), safe='')
+
+# Basket frames as Arrow IPC streams
+def basket_to_ipc(df):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def basket_from_ipc(data):
+    return normalize_basket(pa.ipc.open_stream(data).read_all().to_pandas())
+
+# Key-value store with expiry, plus the typed records kept in it
+class StateBackend(abc.ABC):
+    """Subclasses implement get, set, delete and keys; keys are strings
+    and values bytes. ttl is in seconds, None for no expiry."""
+
+    @abc.abstractmethod
+    def get(self, key):
+        """The value of key, or None if it is missing or expired."""
+
+    @abc.abstractmethod
+    def set(self, key, value, ttl=None):
+        """Store value under key, replacing any previous value."""
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Remove key; missing keys are ignored."""
+
+    @abc.abstractmethod
+    def keys(self, prefix):
+        """Live keys starting with prefix, sorted."""
+
+    def save_basket(self, username, df):
+        if df is None:
+            self.delete(f"basket:{key_segment(username)}")
+        else:
+            self.set(f"basket:{key_segment(username)}", basket_to_ipc(df), ttl=BASKET_TTL_SECONDS)
+
+    def load_basket(self, username):
+        data = self.get(f"basket:{key_segment(username)}")
+        return basket_from_ipc(data) if data is not None else None
+
+    def save_job(self, username, job_id, status):
+        self.set(f"job:{key_segment(username)}:{job_id}", json.dumps(status).encode(), ttl=JOB_TTL_SECONDS)
+
+    def delete_job(self, username, job_id):
+        self.delete(f"job:{key_segment(username)}:{job_id}")
+
+    def jobs(self, username):
+        """Status dicts of a user's scheduled releases on every replica."""
+        jobs = []
+        for key in self.keys(f"job:{key_segment(username)}:"):
+            data = self.get(key)
+            if data is not None:
+                jobs.append(json.loads(data))
+        return jobs
+
+# The calling thread's connection to a SQLite file, opened in WAL mode on first use
+def thread_connection(local, path):
+    """local is a threading.local owned by the caller; sqlite3 connections
+    can't be shared across threads, so each thread opens its own."""
+    db = getattr(local, 'db', None)
+    if db is None:
+        db = sqlite3.connect(path, timeout=10)
+        db.execute("PRAGMA journal_mode=WAL")
+        local.db = db
+    return db
+
+# Shared state in a SQLite file; several processes on one host can use it
+class SQLiteBackend(StateBackend):
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.execute("CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL)")
+            db.execute("DELETE FROM state WHERE expires_at <= ?", (time.time(),))
+
+    def _connection(self):
+        return thread_connection(self._local, self.path)
+
+    def get(self, key):
+        row = self._connection().execute("SELECT value, expires_at FROM state WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and row[1] <= time.time():
+            self.delete(key)
+            return None
+        return bytes(row[0])
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO state (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+                (key, sqlite3.Binary(value), expires_at)
+            )
+
+    def delete(self, key):
+        with self._connection() as db:
+            db.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def keys(self, prefix):
+        # A range on the primary key instead of LIKE, so the index is used
+        rows = self._connection().execute(
+            "SELECT key FROM state WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?) ORDER BY key",
+            (prefix, prefix + '\uffff', time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+# Shared state in a Redis-compatible server, for replicas on several hosts
+class RedisBackend(StateBackend):
+    """Keys are stored under namespace, so one server can hold several
+    deployments. client can be any object with Redis's get, set (with ex),
+    delete and scan_iter methods."""
+
+    def __init__(self, url=None, client=None, namespace="zerodha_trading_tool:"):
+        self.namespace = namespace
+        self.client = client if client is not None else redis.Redis.from_url(url)
+
+    def get(self, key):
+        return self.client.get(self.namespace + key)
+
+    def set(self, key, value, ttl=None):
+        # Redis expiries are whole seconds and must be positive
+        self.client.set(self.namespace + key, value, ex=max(1, int(ttl)) if ttl is not None else None)
+
+    def delete(self, key):
+        self.client.delete(self.namespace + key)
+
+    def keys(self, prefix):
+        pattern = re.sub(r'([*?\[\]\\])', r'\\\1', self.namespace + prefix) + '*'
+        keys = (key.decode() if isinstance(key, bytes) else key for key in self.client.scan_iter(match=pattern))
+        return sorted(key[len(self.namespace):] for key in keys)
+
+# Backend for a STATE_BACKEND_URL
+def open_state_backend(url=STATE_BACKEND_URL):
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    if url.startswith('sqlite:///'):
+        return SQLiteBackend(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported state backend URL: {url}")
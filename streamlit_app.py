@@ -1,16 +1,49 @@
 import streamlit as st
-import pandas as pd
 import time
 import logging
 import datetime
-import json
 import io
 import hashlib
 import os
+import pickle
+import sys
 import base64
 import hmac
-from kiteconnect import KiteConnect
-import numpy as np
+import queue
+import socket
+import tempfile
+import threading
+import zoneinfo
+from concurrent.futures import ThreadPoolExecutor
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from lazy_imports import lazy_import
+from basket import BasketBuffer
+from postback_server import OrderEventBus, start_postback_server
+from release_scheduler import ReleaseScheduler
+from execution import SlicedExecution, aggregate_child_fills, plan_child_orders
+from rebalance import plan_rebalance
+from candle_store import TAIL_REFRESH_SECONDS, CandleStore, instrument_token
+from instrument_store import InstrumentStore
+from charts import CHART_RANGES, downsample, render_chart
+from screener import screen_universe
+from state_backend import open_state_backend
+from token_cache import PLAINTEXT_TOKEN_FIELDS, TokenCache, load_cipher
+from user_store import USER_PAGE_SIZE, UserStore
+from table_view import TABLE_PAGE_SIZE, table_totals, table_window
+from impact import simulate_market_basket
+import trading_core
+from trading_core import (
+    ORDER_RATE_LIMIT, RateLimiter, Reporter, append_order_journal, basket_key, calculate_optimal_quantities,
+    check_basket_margins, fill_missing_prices, get_account_balance, normalize_orders, price_limit_orders,
+    stage_order_requests, submit_order, trim_to_margin
+)
+
+# Data and broker libraries are only needed after login, so they are loaded
+# on first use rather than on every cold start
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+kiteconnect = lazy_import('kiteconnect')
 
 # Setup environment variables to store secrets in production
 # For local development, we'll use session state and a simple file-based user system
@@ -27,9 +60,42 @@ st.set_page_config(
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger('zerodha_trading_tool')
 
-# User database simple file-based system (in production, use a real database)
+# Users database of earlier versions, imported into the SQLite user store once
 USER_DB_FILE = "users.json"
 
+# Days of sign-ups charted on the admin dashboard
+USER_SIGNUP_DAYS = 30
+
+# Upper bound on accounts dispatched to in parallel by the multi-account fan-out
+FAN_OUT_MAX_WORKERS = 8
+
+# Order status polling starts at the minimum interval and backs off to the
+# maximum while nothing changes; polling stops once every order has settled
+ORDER_POLL_MIN_INTERVAL = 1.0
+ORDER_POLL_MAX_INTERVAL = 30.0
+
+# Optional local receiver for Kite order postbacks (disabled when the port is 0).
+# Point each Kite app's postback URL at http(s)://<host>/postback/<username>.
+POSTBACK_HOST = os.environ.get("POSTBACK_HOST", "127.0.0.1")
+POSTBACK_PORT = int(os.environ.get("POSTBACK_PORT", 0))
+# Accepted postbacks are appended here for postback_replay.py, if set
+POSTBACK_RECORD_FILE = os.environ.get("POSTBACK_RECORD_FILE")
+# How often the results table picks up pushed updates
+POSTBACK_REFRESH_INTERVAL = 0.5
+
+# Staged baskets are released at a scheduled time (by default the next market
+# open); each account's connection is warmed up this many seconds before
+MARKET_TIMEZONE = "Asia/Kolkata"
+MARKET_OPEN_TIME = datetime.time(9, 15)
+RELEASE_WARMUP_LEAD = 5.0
+
+# Sessions idle for longer than this have their heavy artifacts evicted
+SESSION_IDLE_EVICT_SECONDS = int(os.environ.get("SESSION_IDLE_EVICT_SECONDS", 30 * 60))
+# Minimum time between two sweeps of the session registry
+SESSION_SWEEP_INTERVAL = 60
+# Evicted basket/result frames are spilled here until their session returns
+SESSION_SPILL_DIR = os.environ.get("SESSION_SPILL_DIR", os.path.join(tempfile.gettempdir(), "zerodha_trading_tool_sessions"))
+
 # Initialize session variables
 def init_session_state():
     """Initialize session state variables"""
@@ -39,10 +105,12 @@ def init_session_state():
         st.session_state.username = None
     if 'admin' not in st.session_state:
         st.session_state.admin = False
-    if 'stocks_df' not in st.session_state:
-        st.session_state.stocks_df = None
-    if 'selected_stocks' not in st.session_state:
-        st.session_state.selected_stocks = None
+    if 'basket' not in st.session_state:
+        st.session_state.basket = None
+    if 'selected_mask' not in st.session_state:
+        st.session_state.selected_mask = None
+    if 'basket_editor_state' not in st.session_state:
+        st.session_state.basket_editor_state = {'generation': 0, 'key': None, 'version': None, 'applied': {}}
     if 'kite' not in st.session_state:
         st.session_state.kite = None
     if 'api_authenticated' not in st.session_state:
@@ -53,13 +121,544 @@ def init_session_state():
         st.session_state.orders_result = None
     if 'available_instruments' not in st.session_state:
         st.session_state.available_instruments = None
+    if 'bse_instruments' not in st.session_state:
+        st.session_state.bse_instruments = None
+    if 'evicted_artifacts' not in st.session_state:
+        st.session_state.evicted_artifacts = {}
+    if 'order_reconciler' not in st.session_state:
+        st.session_state.order_reconciler = None
+    if 'order_events' not in st.session_state:
+        st.session_state.order_events = None
+    if 'fan_out_result' not in st.session_state:
+        st.session_state.fan_out_result = None
+    if 'margin_check_requested' not in st.session_state:
+        st.session_state.margin_check_requested = False
+    if 'sliced_execution' not in st.session_state:
+        st.session_state.sliced_execution = None
+    if 'limit_prices' not in st.session_state:
+        st.session_state.limit_prices = None
+    if 'impact_estimate' not in st.session_state:
+        st.session_state.impact_estimate = None
+    if 'rebalance_plan' not in st.session_state:
+        st.session_state.rebalance_plan = None
+    if 'screen_result' not in st.session_state:
+        st.session_state.screen_result = None
+    if 'shared_basket_version' not in st.session_state:
+        st.session_state.shared_basket_version = None
+    if 'session_warmup' not in st.session_state:
+        st.session_state.session_warmup = None
 
 init_session_state()
 
-# Create a simple database file if it doesn't exist
-def initialize_user_db():
-    if not os.path.exists(USER_DB_FILE):
-        # Create a default admin account
+# The session's basket container, created on first use
+def get_basket():
+    if st.session_state.basket is None:
+        st.session_state.basket = BasketBuffer()
+    return st.session_state.basket
+
+# The basket as a DataFrame (materialized from the buffer), or None if there is no basket
+def get_stocks_df():
+    basket = st.session_state.basket
+    return None if basket is None else basket.to_frame()
+
+# Replace the whole basket with the rows of df
+def set_stocks_df(df):
+    st.session_state.basket = None if df is None else BasketBuffer.from_frame(df)
+
+# Get the saved selection as rows of stocks_df
+def get_selected_stocks():
+    """Rows of stocks_df picked on the selection page.
+
+    Only a boolean mask is kept in session state; the rows are looked up
+    from stocks_df when needed instead of holding a second copy of the basket.
+    """
+    stocks_df = get_stocks_df()
+    mask = st.session_state.selected_mask
+
+    if stocks_df is None or mask is None:
+        return None
+
+    return stocks_df[mask.reindex(stocks_df.index, fill_value=False)]
+
+# Approximate in-memory size of a session state value in bytes
+def approx_size(obj, sample=50):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(approx_size(k) + approx_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple)):
+        if not obj:
+            return sys.getsizeof(obj)
+        # Large lists (e.g. the instruments dump) are estimated from a sample
+        head = obj[:sample]
+        per_item = sum(approx_size(item) for item in head) / len(head)
+        return sys.getsizeof(obj) + int(per_item * len(obj))
+    return sys.getsizeof(obj)
+
+# Memory used by the heavy objects of the current session
+def session_memory_usage():
+    usage = {}
+
+    if st.session_state.basket is not None:
+        usage['basket'] = st.session_state.basket.nbytes
+    if st.session_state.selected_mask is not None:
+        usage['selected_mask'] = approx_size(st.session_state.selected_mask)
+    if st.session_state.orders_result and st.session_state.orders_result.get('orders_df') is not None:
+        usage['orders_df'] = approx_size(st.session_state.orders_result['orders_df'])
+    if st.session_state.available_instruments is not None:
+        usage['available_instruments'] = approx_size(st.session_state.available_instruments)
+
+    return usage
+
+# Human readable byte count
+def format_bytes(num_bytes):
+    for unit in ['B', 'KB', 'MB']:
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+# One-line summary of table_totals()
+def format_totals(totals):
+    parts = []
+    for label, value in totals.items():
+        if label == 'Value':
+            parts.append(f"Value: ₹{value:,.2f}")
+        else:
+            parts.append(f"{label}: {value:,}")
+    return " · ".join(parts)
+
+# Large table rendered one page at a time
+def paged_table(df, key, page_size=TABLE_PAGE_SIZE):
+    """Filters, sorts and pages df on the server; only the visible page is
+    sent to the browser. Totals cover every row matching the filter."""
+    if df is None or len(df) <= page_size:
+        st.dataframe(df, hide_index=True)
+        if df is not None and len(df):
+            st.caption(format_totals(table_totals(df)))
+        return
+    
+    filter_col, sort_col, order_col, page_col = st.columns([3, 2, 1, 1])
+    with filter_col:
+        query = st.text_input("Filter", key=f"{key}_filter", placeholder="Symbol, name, status...")
+    with sort_col:
+        sort_by = st.selectbox("Sort by", [None] + list(df.columns), format_func=lambda column: "(original order)" if column is None else column, key=f"{key}_sort")
+    with order_col:
+        descending = st.checkbox("Descending", key=f"{key}_desc")
+    with page_col:
+        page = st.number_input("Page", min_value=1, value=1, step=1, key=f"{key}_page")
+    
+    window, positions = table_window(df, query, sort_by, not descending, page, page_size)
+    pages = max(1, -(-len(positions) // page_size))
+    page = min(int(page), pages)
+    
+    st.dataframe(window, hide_index=True)
+    
+    start = (page - 1) * page_size
+    shown = f"Rows {start + 1}-{start + len(window)} of {len(positions)}" if len(window) else "No matching rows"
+    if len(positions) != len(df):
+        shown += f" (filtered from {len(df)})"
+    totals = table_totals(df, positions)
+    del totals['Rows']
+    st.caption(f"{shown}, page {page} of {pages}" + (f" · {format_totals(totals)}" if totals else ""))
+
+# Process-wide registry of sessions for memory accounting and idle eviction
+class SessionRegistry:
+    """Tracks every session served by this process and the memory it holds.
+
+    Each script run touches the registry with the session's approximate
+    memory use, and each run of a self-refreshing fragment marks the
+    session active. Sessions idle for longer than idle_seconds, and with no
+    orders still being tracked or sent (see session_busy), have their
+    re-derivable artifacts evicted: the instruments list is dropped (it is
+    fetched again on the next symbol lookup) and basket/result frames are
+    spilled to disk and restored on the session's next run.
+    """
+
+    def __init__(self, idle_seconds, spill_dir):
+        self.idle_seconds = idle_seconds
+        self.spill_dir = spill_dir
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0
+
+    def touch(self, session_id, state, username, memory_bytes):
+        """state is the session's persistent SessionState. It is held until
+        a sweep finds the session closed (SessionState can't be weakly
+        referenced)."""
+        with self._lock:
+            self._sessions[session_id] = {
+                'state': state,
+                'username': username,
+                'last_seen': time.time(),
+                'bytes': memory_bytes,
+                'evicted': False
+            }
+
+    def keep_alive(self, session_id):
+        """Mark a registered session active. Waits for a sweep that is
+        evicting it to finish."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is not None:
+                entry['last_seen'] = time.time()
+
+    def sweep(self, force=False):
+        """Evict artifacts from idle sessions, returning how many were evicted"""
+        now = time.time()
+        
+        with self._lock:
+            if not force and now - self._last_sweep < SESSION_SWEEP_INTERVAL:
+                return 0
+            self._last_sweep = now
+            sessions = list(self._sessions.items())
+        
+        evicted = 0
+        for session_id, entry in sessions:
+            state = entry['state']
+            
+            if session_closed(session_id):
+                with self._lock:
+                    self._sessions.pop(session_id, None)
+                continue
+            
+            if entry['evicted'] or now - entry['last_seen'] < self.idle_seconds or session_busy(state):
+                continue
+            
+            # Checked again under the lock, which touch and keep_alive wait on,
+            # in case the session ran since the list was taken
+            with self._lock:
+                entry = self._sessions.get(session_id)
+                if entry is None or entry['evicted'] or time.time() - entry['last_seen'] < self.idle_seconds:
+                    continue
+                try:
+                    evict_session_artifacts(state, session_id, self.spill_dir)
+                    entry['evicted'] = True
+                    entry['bytes'] = 0
+                    evicted += 1
+                    logger.info(f"Evicted artifacts of session {session_id} idle for {int(now - entry['last_seen'])}s")
+                except Exception as e:
+                    logger.error(f"Error evicting session {session_id}: {str(e)}")
+        
+        return evicted
+
+    def snapshot(self):
+        now = time.time()
+        
+        with self._lock:
+            return [
+                {
+                    'Session': session_id[:8],
+                    'Username': entry['username'] or '(not logged in)',
+                    'Idle (s)': int(now - entry['last_seen']),
+                    'Memory': entry['bytes'],
+                    'Evicted': entry['evicted']
+                }
+                for session_id, entry in self._sessions.items()
+                if not session_closed(session_id)
+            ]
+
+# Whether the runtime has closed a session (disconnected sessions are kept for a while to reconnect)
+def session_closed(session_id):
+    session_mgr = getattr(Runtime.instance(), '_session_mgr', None) if Runtime.exists() else None
+    if session_mgr is None:
+        # Bare mode and AppTest have no session manager; sessions live as long as the process
+        return False
+    return session_mgr.get_session_info(session_id) is None
+
+# Whether a session has orders a fragment is still updating; evicting
+# orders_result under it would lose the updates
+def session_busy(state):
+    reconciler = state['order_reconciler'] if 'order_reconciler' in state else None
+    execution = state['sliced_execution'] if 'sliced_execution' in state else None
+    return (reconciler is not None and not reconciler.settled) or execution is not None
+
+@st.cache_resource
+def get_session_registry():
+    return SessionRegistry(SESSION_IDLE_EVICT_SECONDS, SESSION_SPILL_DIR)
+
+# Drop or spill the heavy artifacts of an idle session
+def evict_session_artifacts(state, session_id, spill_dir):
+    os.makedirs(spill_dir, exist_ok=True)
+    evicted = dict(state['evicted_artifacts']) if 'evicted_artifacts' in state else {}
+    
+    if 'basket' in state and state['basket'] is not None:
+        path = os.path.join(spill_dir, f"{session_id}_basket.pkl")
+        with open(path, 'wb') as f:
+            pickle.dump(state['basket'], f)
+        evicted['basket'] = path
+        state['basket'] = None
+    
+    orders_result = state['orders_result'] if 'orders_result' in state else None
+    if orders_result and orders_result.get('orders_df') is not None:
+        path = os.path.join(spill_dir, f"{session_id}_orders_df.pkl")
+        orders_result['orders_df'].to_pickle(path)
+        evicted['orders_df'] = path
+        state['orders_result'] = {**orders_result, 'orders_df': None}
+    
+    # The instrument lists and their indexes are simply rebuilt by the next symbol lookup
+    for key in ('available_instruments', 'available_instruments_index', 'bse_instruments', 'bse_instruments_index', 'symbol_search'):
+        if key in state:
+            state[key] = None
+    
+    state['evicted_artifacts'] = evicted
+
+# Remove spilled artifacts of the current session from disk
+def discard_evicted_artifacts():
+    for path in st.session_state.get('evicted_artifacts', {}).values():
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+    st.session_state.evicted_artifacts = {}
+
+# Bring back artifacts that were evicted while the session was idle
+def restore_evicted_artifacts():
+    evicted = st.session_state.evicted_artifacts
+    if not evicted:
+        return
+    
+    try:
+        if 'basket' in evicted:
+            with open(evicted['basket'], 'rb') as f:
+                st.session_state.basket = pickle.load(f)
+        if 'orders_df' in evicted and st.session_state.orders_result:
+            st.session_state.orders_result['orders_df'] = pd.read_pickle(evicted['orders_df'])
+        logger.info("Restored evicted session artifacts")
+    except Exception as e:
+        logger.error(f"Error restoring evicted session artifacts: {str(e)}")
+    finally:
+        discard_evicted_artifacts()
+
+# Record the current session in the registry and evict idle ones
+def track_session():
+    ctx = get_script_run_ctx()
+    if ctx is None:
+        restore_evicted_artifacts()
+        return
+    
+    # ctx.session_state is a per-run wrapper that is dropped when the run ends;
+    # the SessionState inside it lives as long as the session itself
+    state = getattr(ctx.session_state, '_state', ctx.session_state)
+    
+    registry = get_session_registry()
+    # Marked active before restoring, so a sweep can't evict halfway through this run
+    registry.keep_alive(ctx.session_id)
+    restore_evicted_artifacts()
+    registry.touch(ctx.session_id, state, st.session_state.username, sum(session_memory_usage().values()))
+    registry.sweep()
+
+# Fragment reruns don't go through main(); without this a session whose
+# only activity is a self-refreshing fragment would look idle
+def mark_session_active():
+    ctx = get_script_run_ctx()
+    if ctx is not None:
+        get_session_registry().keep_alive(ctx.session_id)
+
+# Identifies this server process in shared job status
+REPLICA_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+# Tokens, baskets and job status shared with the other app replicas
+@st.cache_resource
+def get_state_backend():
+    return open_state_backend()
+
+def shared_state():
+    """The state backend, or None (logged) if it can't be reached; the app
+    then works from session state alone, as a single replica would."""
+    try:
+        return get_state_backend()
+    except Exception as e:
+        logger.error(f"State backend unavailable: {str(e)}")
+        return None
+
+# Identity of the session's basket contents, to tell when it needs saving
+def basket_version():
+    basket = st.session_state.basket
+    return None if basket is None else (id(basket), getattr(basket, 'version', 0))
+
+# Encrypted access tokens, shared by every replica
+@st.cache_resource
+def get_token_cache():
+    cache = TokenCache(get_state_backend(), load_cipher())
+    
+    # Tokens used to be kept in plaintext in the user database
+    store = get_user_store()
+    users = store.with_extra_fields(PLAINTEXT_TOKEN_FIELDS)
+    if cache.migrate_plaintext(users):
+        for username, record in users.items():
+            store.put(username, record)
+        logger.info("Removed plaintext access tokens from the user database")
+    return cache
+
+def token_cache():
+    try:
+        return get_token_cache()
+    except Exception as e:
+        logger.error(f"Token cache unavailable: {str(e)}")
+        return None
+
+# Rebuild the session's Kite client from a cached access token
+def restore_kite_session():
+    """Returns True if the session is now authenticated with Kite. No
+    network call is made here; the balance and instrument lists load in
+    the background."""
+    if st.session_state.kite is not None:
+        return True
+    
+    cache = token_cache()
+    if cache is None:
+        return False
+    
+    username = st.session_state.username
+    api_key, _ = get_api_credentials(username)
+    try:
+        token = cache.load(username, api_key) or cache.load(username)
+    except Exception as e:
+        logger.error(f"Error reading the token cache for {username}: {str(e)}")
+        return False
+    if token is None:
+        return False
+    
+    kite = kiteconnect.KiteConnect(api_key=token['api_key'])
+    kite.set_access_token(token['access_token'])
+    st.session_state.kite = kite
+    st.session_state.api_authenticated = True
+    start_session_warmup(kite)
+    logger.info(f"Restored the Kite session of {username} from the token cache")
+    return True
+
+# Thread pool for warming up Kite sessions off the script thread
+@st.cache_resource
+def get_warmup_executor():
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix='session-warmup')
+
+def warm_kite_session(kite):
+    """Fetches the account balance and maps the shared instrument lists
+    into this process (downloading them if they are out of date). Runs on
+    a worker thread, so it returns the balance instead of touching session
+    state."""
+    balance = get_account_balance(kite)
+    if balance is None:
+        # get_account_balance logs and swallows errors; this raises
+        # TokenException if Kite rejected the access token
+        kite.profile()
+    store = get_instrument_store()
+    for exchange in ("NSE", "BSE"):
+        try:
+            store.instruments(kite, exchange)
+        except Exception as e:
+            logger.error(f"Error warming {exchange} instruments: {str(e)}")
+    return balance
+
+def start_session_warmup(kite):
+    st.session_state.session_warmup = get_warmup_executor().submit(warm_kite_session, kite)
+
+# Take the results of a finished warm-up into the session
+def collect_session_warmup():
+    """Returns True while the warm-up is still running."""
+    future = st.session_state.session_warmup
+    if future is None:
+        return False
+    if not future.done():
+        return True
+    
+    st.session_state.session_warmup = None
+    try:
+        balance = future.result()
+    except kiteconnect.exceptions.TokenException as e:
+        # Expired or revoked: drop the cached token so the next login asks for a new one
+        logger.warning(f"Kite rejected the access token of {st.session_state.username}: {str(e)}")
+        kite = st.session_state.kite
+        drop_kite_session(kite.api_key if kite is not None else None)
+        st.warning("Your Zerodha session has expired. Please reconnect to Zerodha.")
+        return False
+    except Exception as e:
+        logger.error(f"Session warm-up failed: {str(e)}")
+        return False
+    if balance:
+        st.session_state.account_balance = balance
+    return False
+
+# Reruns the page once a background warm-up finishes, so the balance shows without a click
+@st.fragment(run_every=1.0)
+def poll_session_warmup():
+    mark_session_active()
+    future = st.session_state.session_warmup
+    if future is None or future.done():
+        # Full rerun collects the results and stops the periodic refresh
+        st.rerun()
+
+# Forget the session's Kite login and the cached access token behind it
+def drop_kite_session(api_key=None):
+    """Deletes the user's cached token for api_key (every cached token if
+    None), so later logins ask for a new request token instead of
+    restoring it."""
+    username = st.session_state.username
+    cache = token_cache()
+    if cache is not None:
+        try:
+            cache.delete(username, api_key)
+        except Exception as e:
+            logger.error(f"Error deleting the cached access token of {username}: {str(e)}")
+    
+    st.session_state.kite = None
+    st.session_state.api_authenticated = False
+    st.session_state.account_balance = None
+    st.session_state.session_warmup = None
+    logger.info(f"Dropped the Kite session of {username}")
+
+# Pick up the Kite login and basket a user left on another replica
+def restore_shared_state():
+    restore_kite_session()
+    
+    backend = shared_state()
+    if backend is None:
+        return
+    
+    username = st.session_state.username
+    try:
+        if st.session_state.basket is None:
+            stocks_df = backend.load_basket(username)
+            if stocks_df is not None:
+                set_stocks_df(stocks_df)
+                logger.info(f"Restored a basket of {len(stocks_df)} stocks for {username} from shared state")
+        st.session_state.shared_basket_version = basket_version()
+    except Exception as e:
+        logger.error(f"Error restoring shared state for {username}: {str(e)}")
+
+# Save the basket for other replicas when it changed during this run
+def publish_shared_basket():
+    # A spilled basket is only out of memory, not gone
+    if 'basket' in st.session_state.evicted_artifacts:
+        return
+    
+    version = basket_version()
+    if version == st.session_state.shared_basket_version:
+        return
+    
+    backend = shared_state()
+    if backend is None:
+        return
+    
+    try:
+        backend.save_basket(st.session_state.username, get_stocks_df())
+        st.session_state.shared_basket_version = version
+    except Exception as e:
+        logger.error(f"Error saving the basket to shared state: {str(e)}")
+
+# User database, shared by every session of this process
+@st.cache_resource
+def get_user_store():
+    store = UserStore(import_file=USER_DB_FILE)
+    initialize_user_db(store)
+    return store
+
+# Create a default admin account if the database is empty
+def initialize_user_db(store):
+    if store.count() == 0:
         default_admin = "admin"
         # In production, use a strong password and better hashing
         default_password = "admin123"
@@ -67,119 +666,91 @@ def initialize_user_db():
         # Hash the password (in production, use a stronger method with salt)
         hashed_password = hashlib.sha256(default_password.encode()).hexdigest()
         
-        users = {
-            default_admin: {
-                "password": hashed_password,
-                "admin": True,
-                "created_at": datetime.datetime.now().isoformat(),
-                "zerodha_api_key": "",
-                "zerodha_api_secret": ""
-            }
-        }
-        
-        with open(USER_DB_FILE, 'w') as f:
-            json.dump(users, f)
+        store.add(default_admin, {
+            "password": hashed_password,
+            "admin": True,
+            "created_at": datetime.datetime.now().isoformat(),
+            "zerodha_api_key": "",
+            "zerodha_api_secret": ""
+        })
         
         logger.info("Initialized user database with default admin account")
 
-# Get all users from the database
-def get_users():
+# Get one user's record, or None
+def get_user(username):
     try:
-        if not os.path.exists(USER_DB_FILE):
-            initialize_user_db()
-            
-        with open(USER_DB_FILE, 'r') as f:
-            return json.load(f)
+        return get_user_store().get(username)
     except Exception as e:
         logger.error(f"Error reading user database: {str(e)}")
         st.error("Error accessing user database. Please contact the administrator.")
-        return {}
-
-# Save users to the database
-def save_users(users):
-    try:
-        with open(USER_DB_FILE, 'w') as f:
-            json.dump(users, f)
-        return True
-    except Exception as e:
-        logger.error(f"Error saving user database: {str(e)}")
-        return False
+        return None
 
 # Verify user credentials
 def verify_user(username, password):
-    users = get_users()
+    user = get_user(username)
     
-    if username in users:
+    if user is not None:
         # Hash the provided password
         hashed_password = hashlib.sha256(password.encode()).hexdigest()
         
         # Check if the hash matches
-        if users[username]["password"] == hashed_password:
-            return True, users[username].get("admin", False), users[username]
+        if user["password"] == hashed_password:
+            return True, user.get("admin", False), user
     
     return False, False, None
 
 # Add a new user
 def add_user(username, password, is_admin=False, zerodha_api_key="", zerodha_api_secret=""):
-    users = get_users()
-    
-    if username in users:
-        return False, "Username already exists"
-    
     # Hash the password
     hashed_password = hashlib.sha256(password.encode()).hexdigest()
     
-    # Add the new user
-    users[username] = {
-        "password": hashed_password,
-        "admin": is_admin,
-        "created_at": datetime.datetime.now().isoformat(),
-        "zerodha_api_key": zerodha_api_key,
-        "zerodha_api_secret": zerodha_api_secret
-    }
-    
-    # Save the updated user database
-    if save_users(users):
-        return True, "User added successfully"
-    else:
+    try:
+        added = get_user_store().add(username, {
+            "password": hashed_password,
+            "admin": is_admin,
+            "created_at": datetime.datetime.now().isoformat(),
+            "zerodha_api_key": zerodha_api_key,
+            "zerodha_api_secret": zerodha_api_secret
+        })
+    except Exception as e:
+        logger.error(f"Error saving user database: {str(e)}")
         return False, "Error saving user database"
+    
+    if not added:
+        return False, "Username already exists"
+    return True, "User added successfully"
 
 # Update user details
 def update_user(username, data):
-    users = get_users()
-    
-    if username not in users:
-        return False, "User not found"
-    
-    # Update the user data
+    fields = {}
     for key, value in data.items():
         if key == "password" and value:
             # Hash the new password
-            users[username][key] = hashlib.sha256(value.encode()).hexdigest()
+            fields[key] = hashlib.sha256(value.encode()).hexdigest()
         elif key != "password" or value:
-            users[username][key] = value
+            fields[key] = value
     
-    # Save the updated user database
-    if save_users(users):
-        return True, "User updated successfully"
-    else:
+    try:
+        updated = get_user_store().update(username, fields)
+    except Exception as e:
+        logger.error(f"Error saving user database: {str(e)}")
         return False, "Error saving user database"
+    
+    if not updated:
+        return False, "User not found"
+    return True, "User updated successfully"
 
 # Delete a user
 def delete_user(username):
-    users = get_users()
+    try:
+        deleted = get_user_store().delete(username)
+    except Exception as e:
+        logger.error(f"Error saving user database: {str(e)}")
+        return False, "Error saving user database"
     
-    if username not in users:
+    if not deleted:
         return False, "User not found"
-    
-    # Delete the user
-    del users[username]
-    
-    # Save the updated user database
-    if save_users(users):
-        return True, "User deleted successfully"
-    else:
-        return False, "Error saving user database"
+    return True, "User deleted successfully"
 
 # Secure API credentials storage
 def save_api_credentials(username, api_key, api_secret):
@@ -190,10 +761,10 @@ def save_api_credentials(username, api_key, api_secret):
 
 # Get stored API credentials
 def get_api_credentials(username):
-    users = get_users()
+    user = get_user(username)
     
-    if username in users:
-        return users[username].get("zerodha_api_key", ""), users[username].get("zerodha_api_secret", "")
+    if user is not None:
+        return user.get("zerodha_api_key", ""), user.get("zerodha_api_secret", "")
     
     return "", ""
 
@@ -221,6 +792,9 @@ def login():
                         st.session_state.authenticated = True
                         st.session_state.username = username
                         st.session_state.admin = is_admin
+                        
+                        # Continue with the Kite login and basket from any replica
+                        restore_shared_state()
                         st.success("Login successful!")
                         
                         # Reload the page to update the UI
@@ -254,28 +828,45 @@ def login():
 def admin_dashboard():
     st.title("Admin Dashboard")
     
-    # Create tabs for user management and system settings
-    tab1, tab2 = st.tabs(["User Management", "System Settings"])
+    # Create tabs for user management, system settings and multi-account orders
+    tab1, tab2, tab3 = st.tabs(["User Management", "System Settings", "Multi-Account Orders"])
     
     with tab1:
         st.subheader("User Management")
         
-        # Get all users
-        users = get_users()
-        
-        # Create a table of users
-        user_data = []
-        for username, data in users.items():
-            user_data.append({
-                "Username": username,
-                "Admin": "Yes" if data.get("admin", False) else "No",
-                "Created": data.get("created_at", "Unknown"),
-                "API Key Set": "Yes" if data.get("zerodha_api_key", "") else "No"
-            })
+        store = get_user_store()
+        
+        # Totals are kept up to date by the store, so they cost no scan
+        counts = store.counts()
+        metric_col1, metric_col2, metric_col3 = st.columns(3)
+        with metric_col1:
+            st.metric("Users", counts['users'])
+        with metric_col2:
+            st.metric("Admins", counts['admins'])
+        with metric_col3:
+            st.metric("API Keys Set", counts['api_keys'])
+        
+        signups = store.signups(since=(datetime.date.today() - datetime.timedelta(days=USER_SIGNUP_DAYS)).isoformat())
+        if signups:
+            st.caption(f"Sign-ups per day (last {USER_SIGNUP_DAYS} days)")
+            st.bar_chart(pd.DataFrame(signups, columns=['Day', 'Sign-ups']).set_index('Day'))
+        
+        # One page of users at a time, optionally narrowed to a username prefix
+        search_col, page_col = st.columns([3, 1])
+        with search_col:
+            prefix = st.text_input("Search by username prefix", key="user_search").strip()
+        matching = store.count(prefix)
+        pages = max(1, -(-matching // USER_PAGE_SIZE))
+        with page_col:
+            page = min(int(st.number_input("Page", min_value=1, value=1, step=1, key="user_page")), pages)
+        
+        page_users = store.page(prefix, offset=(page - 1) * USER_PAGE_SIZE)
         
         # Display user table
-        if user_data:
-            st.dataframe(pd.DataFrame(user_data))
+        if page_users:
+            st.dataframe(pd.DataFrame(page_users), hide_index=True)
+            start = (page - 1) * USER_PAGE_SIZE
+            st.caption(f"Users {start + 1}-{start + len(page_users)} of {matching} (page {page} of {pages})")
         else:
             st.info("No users found")
         
@@ -304,9 +895,10 @@ def admin_dashboard():
         # Delete user form
         st.subheader("Delete User")
         
-        del_username = st.selectbox("Select User to Delete", list(users.keys()))
+        del_username = st.selectbox("Select User to Delete", [user["Username"] for user in page_users],
+                                    help="Users on the page shown above; search to find others")
         
-        if st.button("Delete User"):
+        if st.button("Delete User", disabled=del_username is None):
             if del_username == st.session_state.username:
                 st.error("You cannot delete your own account")
             else:
@@ -321,13 +913,116 @@ def admin_dashboard():
     with tab2:
         st.subheader("System Settings")
         
-        # Add any system settings here
-        st.info("System settings will be added in a future update")
+        registry = get_session_registry()
+        
+        # Idle eviction threshold for heavy session artifacts
+        idle_minutes = st.number_input("Evict session data after idle (minutes)", 
+                                       min_value=1, value=max(1, registry.idle_seconds // 60), step=5,
+                                       help="Basket and result frames of idle sessions are moved to disk and the instruments list is dropped until the session returns")
+        registry.idle_seconds = int(idle_minutes * 60)
+        
+        st.subheader("Session Memory")
+        
+        sessions = registry.snapshot()
+        total_memory = sum(session['Memory'] for session in sessions)
+        
+        metric_col1, metric_col2 = st.columns(2)
+        with metric_col1:
+            st.metric("Active Sessions", len(sessions))
+        with metric_col2:
+            st.metric("Total Memory", format_bytes(total_memory))
+        
+        if sessions:
+            sessions_df = pd.DataFrame(sessions)
+            
+            # Per-user totals
+            user_memory = sessions_df.groupby('Username', as_index=False).agg(
+                Sessions=('Session', 'count'),
+                Memory=('Memory', 'sum')
+            ).sort_values('Memory', ascending=False)
+            user_memory['Memory'] = user_memory['Memory'].apply(format_bytes)
+            st.dataframe(user_memory, hide_index=True)
+            
+            with st.expander("Sessions"):
+                sessions_df['Memory'] = sessions_df['Memory'].apply(format_bytes)
+                st.dataframe(sessions_df, hide_index=True)
+        
+        if st.button("Evict Idle Sessions Now"):
+            evicted = registry.sweep(force=True)
+            st.success(f"Evicted artifacts from {evicted} idle sessions")
+    
+    with tab3:
+        st.subheader("Multi-Account Basket")
+        
+        basket = get_selected_stocks()
+        
+        if basket is None or basket.empty:
+            st.info("Save a stock selection first. The selected basket is scaled to each account's available cash.")
+        else:
+            st.write(f"Basket: {len(basket)} stocks")
+            
+            accounts = get_dispatchable_accounts()
+            
+            if not accounts:
+                st.warning("No users have a valid access token. A user's token is cached (encrypted) when they authenticate with Zerodha, until Kite's 06:00 reset.")
+            else:
+                chosen_accounts = st.multiselect("Accounts", accounts, default=accounts)
+                
+                fan_out_pct = st.slider("Percentage of each account's available cash to use", 
+                                        min_value=10, max_value=100, value=90, step=5, key="fan_out_pct")
+                
+                fan_out_dry_run = st.checkbox("Dry Run Mode (No actual orders will be placed)", value=True, key="fan_out_dry_run")
+                
+                if st.button(f"Dispatch Basket to {len(chosen_accounts)} Accounts", type="primary", disabled=not chosen_accounts):
+                    with st.spinner("Dispatching orders..."):
+                        priced_basket = fill_missing_prices(st.session_state.kite, basket)
+                        unpriced = priced_basket['Price'].isna() | (priced_basket['Price'] <= 0)
+                        
+                        if unpriced.any():
+                            st.warning(f"Skipping {int(unpriced.sum())} stocks without a price: {', '.join(priced_basket.loc[unpriced, 'Symbol'].astype(str))}")
+                        
+                        summary_df, orders_df = fan_out_basket(
+                            priced_basket[~unpriced],
+                            chosen_accounts,
+                            dry_run=fan_out_dry_run,
+                            allocation_pct=fan_out_pct
+                        )
+                        
+                        if not fan_out_dry_run and not orders_df.empty:
+                            for account, account_orders in orders_df[orders_df['Order ID'] != 'Failed'].groupby('Account', observed=True):
+                                append_order_journal([
+                                    {'event': 'placed', 'order_id': row['Order ID'], 'symbol': row['Symbol'], 'quantity': int(row['Quantity']), 'order_type': 'MARKET', 'placed_by': st.session_state.username}
+                                    for _, row in account_orders.iterrows()
+                                ], account)
+                        
+                        st.session_state.fan_out_result = {
+                            "summary_df": summary_df,
+                            "orders_df": orders_df,
+                            "is_dry_run": fan_out_dry_run,
+                            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                        }
+        
+        if st.session_state.fan_out_result:
+            result = st.session_state.fan_out_result
+            
+            st.subheader("Fan-out Report")
+            st.write(f"**Time:** {result['timestamp']}")
+            st.write(f"**Mode:** {'Dry Run (No actual orders placed)' if result['is_dry_run'] else 'REAL ORDERS'}")
+            
+            st.dataframe(result['summary_df'], hide_index=True)
+            paged_table(result['orders_df'], "fan_out_orders")
+            
+            st.download_button(
+                label="Download Report as CSV",
+                data=result['orders_df'].to_csv(index=False, na_rep='N/A'),
+                file_name=f"zerodha_fan_out_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
+                mime="text/csv"
+            )
 
 # Function to generate access token
 def generate_access_token(api_key, api_secret, request_token):
     try:
-        kite = KiteConnect(api_key=api_key)
+        kite = kiteconnect.KiteConnect(api_key=api_key)
         data = kite.generate_session(request_token, api_secret=api_secret)
         access_token = data["access_token"]
         logger.info("Access token generated successfully")
@@ -337,424 +1032,417 @@ def generate_access_token(api_key, api_secret, request_token):
         st.error(f"Error generating access token: {str(e)}")
         return None, None
 
-# Function to get account balance
-def get_account_balance(kite):
-    try:
-        # Get margins
-        margins = kite.margins()
-        
-        # Log full margins response for debugging
-        logger.info(f"Full margins response: {json.dumps(margins)}")
-        
-        balance_info = {}
-        
-        # Check for 'equity' segment in margins
-        if 'equity' in margins:
-            equity = margins['equity']
-            
-            # Check for 'available' dict in equity
-            if 'available' in equity and isinstance(equity['available'], dict):
-                available = equity['available']
-                
-                # Check for 'cash' in available
-                if 'cash' in available:
-                    balance_info['Available Cash'] = available['cash']
-            
-            # Check for 'utilized' dict in equity
-            if 'utilized' in equity and isinstance(equity['utilized'], dict):
-                utilized = equity['utilized']
-                
-                # Check for 'debits' in utilized
-                if 'debits' in utilized:
-                    balance_info['Used Margin'] = utilized['debits']
-        
-        return balance_info
-            
-    except Exception as e:
-        logger.error(f"Error retrieving account balance: {str(e)}")
-        return None
+# Shows pipeline progress and messages on the current page
+class StreamlitReporter(Reporter):
+    def __init__(self):
+        self._progress_bar = None
+        self._status_text = None
+
+    def progress(self, done, total, message=""):
+        if self._progress_bar is None:
+            self._progress_bar = st.progress(0)
+            self._status_text = st.empty()
+        self._progress_bar.progress(done / total if total else 1.0)
+        self._status_text.text(message)
 
-# Function to fetch stock details from Zerodha with better permission handling
+    def info(self, message):
+        st.info(message)
+
+    def warning(self, message):
+        st.warning(message)
+
+    def error(self, message):
+        st.error(message)
+
+# Fetch stock details, caching the instrument list in the session
 def fetch_stock_details(kite, symbol):
+    # Usable before the background warm-up has finished
+    load_session_instruments()
+    return trading_core.fetch_stock_details(kite, symbol, st.session_state, StreamlitReporter())
+
+# Symbol input with suggestions from the instrument lists
+def symbol_input(label, key):
+    """Returns the chosen tradingsymbol, or the text as typed when there
+    are no suggestions (or no Kite session to load the lists with)."""
+    query = st.text_input(label, key=key)
+    if not query or not load_session_instruments():
+        return query
+    
     try:
-        # Try to search in the available instruments
-        if st.session_state.available_instruments is None:
-            try:
-                st.session_state.available_instruments = kite.instruments("NSE")
-            except Exception as e:
-                logger.error(f"Error fetching instruments: {str(e)}")
-                st.warning("Could not fetch instruments list from Zerodha. Using limited functionality.")
-                return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
-        
-        instruments = st.session_state.available_instruments
+        search = trading_core.symbol_search(st.session_state.kite, st.session_state)
+    except Exception as e:
+        logger.error(f"Error building symbol suggestions: {str(e)}")
+        return query
+    
+    suggestions = search.search(query)
+    if not suggestions:
+        st.caption(f"No instruments match '{query}'")
+        return query
+    
+    labels = [f"{suggestion['Symbol']} · {suggestion['Name']}" for suggestion in suggestions]
+    choice = st.selectbox("Matches", range(len(suggestions)), format_func=labels.__getitem__, key=f"{key}_match")
+    return suggestions[choice]['Symbol']
+
+# Place orders with a progress bar on the current page
+def place_orders(kite, stocks_df, order_type="MARKET", dry_run=True, gtt_details=None, rate_limiter=None):
+    # Legs without a price are looked up in the shared instrument lists
+    load_session_instruments()
+    return trading_core.place_orders(kite, stocks_df, order_type, dry_run, gtt_details, rate_limiter, StreamlitReporter(), st.session_state)
+
+# Order statuses after which an order no longer changes
+FINAL_ORDER_STATUSES = {'COMPLETE', 'REJECTED', 'CANCELLED'}
+
+# Reconcile placed orders against the order book
+class OrderReconciler:
+    """Follows placed orders until they fill, get rejected or are cancelled.
+
+    Each poll makes a single kite.orders() call, indexes the book by
+    order_id and diffs it against the previous snapshot, so only orders
+    whose status, fill or average price changed are reported. The poll
+    interval doubles while nothing changes and resets on activity.
+    """
+
+    def __init__(self, order_ids, min_interval=ORDER_POLL_MIN_INTERVAL, max_interval=ORDER_POLL_MAX_INTERVAL):
+        self.order_ids = {str(order_id) for order_id in order_ids}
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+        self.next_poll = 0
+        self.snapshot = {}
+
+    @property
+    def settled(self):
+        return all(
+            order_id in self.snapshot and self.snapshot[order_id]['status'] in FINAL_ORDER_STATUSES
+            for order_id in self.order_ids
+        )
+
+    def due(self):
+        return not self.settled and time.time() >= self.next_poll
+
+    def record(self, order_id, order):
+        """Fold one order (book entry or postback) into the snapshot, returning the update if it changed"""
+        order_id = str(order_id)
+        if order_id not in self.order_ids:
+            return None
         
-        # Filter the instrument by symbol
-        found_instruments = [inst for inst in instruments if inst['tradingsymbol'] == symbol.upper()]
+        update = {
+            'status': order.get('status'),
+            'filled_quantity': order.get('filled_quantity') or 0,
+            'average_price': order.get('average_price') or 0,
+            'status_message': order.get('status_message')
+        }
         
-        if not found_instruments:
-            # Search case insensitive
-            found_instruments = [inst for inst in instruments if inst['tradingsymbol'].upper() == symbol.upper()]
+        if self.snapshot.get(order_id) == update:
+            return None
         
-        if found_instruments:
-            instrument = found_instruments[0]
-            
-            # Fetch the latest quote
-            try:
-                quote = kite.quote(f"NSE:{symbol}")
-                
-                if f"NSE:{symbol}" in quote:
-                    quote_data = quote[f"NSE:{symbol}"]
-                    
-                    return {
-                        'Symbol': instrument['tradingsymbol'],
-                        'Name': instrument['name'],
-                        'Exchange': instrument['exchange'],
-                        'ISIN': instrument.get('isin', 'N/A'),
-                        'LastPrice': quote_data.get('last_price', 0),
-                        'Change': quote_data.get('net_change', 0),
-                        'PctChange': round(quote_data.get('net_change', 0) / quote_data.get('last_price', 1) * 100, 2) if quote_data.get('last_price') else 0,
-                        'Volume': quote_data.get('volume', 0),
-                        'AvgPrice': quote_data.get('average_price', 0),
-                        'OHLC': {
-                            'open': quote_data.get('ohlc', {}).get('open', 0),
-                            'high': quote_data.get('ohlc', {}).get('high', 0),
-                            'low': quote_data.get('ohlc', {}).get('low', 0),
-                            'close': quote_data.get('ohlc', {}).get('close', 0)
-                        }
-                    }
-            except Exception as quote_error:
-                logger.error(f"Error fetching quote for {symbol}: {str(quote_error)}")
-                
-                if "Insufficient permission" in str(quote_error):
-                    st.warning(f"⚠️ Your Zerodha API key doesn't have permission to fetch quotes. You'll need to manually enter prices or upgrade your API permissions.")
-                
-                # Return basic info without quote data
-                return {
-                    'Symbol': instrument['tradingsymbol'],
-                    'Name': instrument['name'],
-                    'Exchange': instrument['exchange'],
-                    'ISIN': instrument.get('isin', 'N/A'),
-                    'LastPrice': 0,  # Set to 0 since we can't get the price
-                    'Volume': 0,
-                    'PctChange': 0
-                }
+        self.snapshot[order_id] = update
+        return update
+
+    def poll(self, kite):
+        """Fetch the order book once and return {order_id: update} for changed orders"""
+        order_book = {str(order['order_id']): order for order in kite.orders()}
+        
+        changes = {}
+        for order_id in self.order_ids:
+            if order_id in order_book:
+                update = self.record(order_id, order_book[order_id])
+                if update:
+                    changes[order_id] = update
+        
+        # Back off while the book is quiet, poll quickly again after activity
+        if changes:
+            self.interval = self.min_interval
         else:
-            logger.warning(f"Instrument not found for symbol: {symbol}")
-            return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
-                
+            self.interval = min(self.interval * 2, self.max_interval)
+        self.next_poll = time.time() + self.interval
+        
+        return changes
+
+# Write reconciled order updates into the results DataFrame (changed rows only)
+def apply_order_updates(orders_df, changes):
+    if not changes:
+        return orders_df
+    
+    if 'Filled Qty' not in orders_df.columns:
+        orders_df['Filled Qty'] = np.zeros(len(orders_df), dtype='int32')
+    if 'Avg Price' not in orders_df.columns:
+        orders_df['Avg Price'] = np.full(len(orders_df), np.nan, dtype='float32')
+    if 'Status Message' not in orders_df.columns:
+        orders_df['Status Message'] = pd.Series([None] * len(orders_df), index=orders_df.index, dtype=object)
+    
+    rows = orders_df.index[orders_df['Order ID'].astype(str).isin(changes.keys())]
+    updates = [changes[str(order_id)] for order_id in orders_df.loc[rows, 'Order ID']]
+    
+    statuses = [update['status'] for update in updates]
+    new_statuses = set(statuses) - set(orders_df['Status'].cat.categories)
+    if new_statuses:
+        orders_df['Status'] = orders_df['Status'].cat.add_categories(sorted(new_statuses))
+    
+    orders_df.loc[rows, 'Status'] = statuses
+    orders_df.loc[rows, 'Filled Qty'] = np.array([update['filled_quantity'] for update in updates], dtype='int32')
+    orders_df.loc[rows, 'Avg Price'] = np.array([update['average_price'] or np.nan for update in updates], dtype='float32')
+    orders_df.loc[rows, 'Status Message'] = [update['status_message'] for update in updates]
+    
+    return orders_df
+
+# Apply order updates to a results dict; sliced orders update their children and re-aggregate
+def apply_result_updates(orders_result, changes):
+    children_df = orders_result.get('children_df')
+    if children_df is None:
+        apply_order_updates(orders_result['orders_df'], changes)
+    else:
+        apply_order_updates(children_df, changes)
+        orders_result['orders_df'] = aggregate_child_fills(children_df)
+
+# Poll the order book if due and fold any changes into the results and journal
+def reconcile_order_status(kite, orders_result, reconciler, username=None):
+    try:
+        changes = reconciler.poll(kite)
     except Exception as e:
-        logger.error(f"Error fetching stock details for {symbol}: {str(e)}")
-        return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
+        logger.error(f"Error fetching order book: {str(e)}")
+        return {}
+    
+    if changes:
+        apply_result_updates(orders_result, changes)
+        
+        tracked_df = orders_result['orders_df'] if orders_result.get('children_df') is None else orders_result['children_df']
+        symbols = dict(zip(tracked_df['Order ID'].astype(str), tracked_df['Symbol'].astype(str)))
+        append_order_journal([
+            {'event': 'status', 'order_id': order_id, 'symbol': symbols.get(order_id), **update}
+            for order_id, update in changes.items()
+        ], username)
+        logger.info(f"Reconciled {len(changes)} order updates, next poll in {reconciler.interval:.0f}s")
+    
+    return changes
+
+# Journal every order postback received by this process
+def journal_postback_event(event):
+    append_order_journal([{'event': 'postback', **{k: v for k, v in event.items() if k != 'username'}}], event.get('username'))
 
-# Modified order placement function to work without price data
-def place_orders(kite, stocks_df, order_type="MARKET", dry_run=True, gtt_details=None):
-    successful_orders = 0
-    failed_orders = 0
-    orders_info = []
+@st.cache_resource
+def get_order_event_bus():
+    bus = OrderEventBus()
+    bus.subscribe(journal_postback_event)
+    return bus
+
+# Start the postback receiver once per process when it is configured
+@st.cache_resource
+def start_order_postback_receiver():
+    if not POSTBACK_PORT:
+        return None
     
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    try:
+        return start_postback_server(
+            POSTBACK_HOST,
+            POSTBACK_PORT,
+            lambda username: get_api_credentials(username)[1],
+            get_order_event_bus(),
+            record_file=POSTBACK_RECORD_FILE
+        )
+    except OSError as e:
+        logger.error(f"Could not start postback receiver on port {POSTBACK_PORT}: {str(e)}")
+        return None
+
+# Apply postbacks pushed to this session since the last refresh
+def drain_order_events(orders_result, reconciler):
+    events_queue = st.session_state.order_events
+    if events_queue is None or reconciler is None:
+        return {}
     
-    total_stocks = len(stocks_df)
-    for i, (_, row) in enumerate(stocks_df.iterrows()):
+    changes = {}
+    while True:
         try:
-            symbol = row['Symbol']
-            quantity = int(row['Quantity'])
-            
-            # Update progress
-            progress = (i + 1) / total_stocks
-            progress_bar.progress(progress)
-            status_text.text(f"Processing {i+1} of {total_stocks}: {symbol}")
-            
-            if dry_run:
-                logger.info(f"[DRY RUN] Would place {order_type} order for {quantity} shares of {symbol}")
-                order_id = f"dry-run-{successful_orders+1}"
-                successful_orders += 1
-            else:
-                if order_type == "MARKET":
-                    # Place market order
-                    order_id = kite.place_order(
-                        variety=kite.VARIETY_REGULAR,
-                        exchange=kite.EXCHANGE_NSE,
-                        tradingsymbol=symbol,
-                        transaction_type=kite.TRANSACTION_TYPE_BUY,
-                        quantity=quantity,
-                        order_type=kite.ORDER_TYPE_MARKET,
-                        product=kite.PRODUCT_CNC  # CNC for delivery
-                    )
-                elif order_type == "GTT":
-                    # Place GTT order
-                    if gtt_details and 'trigger_price' in gtt_details and 'limit_price' in gtt_details:
-                        trigger_price = gtt_details['trigger_price'].get(symbol, 0)
-                        limit_price = gtt_details['limit_price'].get(symbol, 0)
-                        
-                        if trigger_price <= 0 or limit_price <= 0:
-                            raise ValueError("Trigger price and limit price must be greater than zero")
-                        
-                        # Create a GTT order
-                        gtt_params = {
-                            "trigger_type": kite.GTT_TYPE_SINGLE,
-                            "tradingsymbol": symbol,
-                            "exchange": kite.EXCHANGE_NSE,
-                            "trigger_values": [trigger_price],
-                            "last_price": trigger_price,
-                            "orders": [{
-                                "transaction_type": kite.TRANSACTION_TYPE_BUY,
-                                "quantity": quantity,
-                                "price": limit_price,
-                                "order_type": kite.ORDER_TYPE_LIMIT,
-                                "product": kite.PRODUCT_CNC
-                            }]
-                        }
-                        
-                        # Place the GTT order
-                        order_id = kite.place_gtt(gtt_params)
-                    else:
-                        raise ValueError("GTT details missing trigger_price or limit_price")
-                else:
-                    raise ValueError(f"Unsupported order type: {order_type}")
-                    
-                logger.info(f"Successfully placed {order_type} order for {quantity} shares of {symbol}, Order ID: {order_id}")
-                successful_orders += 1
-            
-            # Get price from the row if available
-            price = row['Price'] if 'Price' in row else 'N/A'
-            if price == 'N/A' or price == 0:
-                # Try to fetch price from Zerodha
-                stock_details = fetch_stock_details(kite, symbol)
-                if stock_details and 'LastPrice' in stock_details and stock_details['LastPrice'] > 0:
-                    price = stock_details['LastPrice']
-                else:
-                    price = 'N/A'  # Keep as N/A if we can't get a valid price
-            
-            if price != 'N/A' and price != 0:
-                try:
-                    price = float(price)
-                    estimated_cost = price * quantity
-                except:
-                    estimated_cost = 'N/A'
-            else:
-                estimated_cost = 'N/A'
-                
-            orders_info.append({
-                'Symbol': symbol,
-                'Quantity': quantity,
-                'Order ID': order_id,
-                'Status': 'Success' if not dry_run else 'Dry Run',
-                'Price': price,
-                'Estimated Cost': estimated_cost,
-                'Order Type': order_type
-            })
-            
-            # Sleep to avoid rate limiting
-            time.sleep(0.5)
-            
-        except Exception as e:
-            logger.error(f"Error placing order for {symbol}: {str(e)}")
-            failed_orders += 1
-            
-            orders_info.append({
-                'Symbol': symbol,
-                'Quantity': row['Quantity'] if 'Quantity' in row else 'N/A',
-                'Order ID': 'Failed',
-                'Status': f'Error: {str(e)}',
-                'Price': row['Price'] if 'Price' in row else 'N/A',
-                'Estimated Cost': 'N/A',
-                'Order Type': order_type
-            })
+            event = events_queue.get_nowait()
+        except queue.Empty:
+            break
+        
+        update = reconciler.record(event.get('order_id'), event)
+        if update:
+            changes[str(event['order_id'])] = update
     
-    # Create a DataFrame with order information
-    orders_df = pd.DataFrame(orders_info)
-    logger.info(f"Order summary: {successful_orders} successful, {failed_orders} failed")
+    if changes:
+        apply_result_updates(orders_result, changes)
     
-    return successful_orders, failed_orders, orders_df
+    return changes
 
-# Function to place orders
-def place_orders(kite, stocks_df, order_type="MARKET", dry_run=True, gtt_details=None):
-    successful_orders = 0
-    failed_orders = 0
-    orders_info = []
+# Journal real orders sent by a scheduled release
+def journal_release(job):
+    if job.dry_run or job.order_type == "GTT":
+        return
     
-    progress_bar = st.progress(0)
-    status_text = st.empty()
+    placed = job.orders_df[job.orders_df['Order ID'] != 'Failed']
+    append_order_journal([
+        {'event': 'placed', 'order_id': order_id, 'symbol': symbol, 'quantity': int(quantity), 'order_type': job.order_type, 'release_id': job.job_id}
+        for order_id, symbol, quantity in zip(placed['Order ID'], placed['Symbol'].astype(str), placed['Quantity'])
+    ], job.username)
+
+# Share a release's status so the user's sessions on other replicas can see it
+def publish_job_status(job):
+    backend = shared_state()
+    if backend is None:
+        return
     
-    total_stocks = len(stocks_df)
-    for i, (_, row) in enumerate(stocks_df.iterrows()):
+    backend.save_job(job.username, f"{REPLICA_ID}-{job.job_id}", {
+        'replica': REPLICA_ID,
+        'job_id': job.job_id,
+        'orders': len(job.requests),
+        'order_type': job.order_type,
+        'dry_run': job.dry_run,
+        'release_at': job.release_at,
+        'status': job.status,
+        'error': job.error,
+        'updated_at': time.time()
+    })
+
+# Forget a dismissed release locally and in shared state
+def discard_release(scheduler, job):
+    scheduler.discard(job.job_id)
+    backend = shared_state()
+    if backend is not None:
         try:
-            symbol = row['Symbol']
-            quantity = int(row['Quantity'])
-            
-            # Update progress
-            progress = (i + 1) / total_stocks
-            progress_bar.progress(progress)
-            status_text.text(f"Processing {i+1} of {total_stocks}: {symbol}")
-            
-            if dry_run:
-                logger.info(f"[DRY RUN] Would place {order_type} order for {quantity} shares of {symbol}")
-                order_id = f"dry-run-{successful_orders+1}"
-                successful_orders += 1
-            else:
-                if order_type == "MARKET":
-                    # Place market order
-                    order_id = kite.place_order(
-                        variety=kite.VARIETY_REGULAR,
-                        exchange=kite.EXCHANGE_NSE,
-                        tradingsymbol=symbol,
-                        transaction_type=kite.TRANSACTION_TYPE_BUY,
-                        quantity=quantity,
-                        order_type=kite.ORDER_TYPE_MARKET,
-                        product=kite.PRODUCT_CNC  # CNC for delivery
-                    )
-                elif order_type == "GTT":
-                    # Place GTT order
-                    if gtt_details and 'trigger_price' in gtt_details and 'limit_price' in gtt_details:
-                        trigger_price = gtt_details['trigger_price'].get(symbol, 0)
-                        limit_price = gtt_details['limit_price'].get(symbol, 0)
-                        
-                        if trigger_price <= 0 or limit_price <= 0:
-                            raise ValueError("Trigger price and limit price must be greater than zero")
-                        
-                        # Create a GTT order
-                        gtt_params = {
-                            "trigger_type": kite.GTT_TYPE_SINGLE,
-                            "tradingsymbol": symbol,
-                            "exchange": kite.EXCHANGE_NSE,
-                            "trigger_values": [trigger_price],
-                            "last_price": trigger_price,
-                            "orders": [{
-                                "transaction_type": kite.TRANSACTION_TYPE_BUY,
-                                "quantity": quantity,
-                                "price": limit_price,
-                                "order_type": kite.ORDER_TYPE_LIMIT,
-                                "product": kite.PRODUCT_CNC
-                            }]
-                        }
-                        
-                        # Place the GTT order
-                        order_id = kite.place_gtt(gtt_params)
-                    else:
-                        raise ValueError("GTT details missing trigger_price or limit_price")
-                else:
-                    raise ValueError(f"Unsupported order type: {order_type}")
-                    
-                logger.info(f"Successfully placed {order_type} order for {quantity} shares of {symbol}, Order ID: {order_id}")
-                successful_orders += 1
-            
-            # Get price from the row if available
-            price = row['Price'] if 'Price' in row else 'N/A'
-            if price == 'N/A' or price == 0:
-                # Try to fetch price from Zerodha
-                stock_details = fetch_stock_details(kite, symbol)
-                if stock_details and 'LastPrice' in stock_details:
-                    price = stock_details['LastPrice']
-            
-            if price != 'N/A' and price != 0:
-                try:
-                    price = float(price)
-                    estimated_cost = price * quantity
-                except:
-                    estimated_cost = 'N/A'
-            else:
-                estimated_cost = 'N/A'
-                
-            orders_info.append({
-                'Symbol': symbol,
-                'Quantity': quantity,
-                'Order ID': order_id,
-                'Status': 'Success' if not dry_run else 'Dry Run',
-                'Price': price,
-                'Estimated Cost': estimated_cost,
-                'Order Type': order_type
-            })
-            
-            # Sleep to avoid rate limiting
-            time.sleep(0.5)
-            
+            backend.delete_job(job.username, f"{REPLICA_ID}-{job.job_id}")
         except Exception as e:
-            logger.error(f"Error placing order for {symbol}: {str(e)}")
-            failed_orders += 1
-            
-            orders_info.append({
-                'Symbol': symbol,
-                'Quantity': row['Quantity'] if 'Quantity' in row else 'N/A',
-                'Order ID': 'Failed',
-                'Status': f'Error: {str(e)}',
-                'Price': row['Price'] if 'Price' in row else 'N/A',
-                'Estimated Cost': 'N/A',
-                'Order Type': order_type
-            })
+            logger.error(f"Error removing release {job.job_id} from shared state: {str(e)}")
+
+# One release scheduler per server process
+@st.cache_resource
+def get_release_scheduler():
+    return ReleaseScheduler(ORDER_RATE_LIMIT, RELEASE_WARMUP_LEAD, on_release=journal_release, on_status=publish_job_status)
+
+# Next market open in the exchange's time zone
+def next_market_open():
+    tz = zoneinfo.ZoneInfo(MARKET_TIMEZONE)
+    now = datetime.datetime.now(tz)
     
-    # Create a DataFrame with order information
-    orders_df = pd.DataFrame(orders_info)
-    logger.info(f"Order summary: {successful_orders} successful, {failed_orders} failed")
+    release = datetime.datetime.combine(now.date(), MARKET_OPEN_TIME, tzinfo=tz)
+    if release <= now:
+        release += datetime.timedelta(days=1)
+    while release.weekday() >= 5:
+        release += datetime.timedelta(days=1)
     
-    return successful_orders, failed_orders, orders_df
+    return release
 
-# Calculate optimal quantities based on available balance
-def calculate_optimal_quantities(stocks_df, available_balance):
+# Start following placed regular orders until they settle
+def start_order_tracking(orders_df):
+    st.session_state.order_reconciler = None
+    
+    # Failed orders, and children left unsent by a stop or cancel (no Order ID), are never in the order book
+    placed = orders_df[orders_df['Order ID'].notna() & (orders_df['Order ID'] != 'Failed')]
+    if placed.empty:
+        return
+    
+    if start_order_postback_receiver() is not None:
+        # Updates are pushed; the order book is only polled as a slow safety net
+        st.session_state.order_events = get_order_event_bus().subscribe_queue(queue.Queue(), st.session_state.username)
+        st.session_state.order_reconciler = OrderReconciler(placed['Order ID'], min_interval=ORDER_POLL_MAX_INTERVAL)
+    else:
+        st.session_state.order_reconciler = OrderReconciler(placed['Order ID'])
+
+# Users whose cached access token lets an admin trade on their behalf
+def get_dispatchable_accounts():
+    cache = token_cache()
+    if cache is None:
+        return []
+    
+    tokens = cache.valid_tokens()
+    users = get_user_store().existing(tokens)
+    return [username for username in sorted(tokens) if username in users]
+
+# Scale basket quantities so the basket uses a share of an account's cash
+def scale_basket_quantities(basket_df, available_cash, allocation_pct=100):
+    base_cost = float((basket_df['Price'].astype('float64') * basket_df['Quantity']).sum())
+    if base_cost <= 0:
+        raise ValueError("Basket has no priced stocks to scale")
+    
+    factor = available_cash * (allocation_pct / 100) / base_cost
+    
+    scaled_df = basket_df.copy()
+    scaled_df['Quantity'] = np.floor(basket_df['Quantity'] * factor).astype('int32')
+    
+    return scaled_df[scaled_df['Quantity'] > 0], factor
+
+# Place a scaled copy of the basket for one account (runs on a worker thread)
+def dispatch_account_basket(username, account, basket_df, dry_run=True, allocation_pct=100):
+    """Returns (summary, order rows) for one account.
+
+    Each account gets its own KiteConnect client and RateLimiter, so accounts
+    are throttled independently of each other. No Streamlit calls are made here.
+    """
+    summary = {'Account': username, 'Available Cash': np.nan, 'Scale': np.nan, 'Orders': 0, 'Successful': 0, 'Failed': 0, 'Error': None}
+    rows = []
+    
     try:
-        # Create a working copy
-        working_df = stocks_df.copy()
-        
-        # Ensure Price column exists and is numeric
-        if 'Price' not in working_df.columns:
-            working_df['Price'] = 0
-        
-        # Convert Price to numeric, handling non-numeric values
-        working_df['Price'] = pd.to_numeric(working_df['Price'].astype(str).str.replace(',', ''), errors='coerce')
+        kite = kiteconnect.KiteConnect(api_key=account['api_key'])
+        kite.set_access_token(account['access_token'])
         
-        # Replace NaN or 0 prices with fetched prices if available
-        for i, row in working_df.iterrows():
-            if pd.isna(row['Price']) or row['Price'] == 0:
-                if 'FetchedPrice' in row and row['FetchedPrice'] > 0:
-                    working_df.at[i, 'Price'] = row['FetchedPrice']
+        balance = get_account_balance(kite)
+        if not balance or 'Available Cash' not in balance:
+            raise ValueError("Could not retrieve account balance")
+        summary['Available Cash'] = balance['Available Cash']
         
-        # Filter out rows with invalid prices
-        valid_df = working_df[working_df['Price'] > 0].copy()
+        scaled_df, factor = scale_basket_quantities(basket_df, balance['Available Cash'], allocation_pct)
+        summary['Scale'] = round(factor, 4)
         
-        if valid_df.empty:
-            return working_df, "No valid prices found for any stock"
-        
-        # Calculate the total cost with quantity = 1 for each stock
-        valid_df['Cost'] = valid_df['Price']
-        
-        # Total cost if we buy 1 share of each stock
-        total_base_cost = valid_df['Cost'].sum()
-        
-        if total_base_cost > 0:
-            # Calculate allocation ratio
-            allocation_ratio = available_balance / total_base_cost
-            
-            # Calculate optimal quantity for each stock
-            valid_df['OptimalQuantity'] = (allocation_ratio * valid_df['Price'] / valid_df['Price']).apply(lambda x: max(1, int(x)))
-            
-            # Check if we're within budget
-            valid_df['TotalCost'] = valid_df['OptimalQuantity'] * valid_df['Price']
-            total_cost = valid_df['TotalCost'].sum()
-            
-            # If we're over budget, reduce quantities proportionally
-            if total_cost > available_balance:
-                reduction_factor = available_balance / total_cost
-                valid_df['OptimalQuantity'] = (valid_df['OptimalQuantity'] * reduction_factor).apply(lambda x: max(1, int(x)))
-                
-                # Recalculate final cost
-                valid_df['TotalCost'] = valid_df['OptimalQuantity'] * valid_df['Price']
-            
-            # Update the original dataframe with optimal quantities
-            for i, row in valid_df.iterrows():
-                idx = working_df.index.get_loc(i)
-                working_df.at[idx, 'Quantity'] = row['OptimalQuantity']
-            
-            # Calculate the final total cost
-            final_total_cost = sum(working_df['Price'] * working_df['Quantity'])
+        rate_limiter = RateLimiter(ORDER_RATE_LIMIT)
+        for symbol, quantity, price in zip(scaled_df['Symbol'].astype(str), scaled_df['Quantity'], scaled_df['Price']):
+            try:
+                if dry_run:
+                    order_id = f"dry-run-{username}-{summary['Orders'] + 1}"
+                    status = 'Dry Run'
+                else:
+                    rate_limiter.wait()
+                    order_id = submit_order(kite, symbol, int(quantity), "MARKET")
+                    status = 'Success'
+                summary['Successful'] += 1
+            except Exception as e:
+                logger.error(f"Error placing order for {symbol} on account {username}: {str(e)}")
+                order_id = 'Failed'
+                status = f'Error: {str(e)}'
+                summary['Failed'] += 1
             
-            return working_df, f"Optimized quantities to use ₹{final_total_cost:.2f} of available ₹{available_balance:.2f}"
-        else:
-            return working_df, "Could not calculate optimal quantities due to invalid prices"
+            summary['Orders'] += 1
+            rows.append({
+                'Account': username,
+                'Symbol': symbol,
+                'Quantity': int(quantity),
+                'Order ID': order_id,
+                'Status': status,
+                'Price': price,
+                'Estimated Cost': price * quantity,
+                'Order Type': 'MARKET'
+            })
+    except Exception as e:
+        logger.error(f"Error dispatching basket to account {username}: {str(e)}")
+        summary['Error'] = str(e)
+    
+    return summary, rows
+
+# Dispatch one basket to several accounts concurrently and merge the results
+def fan_out_basket(basket_df, usernames, dry_run=True, allocation_pct=100):
+    cache = token_cache()
+    tokens = cache.valid_tokens() if cache is not None else {}
+    accounts = {username: tokens[username] for username in usernames if username in tokens}
+    
+    summaries = []
+    rows = []
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(len(accounts), FAN_OUT_MAX_WORKERS))) as executor:
+        futures = [
+            executor.submit(dispatch_account_basket, username, account, basket_df, dry_run, allocation_pct)
+            for username, account in accounts.items()
+        ]
+        for future in futures:
+            summary, account_rows = future.result()
+            summaries.append(summary)
+            rows.extend(account_rows)
     
-    except Exception as e:
-        logger.error(f"Error calculating optimal quantities: {str(e)}")
-        return stocks_df, f"Error calculating optimal quantities: {str(e)}"
+    summary_df = pd.DataFrame(summaries)
+    orders_df = normalize_orders(pd.DataFrame(rows))
+    
+    logger.info(f"Fan-out to {len(accounts)} accounts: {len(rows)} orders, {int(summary_df['Failed'].sum()) if not summary_df.empty else 0} failed")
+    
+    return summary_df, orders_df
 
 # User profile page
 def user_profile_page():
@@ -836,41 +1524,41 @@ def user_profile_page():
 
 # Function to read CSV
 def read_csv(uploaded_file):
+    return trading_core.read_csv(uploaded_file, StreamlitReporter())
+
+# Resolve uploaded symbols to NSE instruments and show how each one matched
+def resolve_uploaded_symbols(csv_df):
+    if st.session_state.kite is None:
+        return csv_df
+    
+    # Uploads can come in before the background warm-up has mapped the lists
+    load_session_instruments()
     try:
-        df = pd.read_csv(uploaded_file)
-        logger.info(f"Successfully read {len(df)} stocks from CSV")
-        
-        # Verify required columns exist
-        required_columns = ['Symbol']
-        missing_columns = [col for col in required_columns if col not in df.columns]
-        
-        if missing_columns:
-            logger.error(f"Missing required columns: {missing_columns}")
-            st.error(f"The CSV file is missing these required columns: {missing_columns}")
-            st.info("The CSV must contain at least a 'Symbol' column.")
-            return None
-            
-        # Add a Quantity column if it doesn't exist
-        if 'Quantity' not in df.columns:
-            df['Quantity'] = 1
-        
-        # Add a Selected column
-        df['Selected'] = True
-        
-        return df
-        
+        csv_df, report = trading_core.resolve_basket_symbols(st.session_state.kite, csv_df, st.session_state, StreamlitReporter())
     except Exception as e:
-        logger.error(f"Error reading CSV file: {str(e)}")
-        st.error(f"Error reading CSV file: {str(e)}")
-        return None
+        st.warning(f"Could not resolve symbols against the instrument list: {str(e)}")
+        return csv_df
+    
+    with st.expander("Symbol Resolution Report"):
+        counts = report['Status'].value_counts()
+        st.write(", ".join(f"{status}: {count}" for status, count in counts.items()))
+        st.dataframe(report, hide_index=True)
+    
+    return csv_df
 
 # Zerodha login page
 def zerodha_login_page():
     st.header("Step 1: Zerodha API Authentication")
     
+    if not st.session_state.api_authenticated and restore_kite_session():
+        st.rerun()
+    
     if st.session_state.api_authenticated:
         st.success("You are authenticated with Zerodha!")
         
+        if st.session_state.session_warmup is not None:
+            st.caption("Loading account balance...")
+        
         # Display account balance
         if st.session_state.account_balance:
             st.subheader("Account Balance")
@@ -890,6 +1578,11 @@ def zerodha_login_page():
         if st.button("Continue to Upload CSV", type="primary"):
             st.session_state.page = "upload_csv"
             st.rerun()
+        
+        # Logs in again with a new request token instead of the cached one
+        if st.button("Reconnect to Zerodha"):
+            drop_kite_session()
+            st.rerun()
     else:
         st.info("""
         Connect to your Zerodha account using your API credentials.
@@ -940,17 +1633,17 @@ def zerodha_login_page():
                         st.session_state.kite = kite
                         st.session_state.api_authenticated = True
                         
-                        # Fetch account balance
-                        account_balance = get_account_balance(kite)
-                        if account_balance:
-                            st.session_state.account_balance = account_balance
+                        # Cache the token until Kite's daily reset: later sessions, restarted
+                        # workers and other replicas reuse it, and admins can dispatch to this account
+                        cache = token_cache()
+                        if cache is not None:
+                            try:
+                                cache.save(st.session_state.username, api_key, access_token)
+                            except Exception as e:
+                                logger.error(f"Error caching the access token: {str(e)}")
                         
-                        # Prefetch available instruments for faster symbol lookup
-                        try:
-                            st.session_state.available_instruments = kite.instruments("NSE")
-                            logger.info(f"Successfully fetched {len(st.session_state.available_instruments)} instruments from NSE")
-                        except Exception as e:
-                            logger.error(f"Error fetching instruments: {str(e)}")
+                        # Account balance and instrument lists load in the background
+                        start_session_warmup(kite)
                         
                         st.success("Successfully authenticated with Zerodha!")
                         st.rerun()
@@ -990,11 +1683,13 @@ def upload_csv_page():
     # Option to manually add stocks
     st.subheader("Add Stock Manually")
     
+    # Outside the form, so suggestions update as soon as the symbol is entered
+    stock_symbol = symbol_input("Enter Stock Symbol or Company Name", key="upload_symbol")
+    
     with st.form("add_stock_form"):
         col1, col2 = st.columns([2, 1])
         
         with col1:
-            stock_symbol = st.text_input("Enter Stock Symbol")
             fetch_details = st.checkbox("Try to fetch stock details from Zerodha", value=True)
         
         with col2:
@@ -1023,83 +1718,42 @@ def upload_csv_page():
                     st.write(f"Name: {stock_details['Name']}")
                     st.write(price_info)
                     
-                    # Create a dataframe for this stock
-                    if st.session_state.stocks_df is None:
-                        stock_df = pd.DataFrame({
-                            'Symbol': [stock_details['Symbol']],
-                            'Name': [stock_details['Name']],
-                            'Price': [stock_details['LastPrice']],
-                            'Quantity': [stock_qty],
-                            'Selected': [True],
-                            'FetchedPrice': [stock_details['LastPrice']]
-                        })
-                        
-                        st.session_state.stocks_df = stock_df
-                    else:
-                        # Check if the stock is already in the dataframe
-                        if stock_details['Symbol'] in st.session_state.stocks_df['Symbol'].values:
-                            st.warning(f"Stock {stock_details['Symbol']} already exists in your list")
-                        else:
-                            new_row = pd.DataFrame({
-                                'Symbol': [stock_details['Symbol']],
-                                'Name': [stock_details['Name']],
-                                'Price': [stock_details['LastPrice']],
-                                'Quantity': [stock_qty],
-                                'Selected': [True],
-                                'FetchedPrice': [stock_details['LastPrice']]
-                            })
-                            
-                            st.session_state.stocks_df = pd.concat([st.session_state.stocks_df, new_row], ignore_index=True)
+                    # Add the stock to the basket (constant-time duplicate check)
+                    added = get_basket().append({
+                        'Symbol': stock_details['Symbol'],
+                        'Name': stock_details['Name'],
+                        'Price': stock_details['LastPrice'],
+                        'Quantity': stock_qty,
+                        'Selected': True,
+                        'FetchedPrice': stock_details['LastPrice']
+                    })
+                    
+                    if not added:
+                        st.warning(f"Stock {stock_details['Symbol']} already exists in your list")
                 else:
                     st.error(f"Could not find details for symbol: {stock_symbol}")
                     
                     # Add with manual price
-                    if st.session_state.stocks_df is None:
-                        stock_df = pd.DataFrame({
-                            'Symbol': [stock_symbol.upper()],
-                            'Price': [manual_price],
-                            'Quantity': [stock_qty],
-                            'Selected': [True]
-                        })
-                        
-                        st.session_state.stocks_df = stock_df
+                    if get_basket().append({
+                        'Symbol': stock_symbol.upper(),
+                        'Price': manual_price,
+                        'Quantity': stock_qty,
+                        'Selected': True
+                    }):
+                        st.success(f"Added {stock_symbol.upper()} with manual price ₹{manual_price}")
                     else:
-                        new_row = pd.DataFrame({
-                            'Symbol': [stock_symbol.upper()],
-                            'Price': [manual_price],
-                            'Quantity': [stock_qty],
-                            'Selected': [True]
-                        })
-                        
-                        st.session_state.stocks_df = pd.concat([st.session_state.stocks_df, new_row], ignore_index=True)
-                    
-                    st.success(f"Added {stock_symbol.upper()} with manual price ₹{manual_price}")
+                        st.warning(f"Stock {stock_symbol.upper()} already exists in your list")
             else:
                 # Add without fetching details
-                if st.session_state.stocks_df is None:
-                    stock_df = pd.DataFrame({
-                        'Symbol': [stock_symbol.upper()],
-                        'Price': [manual_price],
-                        'Quantity': [stock_qty],
-                        'Selected': [True]
-                    })
-                    
-                    st.session_state.stocks_df = stock_df
+                if get_basket().append({
+                    'Symbol': stock_symbol.upper(),
+                    'Price': manual_price,
+                    'Quantity': stock_qty,
+                    'Selected': True
+                }):
+                    st.success(f"Added {stock_symbol.upper()} with manual price ₹{manual_price}")
                 else:
-                    # Check if the stock is already in the dataframe
-                    if stock_symbol.upper() in st.session_state.stocks_df['Symbol'].values:
-                        st.warning(f"Stock {stock_symbol.upper()} already exists in your list")
-                    else:
-                        new_row = pd.DataFrame({
-                            'Symbol': [stock_symbol.upper()],
-                            'Price': [manual_price],
-                            'Quantity': [stock_qty],
-                            'Selected': [True]
-                        })
-                        
-                        st.session_state.stocks_df = pd.concat([st.session_state.stocks_df, new_row], ignore_index=True)
-                
-                st.success(f"Added {stock_symbol.upper()} with manual price ₹{manual_price}")
+                    st.warning(f"Stock {stock_symbol.upper()} already exists in your list")
     
     st.subheader("Or Upload CSV File")
     
@@ -1125,36 +1779,42 @@ TATASTEEL,135.75,15""", language="text")
             mime="text/csv"
         )
     
-    uploaded_file = st.file_uploader("Choose a CSV file", type="csv")
+    uploaded_file = st.file_uploader("Choose a CSV file or TradingView watchlist", type=["csv", "txt"])
     
     if uploaded_file is not None:
         csv_df = read_csv(uploaded_file)
         
         if csv_df is not None:
+            csv_df = resolve_uploaded_symbols(csv_df)
+            
             # If we already have stocks, ask if user wants to replace or append
-            if st.session_state.stocks_df is not None:
+            if st.session_state.basket is not None:
                 st.warning("You already have stocks in your list. How would you like to proceed?")
                 replace = st.radio("Choose an option:", ["Append new stocks", "Replace existing stocks"])
                 
                 if replace == "Replace existing stocks":
-                    st.session_state.stocks_df = csv_df
+                    set_stocks_df(csv_df)
+                    st.session_state.selected_mask = None
                 else:
-                    # Append, avoiding duplicates
-                    existing_symbols = set(st.session_state.stocks_df['Symbol'])
-                    new_symbols = [s for s in csv_df['Symbol'] if s not in existing_symbols]
+                    # Append, skipping symbols already in the basket
+                    added = get_basket().extend(csv_df)
                     
-                    if new_symbols:
-                        new_df = csv_df[csv_df['Symbol'].isin(new_symbols)]
-                        st.session_state.stocks_df = pd.concat([st.session_state.stocks_df, new_df], ignore_index=True)
-                        st.info(f"Added {len(new_symbols)} new stocks to your list")
+                    if added:
+                        st.info(f"Added {added} new stocks to your list")
                     else:
                         st.info("No new stocks found in the CSV")
             else:
-                st.session_state.stocks_df = csv_df
+                set_stocks_df(csv_df)
+                st.session_state.selected_mask = None
+    
+    # Build a basket from indicator rules instead of a CSV
+    with st.expander("Or Screen the NSE Universe"):
+        screener_section()
     
     # Display current stocks
-    if st.session_state.stocks_df is not None:
-        st.success(f"Your list contains {len(st.session_state.stocks_df)} stocks!")
+    if st.session_state.basket is not None:
+        basket = get_basket()
+        st.success(f"Your list contains {len(basket)} stocks!")
         
         # Option to fetch details for all stocks
         col1, col2 = st.columns(2)
@@ -1163,40 +1823,29 @@ TATASTEEL,135.75,15""", language="text")
             if st.button("Try to Fetch Details for All Stocks"):
                 if st.session_state.kite:
                     with st.spinner("Fetching stock details from Zerodha..."):
-                        # Create a copy of the dataframe
-                        updated_df = st.session_state.stocks_df.copy()
-                        
-                        # Add columns for fetched data if they don't exist
-                        if 'Name' not in updated_df.columns:
-                            updated_df['Name'] = None
-                        if 'FetchedPrice' not in updated_df.columns:
-                            updated_df['FetchedPrice'] = None
-                        
-                        # Fetch details for each stock
+                        # Fetch details for each stock, updating the basket in place
                         fetch_progress = st.progress(0)
                         fetch_status = st.empty()
                         fetch_success = 0
                         fetch_failed = 0
                         
-                        for i, (idx, row) in enumerate(updated_df.iterrows()):
-                            symbol = row['Symbol']
-                            fetch_status.text(f"Fetching {i+1} of {len(updated_df)}: {symbol}")
-                            fetch_progress.progress((i+1)/len(updated_df))
+                        symbols = list(basket.symbols)
+                        for i, symbol in enumerate(symbols):
+                            fetch_status.text(f"Fetching {i+1} of {len(symbols)}: {symbol}")
+                            fetch_progress.progress((i+1)/len(symbols))
                             
                             stock_details = fetch_stock_details(st.session_state.kite, symbol)
                             
                             if stock_details:
-                                updated_df.at[idx, 'Name'] = stock_details['Name']
+                                basket.set_value(symbol, 'Name', stock_details['Name'])
                                 
                                 if stock_details['LastPrice'] > 0:
-                                    updated_df.at[idx, 'FetchedPrice'] = stock_details['LastPrice']
+                                    basket.set_value(symbol, 'FetchedPrice', stock_details['LastPrice'])
                                     
-                                    # Update Price column if it's empty or 0
-                                    if 'Price' not in updated_df.columns:
-                                        updated_df['Price'] = None
-                                    
-                                    if pd.isna(updated_df.at[idx, 'Price']) or updated_df.at[idx, 'Price'] == 0:
-                                        updated_df.at[idx, 'Price'] = stock_details['LastPrice']
+                                    # Update Price if it's empty or 0
+                                    price = basket.get_value(symbol, 'Price')
+                                    if price is None or pd.isna(price) or price == 0:
+                                        basket.set_value(symbol, 'Price', stock_details['LastPrice'])
                                         fetch_success += 1
                                 else:
                                     fetch_failed += 1
@@ -1206,9 +1855,6 @@ TATASTEEL,135.75,15""", language="text")
                             # Sleep to avoid rate limiting
                             time.sleep(0.1)
                         
-                        # Update the dataframe
-                        st.session_state.stocks_df = updated_df
-                        
                         fetch_status.empty()
                         
                         if fetch_success > 0:
@@ -1220,10 +1866,11 @@ TATASTEEL,135.75,15""", language="text")
         with col2:
             if st.button("Edit Prices Manually"):
                 # Create a copy for editing
-                if 'Price' not in st.session_state.stocks_df.columns:
-                    st.session_state.stocks_df['Price'] = 0
-                
-                price_df = st.session_state.stocks_df[['Symbol', 'Price']].copy()
+                stocks_df = basket.to_frame()
+                if 'Price' in stocks_df.columns:
+                    price_df = stocks_df[['Symbol', 'Price']].copy()
+                else:
+                    price_df = stocks_df[['Symbol']].assign(Price=np.float32(0))
                 
                 # Make it editable
                 edited_prices = st.data_editor(
@@ -1238,21 +1885,17 @@ TATASTEEL,135.75,15""", language="text")
                 
                 # Update the main dataframe with edited prices
                 if st.button("Save Manual Prices"):
-                    for i, row in edited_prices.iterrows():
-                        symbol = row['Symbol']
-                        price = row['Price']
-                        
-                        mask = st.session_state.stocks_df['Symbol'] == symbol
-                        st.session_state.stocks_df.loc[mask, 'Price'] = price
+                    for symbol, price in zip(edited_prices['Symbol'], edited_prices['Price']):
+                        basket.set_value(symbol, 'Price', price)
                     
                     st.success("Prices updated successfully!")
                     st.rerun()
         
-        # Display the dataframe
-        st.dataframe(st.session_state.stocks_df)
+        # The basket table is drawn here once, after any optimization below has run
+        basket_table = st.container()
         
         # Show a balance-based allocation button if we have prices
-        if 'Price' in st.session_state.stocks_df.columns or 'FetchedPrice' in st.session_state.stocks_df.columns:
+        if 'Price' in basket.columns or 'FetchedPrice' in basket.columns:
             if st.session_state.account_balance and 'Available Cash' in st.session_state.account_balance:
                 available_cash = st.session_state.account_balance['Available Cash']
                 
@@ -1267,19 +1910,92 @@ TATASTEEL,135.75,15""", language="text")
                 if st.button("Calculate Optimal Quantities"):
                     with st.spinner("Calculating optimal quantities..."):
                         optimized_df, message = calculate_optimal_quantities(
-                            st.session_state.stocks_df, 
+                            basket.to_frame(), 
                             budget
                         )
                         
-                        st.session_state.stocks_df = optimized_df
+                        set_stocks_df(optimized_df)
+                        basket = get_basket()
                         st.success(message)
-                        st.dataframe(st.session_state.stocks_df)
+        
+        with basket_table:
+            paged_table(basket.to_frame(), "upload_basket")
         
         # Navigation button
         if st.button("Continue to Stock Selection", type="primary"):
             st.session_state.page = "select_stocks"
             st.rerun()
 
+# Indicator rules over cached daily candles; matches can replace or extend the basket
+def screener_section():
+    st.write("Runs indicator rules over the daily candles of every NSE equity. "
+             "Only candles already downloaded are used unless you update them first.")
+    
+    rules = []
+    screen_col1, screen_col2 = st.columns(2)
+    with screen_col1:
+        if st.checkbox("Moving average crossover", value=True):
+            kind = st.radio("Average", ["SMA", "EMA"], horizontal=True)
+            fast = st.number_input("Fast period", min_value=2, value=20, step=1)
+            slow = st.number_input("Slow period", min_value=3, value=50, step=1)
+            within = st.number_input("Crossed within (days)", min_value=1, value=5, step=1)
+            rules.append({'rule': 'ma_cross', 'kind': kind, 'fast': int(fast), 'slow': int(slow), 'within': int(within)})
+        if st.checkbox("RSI threshold"):
+            rsi_period = st.number_input("RSI period", min_value=2, value=14, step=1)
+            direction = st.radio("RSI", ["below", "above"], horizontal=True)
+            threshold = st.number_input("RSI level", min_value=1.0, max_value=99.0, value=30.0 if direction == "below" else 70.0, step=1.0)
+            rules.append({'rule': 'rsi', 'period': int(rsi_period), direction: float(threshold)})
+    with screen_col2:
+        if st.checkbox("Breakout above N-day high"):
+            breakout_days = st.number_input("Breakout days", min_value=2, value=20, step=1)
+            rules.append({'rule': 'breakout', 'days': int(breakout_days)})
+        if st.checkbox("Volume surge"):
+            surge_days = st.number_input("Average volume over (days)", min_value=2, value=20, step=1)
+            multiple = st.number_input("Volume multiple", min_value=1.0, value=2.0, step=0.5)
+            rules.append({'rule': 'volume_surge', 'days': int(surge_days), 'multiple': float(multiple)})
+    
+    match = st.radio("Match", ["all", "any"], horizontal=True, format_func=lambda option: f"{option.title()} rules")
+    refresh = st.checkbox("Update daily candles first (about 3 stocks per second; slow the first time)")
+    
+    if st.button("Run Screen") and rules:
+        if not load_session_instruments():
+            st.error("Could not fetch the instruments list from Zerodha.")
+            return
+        
+        try:
+            with st.spinner("Screening..."):
+                stocks_df, stats = screen_universe(get_candle_store(), st.session_state.kite, st.session_state.available_instruments,
+                                                   rules, match, refresh, reporter=StreamlitReporter())
+            st.session_state.screen_result = {'stocks_df': stocks_df, 'stats': stats}
+        except ValueError as e:
+            st.error(str(e))
+    
+    result = st.session_state.screen_result
+    if result is None:
+        return
+    
+    stats = result['stats']
+    if not stats['with_data']:
+        st.warning("No daily candles are stored yet; tick the update option to download them.")
+        return
+    
+    st.caption(f"{stats['matched']} of {stats['with_data']} stocks with data matched "
+               f"({stats['universe']} in the universe), evaluated in {stats['seconds']:.2f}s")
+    paged_table(result['stocks_df'], "screen_result")
+    
+    if len(result['stocks_df']):
+        top = st.number_input("Use the top", min_value=1, max_value=len(result['stocks_df']), value=min(20, len(result['stocks_df'])), step=1)
+        use_col1, use_col2 = st.columns(2)
+        with use_col1:
+            if st.button("Replace Basket with Matches"):
+                set_stocks_df(result['stocks_df'].head(int(top)))
+                st.session_state.selected_mask = None
+                st.rerun()
+        with use_col2:
+            if st.session_state.basket is not None and st.button("Add Matches to Basket"):
+                added = get_basket().extend(result['stocks_df'].head(int(top)))
+                st.info(f"Added {added} new stocks to your list")
+
 # Select stocks page
 def select_stocks_page():
     st.header("Step 3: Select Stocks and Set Quantities")
@@ -1291,14 +2007,15 @@ def select_stocks_page():
             st.rerun()
         return
     
-    if st.session_state.stocks_df is None:
+    if st.session_state.basket is None:
         st.error("Please upload a CSV file or add stocks first.")
         if st.button("Go to Upload/Add Stocks"):
             st.session_state.page = "upload_csv"
             st.rerun()
     else:
-        # Get a working copy of the dataframe
-        working_df = st.session_state.stocks_df.copy()
+        basket = get_basket()
+        if 'Selected' not in basket.columns:
+            basket.set_column('Selected', True)
         
         # Display options in multiple columns
         col1, col2 = st.columns([3, 1])
@@ -1306,52 +2023,14 @@ def select_stocks_page():
         with col1:
             st.subheader("Stock Selection")
             
-            # Option to select/deselect all
-            select_all = st.checkbox("Select All", value=True)
-            if select_all:
-                working_df['Selected'] = True
-            else:
-                working_df['Selected'] = False
-                
-            # Display editable dataframe
-            edited_df = st.data_editor(
-                working_df,
-                use_container_width=True,
-                hide_index=True,
-                column_config={
-                    "Selected": st.column_config.CheckboxColumn(
-                        "Select",
-                        help="Select the stocks you want to trade",
-                        default=True,
-                    ),
-                    "Quantity": st.column_config.NumberColumn(
-                        "Quantity",
-                        help="Number of shares to buy",
-                        min_value=1,
-                        step=1,
-                        default=1,
-                    ),
-                    "Symbol": st.column_config.TextColumn(
-                        "Symbol",
-                        help="Stock symbol",
-                        disabled=True,
-                    ),
-                    "Price": st.column_config.NumberColumn(
-                        "Price",
-                        help="Current price (read-only)",
-                        format="₹%.2f",
-                        disabled=True,
-                    ) if "Price" in working_df.columns else None,
-                    "Name": st.column_config.TextColumn(
-                        "Name",
-                        help="Stock name",
-                        disabled=True,
-                    ) if "Name" in working_df.columns else None,
-                }
-            )
+            # Option to select/deselect all; only a click rewrites the column
+            st.checkbox("Select All", value=True, key="select_all", on_change=apply_select_all)
+            
+            # Display editable basket; edits reach the basket through apply_basket_edits
+            basket_editor(basket)
             
-            # Update the working dataframe
-            working_df = edited_df
+            with st.expander("Price Charts"):
+                price_charts_section(basket.to_frame().loc[basket.column('Selected'), 'Symbol'].astype(str).tolist(), "select")
         
         with col2:
             st.subheader("Bulk Actions")
@@ -1360,12 +2039,11 @@ def select_stocks_page():
             st.write("Set default quantity for selected stocks:")
             default_qty = st.number_input("Default Quantity", min_value=1, value=1, step=1)
             if st.button("Apply Default Quantity"):
-                working_df.loc[working_df['Selected'], 'Quantity'] = default_qty
-                st.session_state.stocks_df = working_df
+                basket.set_column('Quantity', default_qty, positions=np.flatnonzero(basket.column('Selected')))
                 st.rerun()
             
             # Show a balance-based allocation button if we have prices
-            if ('Price' in working_df.columns or 'FetchedPrice' in working_df.columns) and \
+            if ('Price' in basket.columns or 'FetchedPrice' in basket.columns) and \
                st.session_state.account_balance and 'Available Cash' in st.session_state.account_balance:
                 
                 st.write("---")
@@ -1382,7 +2060,7 @@ def select_stocks_page():
                 if st.button("Calculate Optimal Quantities"):
                     with st.spinner("Calculating optimal quantities..."):
                         # Only consider selected stocks
-                        selected_df = working_df[working_df['Selected']].copy()
+                        selected_df = basket.to_frame()[basket.column('Selected')]
                         
                         if not selected_df.empty:
                             optimized_df, message = calculate_optimal_quantities(
@@ -1390,12 +2068,8 @@ def select_stocks_page():
                                 budget
                             )
                             
-                            # Update quantities in the main dataframe
-                            for i, row in optimized_df.iterrows():
-                                idx = working_df.index.get_loc(i)
-                                working_df.at[idx, 'Quantity'] = row['Quantity']
-                            
-                            st.session_state.stocks_df = working_df
+                            # Update quantities in the basket (the index holds basket positions)
+                            basket.set_column('Quantity', optimized_df['Quantity'].to_numpy(), positions=optimized_df.index.to_numpy())
                             st.success(message)
                             st.rerun()
                         else:
@@ -1405,7 +2079,7 @@ def select_stocks_page():
             st.write("---")
             st.write("Add a new stock:")
             
-            new_symbol = st.text_input("Symbol")
+            new_symbol = symbol_input("Symbol or Company Name", key="select_symbol")
             fetch_details = st.checkbox("Fetch details", value=True)
             new_qty = st.number_input("Quantity", min_value=1, value=1, step=1, key="new_stock_qty")
             
@@ -1414,61 +2088,217 @@ def select_stocks_page():
                     stock_details = fetch_stock_details(st.session_state.kite, new_symbol)
                     
                     if stock_details:
-                        new_row = pd.DataFrame({
-                            'Symbol': [stock_details['Symbol']],
-                            'Name': [stock_details['Name']] if 'Name' in working_df.columns else None,
-                            'Price': [stock_details['LastPrice']] if 'Price' in working_df.columns else None,
-                            'Quantity': [new_qty],
-                            'Selected': [True],
-                            'FetchedPrice': [stock_details['LastPrice']]
-                        })
-                        
-                        # Drop any None columns
-                        new_row = new_row.dropna(axis=1, how='all')
-                        
-                        # Ensure working_df has the same columns
-                        for col in new_row.columns:
-                            if col not in working_df.columns:
-                                working_df[col] = None
+                        new_row = {
+                            'Symbol': stock_details['Symbol'],
+                            'Quantity': new_qty,
+                            'Selected': True,
+                            'FetchedPrice': stock_details['LastPrice']
+                        }
+                        if 'Name' in basket.columns:
+                            new_row['Name'] = stock_details['Name']
+                        if 'Price' in basket.columns:
+                            new_row['Price'] = stock_details['LastPrice']
                         
-                        working_df = pd.concat([working_df, new_row], ignore_index=True)
-                        st.session_state.stocks_df = working_df
-                        st.success(f"Added {stock_details['Symbol']} at ₹{stock_details['LastPrice']}")
-                        st.rerun()
+                        if basket.append(new_row):
+                            st.success(f"Added {stock_details['Symbol']} at ₹{stock_details['LastPrice']}")
+                            st.rerun()
+                        else:
+                            st.warning(f"{stock_details['Symbol']} is already in your list")
                     else:
                         st.error(f"Could not find details for symbol: {new_symbol}")
                 else:
-                    new_row = pd.DataFrame({
-                        'Symbol': [new_symbol.upper()],
-                        'Quantity': [new_qty],
-                        'Selected': [True]
-                    })
-                    
-                    working_df = pd.concat([working_df, new_row], ignore_index=True)
-                    st.session_state.stocks_df = working_df
-                    st.rerun()
+                    if basket.append({'Symbol': new_symbol.upper(), 'Quantity': new_qty, 'Selected': True}):
+                        st.rerun()
+                    else:
+                        st.warning(f"{new_symbol.upper()} is already in your list")
         
         # Save button
         if st.button("Save Selection", type="primary"):
-            # Filter to only selected stocks
-            selected_stocks = working_df[working_df['Selected']].copy()
-            
-            if selected_stocks.empty:
+            if not basket.column('Selected').any():
                 st.error("No stocks selected. Please select at least one stock.")
             else:
-                st.session_state.selected_stocks = selected_stocks
-                st.session_state.stocks_df = working_df
+                # Keep only the selection mask; the rows stay in the basket
+                st.session_state.selected_mask = pd.Series(basket.column('Selected').copy())
+                selected_stocks = get_selected_stocks()
                 st.success(f"Successfully saved {len(selected_stocks)} selected stocks!")
                 
-                # Display selected stocks
+                # Display selected stocks (the full list is paged on the review page)
                 st.subheader("Selected Stocks")
-                st.dataframe(selected_stocks)
+                st.dataframe(selected_stocks.head(TABLE_PAGE_SIZE), hide_index=True)
+                st.caption(format_totals(table_totals(selected_stocks)))
                 
                 # Navigation button
                 if st.button("Continue to Review & Order", type="primary"):
                     st.session_state.page = "review_order"
                     st.rerun()
 
+# Select or clear every row when the Select All checkbox is clicked
+def apply_select_all():
+    if st.session_state.basket is not None:
+        st.session_state.basket.set_column('Selected', st.session_state.select_all)
+
+# Apply the cells changed in the basket editor since the last callback
+def apply_basket_edits():
+    """The editor reports every edit made since it was mounted; only the
+    cells that differ from what was applied last time are written, so a
+    click costs the size of the edit rather than of the basket."""
+    editor = st.session_state.basket_editor_state
+    edited_rows = st.session_state[editor['key']].get('edited_rows', {})
+    applied = editor['applied']
+    
+    delta = {}
+    for position, row in edited_rows.items():
+        changed = {name: value for name, value in row.items() if applied.get(position, {}).get(name, object()) != value}
+        if changed:
+            delta[position] = changed
+    
+    st.session_state.basket.update_rows(delta)
+    editor['applied'] = {position: dict(row) for position, row in edited_rows.items()}
+    editor['version'] = basket_version()
+
+# Editable view of the basket, applied to it as deltas
+def basket_editor(basket):
+    """The editor keeps its edits across reruns while the basket only
+    changes through it. Any other change (Select All, bulk quantities, an
+    added stock, a new upload) remounts it on the new data, so stale edits
+    are never replayed over it."""
+    editor = st.session_state.basket_editor_state
+    if editor['version'] != basket_version():
+        editor['generation'] += 1
+        editor['key'] = f"basket_editor_{editor['generation']}"
+        editor['applied'] = {}
+        editor['version'] = basket_version()
+    
+    columns = basket.columns
+    st.data_editor(
+        basket.to_frame(),
+        key=editor['key'],
+        on_change=apply_basket_edits,
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "Selected": st.column_config.CheckboxColumn(
+                "Select",
+                help="Select the stocks you want to trade",
+                default=True,
+            ),
+            "Quantity": st.column_config.NumberColumn(
+                "Quantity",
+                help="Number of shares to buy",
+                min_value=1,
+                step=1,
+                default=1,
+            ),
+            "Symbol": st.column_config.TextColumn(
+                "Symbol",
+                help="Stock symbol",
+                disabled=True,
+            ),
+            "Price": st.column_config.NumberColumn(
+                "Price",
+                help="Current price (read-only)",
+                format="₹%.2f",
+                disabled=True,
+            ) if "Price" in columns else None,
+            "Name": st.column_config.TextColumn(
+                "Name",
+                help="Stock name",
+                disabled=True,
+            ) if "Name" in columns else None,
+        }
+    )
+
+# Charts are sized for this content width and split into a grid for many symbols
+CHART_PAGE_WIDTH = 1000
+CHART_GRID_COLUMNS = 3
+MAX_GRID_CHARTS = 50
+
+# Candles are shared by every session; only missing ranges are fetched
+@st.cache_resource
+def get_candle_store():
+    return CandleStore()
+
+# Instrument lists are written once a day and mapped by every worker process
+@st.cache_resource
+def get_instrument_store():
+    return InstrumentStore()
+
+# Point the session at the shared NSE and BSE instrument tables
+def load_session_instruments():
+    """Returns False when the NSE list could not be loaded. Mapping the
+    stored tables costs no download or parse, so evicted sessions simply
+    map them again."""
+    if st.session_state.available_instruments is not None:
+        return True
+    if st.session_state.kite is None:
+        return False
+    
+    store = get_instrument_store()
+    try:
+        st.session_state.available_instruments = store.instruments(st.session_state.kite, "NSE")
+        logger.info(f"Mapped {len(st.session_state.available_instruments)} instruments from NSE")
+    except Exception as e:
+        logger.error(f"Error fetching instruments: {str(e)}")
+        return False
+    
+    try:
+        st.session_state.bse_instruments = store.instruments(st.session_state.kite, "BSE")
+    except Exception as e:
+        logger.error(f"Error fetching BSE instruments: {str(e)}")
+    return True
+
+# Downsampled series per (symbol, range, width, kind); the payload stays a few KB
+@st.cache_data(ttl=TAIL_REFRESH_SECONDS, max_entries=1000, show_spinner=False)
+def chart_series(_kite, symbol, token, range_key, width, kind):
+    days, interval = CHART_RANGES[range_key]
+    candles = get_candle_store().candles(_kite, token, interval, datetime.datetime.now() - datetime.timedelta(days=days))
+    return downsample(candles, width, kind)
+
+# One chart, or a grid for the whole list, of the given symbols
+def price_charts_section(symbols, key):
+    if not symbols:
+        st.info("Select stocks to see their charts.")
+        return
+    
+    chart_col1, chart_col2, chart_col3 = st.columns(3)
+    with chart_col1:
+        range_key = st.radio("Range", list(CHART_RANGES), index=2, horizontal=True, key=f"chart_range_{key}")
+    with chart_col2:
+        kind = st.radio("Style", ["line", "candles"], horizontal=True, format_func=str.title, key=f"chart_kind_{key}")
+    with chart_col3:
+        view = st.radio("Show", ["One stock", "Grid"], horizontal=True, key=f"chart_view_{key}")
+    
+    if view == "One stock":
+        symbols = [st.selectbox("Stock", symbols, key=f"chart_symbol_{key}")]
+        columns, height = 1, 300
+    else:
+        if len(symbols) > MAX_GRID_CHARTS:
+            st.caption(f"Showing the first {MAX_GRID_CHARTS} of {len(symbols)} stocks")
+            symbols = symbols[:MAX_GRID_CHARTS]
+        columns, height = CHART_GRID_COLUMNS, 160
+    
+    width = CHART_PAGE_WIDTH // columns
+    
+    if not load_session_instruments():
+        st.error("Could not fetch the instruments list from Zerodha.")
+        return
+    
+    grid = st.columns(columns)
+    for position, symbol in enumerate(symbols):
+        with grid[position % columns]:
+            try:
+                token = instrument_token(symbol, st.session_state.available_instruments)
+                df = chart_series(st.session_state.kite, symbol, token, range_key, width, kind)
+            except Exception as e:
+                logger.error(f"Error loading chart for {symbol}: {str(e)}")
+                st.caption(f"{symbol}: chart unavailable ({str(e)})")
+                continue
+            
+            if df.empty:
+                st.caption(f"{symbol}: no candles in this range")
+            else:
+                st.altair_chart(render_chart(df, kind, symbol, width, height))
+
 # Review and order page
 def review_order_page():
     st.header("Step 4: Review and Place Orders")
@@ -1480,7 +2310,9 @@ def review_order_page():
             st.rerun()
         return
     
-    if st.session_state.selected_stocks is None or len(st.session_state.selected_stocks) == 0:
+    selected_stocks = get_selected_stocks()
+    
+    if selected_stocks is None or len(selected_stocks) == 0:
         st.error("No stocks selected. Please select stocks first.")
         if st.button("Go to Stock Selection"):
             st.session_state.page = "select_stocks"
@@ -1499,7 +2331,7 @@ def review_order_page():
                 st.subheader("Estimated Cost")
                 try:
                     # Get a working copy
-                    price_df = st.session_state.selected_stocks.copy()
+                    price_df = selected_stocks.copy()
                     
                     # If Price column exists, use it
                     if 'Price' in price_df.columns:
@@ -1546,12 +2378,23 @@ def review_order_page():
         
         # Display selected stocks
         st.subheader("Selected Stocks for Order")
-        st.dataframe(st.session_state.selected_stocks)
+        paged_table(selected_stocks, "review_selection")
+        
+        with st.expander("Price Charts"):
+            price_charts_section(selected_stocks['Symbol'].astype(str).tolist(), "review")
+        
+        # Pre-trade margin and charges check
+        with st.expander("Margin & Charges Check", expanded=bool(st.session_state.margin_check_requested)):
+            margin_check_section(selected_stocks)
         
         # Order placement options
         st.subheader("Order Placement")
         
-        order_type = st.radio("Order Type", ["MARKET", "GTT (Good Till Triggered)"])
+        order_type = st.radio("Order Type", ["MARKET", "LIMIT", "GTT (Good Till Triggered)"])
+        
+        limit_priced = None
+        if order_type == "LIMIT":
+            limit_priced = limit_price_section(selected_stocks)
         
         if order_type == "GTT (Good Till Triggered)":
             st.info("GTT orders will be placed when the stock reaches your trigger price")
@@ -1576,7 +2419,7 @@ def review_order_page():
             apply_default = st.button("Apply Default Parameters to All Stocks")
             
             # Create inputs for each stock
-            for i, row in st.session_state.selected_stocks.iterrows():
+            for i, row in selected_stocks.iterrows():
                 symbol = row['Symbol']
                 current_price = 0
                 
@@ -1614,6 +2457,16 @@ def review_order_page():
         
         is_dry_run = st.checkbox("Dry Run Mode (No actual orders will be placed)", value=True)
         
+        trim_before_placing = False
+        if order_type == "MARKET" and st.session_state.account_balance and 'Available Cash' in st.session_state.account_balance:
+            trim_before_placing = st.checkbox("Trim quantities to the available margin before placing", value=True,
+                                              help="Checks the basket with Zerodha's margin API and reduces quantities so no order is rejected for insufficient funds")
+        
+        slicing = None
+        if order_type == "MARKET":
+            with st.expander("Order Slicing (large or illiquid orders)"):
+                slicing = order_slicing_options()
+        
         if is_dry_run:
             place_button = st.button(f"Place {order_type} Orders (Dry Run)", type="primary")
         else:
@@ -1624,6 +2477,13 @@ def review_order_page():
             st.warning(f"⚠️ You are about to place REAL {order_type} orders on Zerodha! These orders will use real money.")
         
         # Place orders
+        if place_button and order_type == "LIMIT" and limit_priced is None:
+            st.error("Compute limit prices for this basket first.")
+            place_button = False
+        elif place_button and order_type == "LIMIT" and limit_priced.empty:
+            st.error("No legs left to place; every leg is flagged.")
+            place_button = False
+        
         if place_button:
             if not is_dry_run:
                 confirmation = st.radio(
@@ -1642,10 +2502,30 @@ def review_order_page():
                     if order_type == "GTT (Good Till Triggered)":
                         gtt_params = gtt_details
                     
+                    if trim_before_placing:
+                        try:
+                            _, summary = basket_margin_check(selected_stocks)
+                            if summary['shortfall']:
+                                trimmed_df, _, _ = trim_to_margin(st.session_state.kite, selected_stocks, summary['available_cash'])
+                                apply_trimmed_quantities(selected_stocks, trimmed_df)
+                                st.info(f"Trimmed the basket from {len(selected_stocks)} to {len(trimmed_df)} legs to fit the available margin")
+                                selected_stocks = get_selected_stocks()
+                        except Exception as e:
+                            logger.error(f"Error checking basket margins: {str(e)}")
+                            st.warning(f"Could not check margins before placing, orders are sent as selected: {str(e)}")
+                    
+                    if slicing:
+                        # Child orders go out from a background thread; progress is shown below
+                        children_df = plan_child_orders(fill_missing_prices(st.session_state.kite, selected_stocks), **slicing)
+                        st.session_state.orders_result = None
+                        st.session_state.order_reconciler = None
+                        st.session_state.sliced_execution = SlicedExecution(st.session_state.kite, children_df, dry_run=is_dry_run).start()
+                        st.rerun()
+                    
                     successful, failed, orders_df = place_orders(
                         st.session_state.kite, 
-                        st.session_state.selected_stocks, 
-                        order_type="GTT" if order_type == "GTT (Good Till Triggered)" else "MARKET",
+                        limit_priced if order_type == "LIMIT" else selected_stocks, 
+                        order_type="GTT" if order_type == "GTT (Good Till Triggered)" else order_type,
                         dry_run=is_dry_run,
                         gtt_details=gtt_params
                     )
@@ -1658,6 +2538,35 @@ def review_order_page():
                         "order_type": order_type,
                         "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                     }
+                    
+                    # Follow real regular orders until they settle (GTTs are triggers, not orders)
+                    st.session_state.order_reconciler = None
+                    if not is_dry_run and order_type != "GTT (Good Till Triggered)" and not orders_df.empty:
+                        placed = orders_df[orders_df['Order ID'] != 'Failed']
+                        
+                        append_order_journal([
+                            {'event': 'placed', 'order_id': row['Order ID'], 'symbol': row['Symbol'], 'quantity': int(row['Quantity']), 'order_type': order_type}
+                            for _, row in placed.iterrows()
+                        ], st.session_state.username)
+                        
+                        start_order_tracking(orders_df)
+        
+        # What the MARKET basket would cost against the current order book
+        if order_type == "MARKET":
+            with st.expander("Market Impact Estimate (order book depth)"):
+                market_impact_section(selected_stocks)
+        
+        # Trade only the difference between current holdings and this basket
+        with st.expander("Rebalance Against Holdings"):
+            rebalance_section(selected_stocks, is_dry_run)
+        
+        # Stage the basket now and release it at a set time
+        with st.expander("Schedule Release (e.g. at market open)"):
+            scheduled_release_section(limit_priced if order_type == "LIMIT" else selected_stocks, order_type, gtt_details if order_type == "GTT (Good Till Triggered)" else None, is_dry_run)
+        
+        # Progress of a sliced execution that is still sending child orders
+        if st.session_state.sliced_execution is not None:
+            sliced_execution_progress()
         
         # Display results
         if st.session_state.orders_result:
@@ -1669,11 +2578,39 @@ def review_order_page():
             st.write(f"**Order Type:** {result['order_type']}")
             st.write(f"**Summary:** {result['successful']} successful, {result['failed']} failed")
             
-            # Display orders table
-            st.dataframe(result['orders_df'])
+            reconciler = st.session_state.order_reconciler
+            tracking = reconciler is not None and not reconciler.settled
+            refresh_interval = POSTBACK_REFRESH_INTERVAL if st.session_state.order_events is not None else ORDER_POLL_MIN_INTERVAL
+            
+            # Fragment re-runs on its own while orders are open; pushed postbacks
+            # are applied on every refresh and the order book is only fetched
+            # when the reconciler's back-off interval has elapsed
+            @st.fragment(run_every=refresh_interval if tracking else None)
+            def order_status_table():
+                mark_session_active()
+                if reconciler is not None and not reconciler.settled:
+                    drain_order_events(result, reconciler)
+                    
+                    if reconciler.due():
+                        reconcile_order_status(st.session_state.kite, result, reconciler, st.session_state.username)
+                    
+                    if reconciler.settled:
+                        # Full rerun stops the periodic refresh
+                        st.rerun()
+                
+                if reconciler is not None:
+                    if reconciler.settled:
+                        st.caption("All orders have settled")
+                    else:
+                        st.caption(f"Tracking order status, next check in {max(0, reconciler.next_poll - time.time()):.0f}s")
+                
+                # Display orders table
+                paged_table(result['orders_df'], "orders_table")
+            
+            order_status_table()
             
             # Provide download option
-            csv_data = result['orders_df'].to_csv(index=False)
+            csv_data = result['orders_df'].to_csv(index=False, na_rep='N/A')
             st.download_button(
                 label="Download Results as CSV",
                 data=csv_data,
@@ -1681,6 +2618,409 @@ def review_order_page():
                 mime="text/csv"
             )
 
+# Margin checks are cached per user and basket for a short time, since prices move
+MARGIN_CACHE_TTL = 60
+
+@st.cache_data(ttl=MARGIN_CACHE_TTL, show_spinner=False)
+def cached_basket_margins(_kite, username, key, _legs, available_cash):
+    return check_basket_margins(_kite, _legs, available_cash)
+
+# Margin and charges for the selected legs, reusing a recent check of the same basket
+def basket_margin_check(selected_stocks):
+    available_cash = (st.session_state.account_balance or {}).get('Available Cash')
+    legs = selected_stocks[['Symbol', 'Quantity']].reset_index(drop=True)
+    legs['Symbol'] = legs['Symbol'].astype(str)
+    return cached_basket_margins(st.session_state.kite, st.session_state.username, basket_key(legs), legs, available_cash)
+
+# Write trimmed quantities back to the basket; legs trimmed away are deselected
+def apply_trimmed_quantities(selected_stocks, trimmed_df):
+    basket = get_basket()
+    trimmed = dict(zip(trimmed_df['Symbol'].astype(str), trimmed_df['Quantity']))
+    
+    stocks_df = get_stocks_df()
+    mask = st.session_state.selected_mask.reindex(stocks_df.index, fill_value=False)
+    for symbol in selected_stocks['Symbol'].astype(str):
+        if symbol in trimmed:
+            basket.set_value(symbol, 'Quantity', trimmed[symbol])
+        else:
+            mask.loc[stocks_df['Symbol'].astype(str) == symbol] = False
+    
+    st.session_state.selected_mask = mask
+
+# Show required margin, charges and shortfall per leg, with an option to trim the basket
+def margin_check_section(selected_stocks):
+    if st.button("Check Margin & Charges"):
+        st.session_state.margin_check_requested = True
+    
+    if not st.session_state.margin_check_requested:
+        return
+    
+    try:
+        with st.spinner("Checking margins with Zerodha..."):
+            legs_df, summary = basket_margin_check(selected_stocks)
+    except Exception as e:
+        logger.error(f"Error checking basket margins: {str(e)}")
+        st.error(f"Could not check margins: {str(e)}")
+        return
+    
+    m_col1, m_col2, m_col3, m_col4 = st.columns(4)
+    m_col1.metric("Required Margin", f"₹{summary['basket_margin']:,.2f}")
+    m_col2.metric("Charges", f"₹{summary['charges']:,.2f}")
+    m_col3.metric("Total", f"₹{summary['total']:,.2f}")
+    if summary['shortfall'] is not None:
+        m_col4.metric("Shortfall", f"₹{summary['shortfall']:,.2f}")
+    
+    st.dataframe(legs_df, hide_index=True)
+    
+    if summary['shortfall']:
+        st.warning(f"⚠️ The basket needs ₹{summary['shortfall']:,.2f} more than the available cash; orders at the end of the basket would be rejected.")
+        if st.button("Trim Quantities to Fit"):
+            with st.spinner("Trimming quantities..."):
+                trimmed_df, _, trimmed_summary = trim_to_margin(st.session_state.kite, selected_stocks, summary['available_cash'])
+            apply_trimmed_quantities(selected_stocks, trimmed_df)
+            st.success(f"Trimmed the basket to {len(trimmed_df)} legs needing ₹{trimmed_summary['total']:,.2f}")
+            st.rerun()
+    elif summary['shortfall'] is not None:
+        st.success("✅ Available cash covers the margin and charges for this basket")
+
+# Offset and base for LIMIT prices; returns the priced legs to send, or None until computed
+def limit_price_section(selected_stocks):
+    st.write("Limit prices are computed for the whole basket from one quote request, "
+             "rounded down to each stock's tick size and kept inside the day's circuit band.")
+    
+    limit_col1, limit_col2 = st.columns(2)
+    with limit_col1:
+        base = st.radio("Price from", ["LTP", "Price"], horizontal=True,
+                        format_func=lambda option: "Last traded price" if option == "LTP" else "CSV Price",
+                        help="Legs without a CSV price use the last traded price")
+    with limit_col2:
+        offset_pct = st.number_input("Offset (%)", min_value=-20.0, max_value=20.0, value=0.0, step=0.1,
+                                     help="Limit price as percentage +/- from the base price")
+    
+    key = (basket_key(selected_stocks), base, float(offset_pct))
+    if st.button("Compute Limit Prices"):
+        try:
+            with st.spinner("Fetching quotes and circuit limits..."):
+                load_session_instruments()
+                priced_df = price_limit_orders(st.session_state.kite, selected_stocks, offset_pct, base, st.session_state, StreamlitReporter())
+            st.session_state.limit_prices = {'key': key, 'priced_df': priced_df}
+        except Exception as e:
+            logger.error(f"Error computing limit prices: {str(e)}")
+            st.error(f"Could not compute limit prices: {str(e)}")
+    
+    # Prices belong to one basket and parameter set; anything else has to be recomputed
+    cached = st.session_state.limit_prices
+    if cached is None or cached['key'] != key:
+        return None
+    
+    priced_df = cached['priced_df']
+    st.dataframe(priced_df[['Symbol', 'Quantity', 'Base Price', 'Limit Price', 'Tick Size', 'Lower Circuit', 'Upper Circuit', 'Band Flag']], hide_index=True)
+    
+    flagged = priced_df['Band Flag'].notna()
+    if flagged.any():
+        st.warning(f"⚠️ {int(flagged.sum())} legs are flagged: their price was clamped to the circuit band or couldn't be computed.")
+        if st.checkbox("Skip flagged legs", value=True):
+            priced_df = priced_df[~flagged]
+    
+    st.write(f"Limit value: ₹{(priced_df['Limit Price'].astype('float64') * priced_df['Quantity']).sum():,.2f}")
+    return priced_df
+
+# Diff the basket against the account's holdings and place only the changes
+def rebalance_section(selected_stocks, is_dry_run):
+    st.write("Treats the selected quantities as target holdings: only the difference to what the account "
+             "already holds is traded, with sells sent before buys so their proceeds fund the purchases.")
+    
+    exit_unlisted = st.checkbox("Also sell holdings that are not in this basket", value=False)
+    
+    key = (basket_key(selected_stocks), exit_unlisted)
+    if st.button("Compare with Holdings"):
+        try:
+            with st.spinner("Fetching holdings and positions..."):
+                diff_df, summary = plan_rebalance(st.session_state.kite, selected_stocks, exit_unlisted)
+            st.session_state.rebalance_plan = {'key': key, 'diff_df': diff_df, 'summary': summary}
+        except Exception as e:
+            logger.error(f"Error computing rebalance: {str(e)}")
+            st.error(f"Could not compare with holdings: {str(e)}")
+    
+    # A plan belongs to one basket; holdings are only read again on request
+    plan = st.session_state.rebalance_plan
+    if plan is None or plan['key'] != key:
+        return
+    
+    diff_df, summary = plan['diff_df'], plan['summary']
+    r_col1, r_col2, r_col3 = st.columns(3)
+    r_col1.metric("Sells", summary['sells'], f"₹{summary['sell_value']:,.2f}", delta_color="off")
+    r_col2.metric("Buys", summary['buys'], f"₹{summary['buy_value']:,.2f}", delta_color="off")
+    r_col3.metric("Unchanged", summary['unchanged'])
+    
+    if diff_df.empty:
+        st.success("✅ Holdings already match this basket")
+        return
+    
+    st.dataframe(diff_df, hide_index=True)
+    
+    confirmed = True
+    if not is_dry_run:
+        confirmed = st.checkbox(f"I confirm that {len(diff_df)} REAL buy and sell orders will be placed", key="rebalance_confirm")
+    
+    if st.button(f"Place {len(diff_df)} Rebalance Orders{' (Dry Run)' if is_dry_run else ''}"):
+        if not confirmed:
+            st.error("Please confirm the real orders before placing them.")
+            return
+        
+        with st.spinner("Placing rebalance orders..."):
+            successful, failed, orders_df = place_orders(st.session_state.kite, diff_df, order_type="MARKET", dry_run=is_dry_run)
+        
+        st.session_state.orders_result = {
+            "successful": successful,
+            "failed": failed,
+            "orders_df": orders_df,
+            "is_dry_run": is_dry_run,
+            "order_type": "MARKET (rebalance)",
+            "timestamp": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        st.session_state.order_reconciler = None
+        # Holdings change once these orders fill
+        st.session_state.rebalance_plan = None
+        
+        if not is_dry_run and not orders_df.empty:
+            placed = orders_df[orders_df['Order ID'] != 'Failed']
+            append_order_journal([
+                {'event': 'placed', 'order_id': order_id, 'symbol': symbol, 'quantity': int(quantity), 'order_type': 'MARKET', 'side': side}
+                for order_id, symbol, quantity, side in zip(placed['Order ID'], placed['Symbol'].astype(str), placed['Quantity'], placed['Side'].astype(str))
+            ], st.session_state.username)
+            start_order_tracking(orders_df)
+        
+        st.rerun()
+
+# Simulate the MARKET basket against the five levels of market depth
+def market_impact_section(selected_stocks):
+    st.write("Walks each stock's quantity through the best five bid/offer levels of the current order book "
+             "to estimate the average fill, slippage against the mid price, and any quantity the visible depth can't fill. "
+             "No orders are sent.")
+    
+    key = basket_key(selected_stocks)
+    if st.button("Estimate Fills from Market Depth"):
+        try:
+            with st.spinner("Fetching market depth..."):
+                legs_df, totals = simulate_market_basket(st.session_state.kite, selected_stocks)
+            st.session_state.impact_estimate = {
+                'key': key,
+                'legs_df': legs_df,
+                'totals': totals,
+                'timestamp': datetime.datetime.now().strftime("%H:%M:%S")
+            }
+        except Exception as e:
+            logger.error(f"Error estimating market impact: {str(e)}")
+            st.error(f"Could not fetch market depth: {str(e)}")
+    
+    # An estimate belongs to one basket and is only refreshed on request, as the book moves
+    estimate = st.session_state.impact_estimate
+    if estimate is None or estimate['key'] != key:
+        return
+    
+    totals = estimate['totals']
+    i_col1, i_col2, i_col3 = st.columns(3)
+    i_col1.metric("Estimated Cost", f"₹{totals['notional']:,.2f}")
+    i_col2.metric("Slippage", f"{totals['slippage_bps']:.1f} bps", f"₹{totals['slippage_cost']:,.2f}", delta_color="inverse")
+    i_col3.metric("Beyond Visible Depth", f"{totals['unfillable_qty']:,} shares", f"{totals['short_legs']} stocks", delta_color="off")
+    st.caption(f"Order book as of {estimate['timestamp']}")
+    
+    if totals['no_depth']:
+        st.warning(f"{totals['no_depth']} stocks have no market depth (no quotes, or the market is closed)")
+    
+    paged_table(estimate['legs_df'], "impact_legs")
+
+# Slicing parameters for MARKET orders, or None when orders go out whole
+def order_slicing_options():
+    st.write("Split each stock's quantity into smaller child orders, sent interleaved across stocks within the order rate limit.")
+    
+    slice_col1, slice_col2 = st.columns(2)
+    with slice_col1:
+        max_slice = st.number_input("Max shares per child order", min_value=0, value=0, step=1, help="0 for no limit")
+        twap_minutes = st.number_input("Spread over (minutes, TWAP)", min_value=0.0, value=0.0, step=1.0,
+                                       help="Child orders of each stock are spaced evenly across this window; 0 sends them right away")
+    with slice_col2:
+        freeze_qty = st.number_input("Freeze quantity", min_value=0, value=0, step=1,
+                                     help="Exchange freeze limit; every child order stays below it. 0 for none")
+        twap_slices = st.number_input("Minimum slices per stock (TWAP)", min_value=1, value=1, step=1)
+    
+    if not (max_slice or freeze_qty or twap_minutes):
+        return None
+    
+    return {
+        'max_slice': int(max_slice) or None,
+        'freeze_qty': int(freeze_qty) or None,
+        'twap_duration': float(twap_minutes) * 60,
+        'twap_slices': int(twap_slices)
+    }
+
+# Show a running sliced execution and turn it into order results when it finishes
+def sliced_execution_progress():
+    execution = st.session_state.sliced_execution
+    
+    @st.fragment(run_every=1.0)
+    def execution_status():
+        mark_session_active()
+        if execution.finished:
+            children_df = execution.results()
+            orders_df = aggregate_child_fills(children_df)
+            sent = children_df[~children_df['Order ID'].isin(['Failed', None])]
+            
+            st.session_state.orders_result = {
+                "successful": len(sent),
+                "failed": len(children_df) - len(sent),
+                "orders_df": orders_df,
+                "children_df": children_df,
+                "is_dry_run": execution.dry_run,
+                "order_type": f"MARKET ({execution.total} child orders)",
+                "timestamp": datetime.datetime.fromtimestamp(execution.started_at).strftime("%Y-%m-%d %H:%M:%S")
+            }
+            st.session_state.sliced_execution = None
+            
+            if not execution.dry_run:
+                placed = children_df[children_df['Status'] == 'Success']
+                append_order_journal([
+                    {'event': 'placed', 'order_id': order_id, 'symbol': symbol, 'quantity': int(quantity), 'order_type': 'MARKET', 'slice': int(number)}
+                    for order_id, symbol, quantity, number in zip(placed['Order ID'], placed['Symbol'].astype(str), placed['Quantity'], placed['Slice'])
+                ], st.session_state.username)
+                start_order_tracking(placed)
+            
+            st.rerun()
+        
+        st.subheader("Sending Child Orders")
+        st.progress(execution.sent / execution.total if execution.total else 1.0,
+                    text=f"{execution.sent} of {execution.total} child orders sent{' (dry run)' if execution.dry_run else ''}")
+        st.dataframe(aggregate_child_fills(execution.results()), hide_index=True)
+        
+        if st.button("Stop Sending", key="cancel_sliced_execution"):
+            execution.cancel()
+    
+    execution_status()
+
+# Stage the selected basket for a scheduled release and follow staged releases
+def scheduled_release_section(selected_stocks, order_type, gtt_details, is_dry_run):
+    scheduler = get_release_scheduler()
+    api_order_type = "GTT" if order_type == "GTT (Good Till Triggered)" else order_type
+    
+    st.write("Symbols, quantities and order parameters are validated and built now; "
+             "at the release time the prepared orders are sent without any further work.")
+    
+    default_release = next_market_open()
+    date_col, time_col = st.columns(2)
+    with date_col:
+        release_date = st.date_input("Release date", value=default_release.date(), key="release_date")
+    with time_col:
+        release_time = st.time_input("Release time (IST)", value=default_release.time(), step=60, key="release_time")
+    
+    release_at = datetime.datetime.combine(release_date, release_time, tzinfo=zoneinfo.ZoneInfo(MARKET_TIMEZONE))
+    
+    confirmed = True
+    if not is_dry_run:
+        confirmed = st.checkbox(f"I confirm that REAL {api_order_type} orders will be placed at the release time", key="release_confirm")
+    
+    if selected_stocks is None:
+        st.info("Compute limit prices above before staging LIMIT orders.")
+    elif st.button(f"Stage {len(selected_stocks)} Orders{' (Dry Run)' if is_dry_run else ''}"):
+        if release_at.timestamp() <= time.time():
+            st.error("The release time must be in the future.")
+        elif not confirmed:
+            st.error("Please confirm the real orders before staging them.")
+        else:
+            with st.spinner("Validating and preparing orders..."):
+                load_session_instruments()
+                requests, problems = stage_order_requests(
+                    st.session_state.kite, fill_missing_prices(st.session_state.kite, selected_stocks),
+                    api_order_type, gtt_details, st.session_state, StreamlitReporter()
+                )
+            
+            for problem in problems:
+                st.warning(problem)
+            
+            if requests:
+                job = scheduler.stage(st.session_state.username, st.session_state.kite, requests, release_at.timestamp(), api_order_type, is_dry_run)
+                st.success(f"Staged {len(requests)} orders for release at {release_at.strftime('%Y-%m-%d %H:%M:%S %Z')} (release #{job.job_id})")
+            else:
+                st.error("No orders could be staged.")
+    
+    remote_releases_section()
+    
+    jobs = scheduler.jobs(st.session_state.username)
+    if not jobs:
+        return
+    
+    pending = any(job.status in ('staged', 'warming', 'releasing') for job in jobs)
+    
+    # Refreshes every second while a release is pending so the countdown and results appear on their own
+    @st.fragment(run_every=1.0 if pending else None)
+    def staged_releases():
+        mark_session_active()
+        jobs = scheduler.jobs(st.session_state.username)
+        if pending and not any(job.status in ('staged', 'warming', 'releasing') for job in jobs):
+            # Full rerun stops the periodic refresh
+            st.rerun()
+        
+        for job in jobs:
+            release_label = datetime.datetime.fromtimestamp(job.release_at, zoneinfo.ZoneInfo(MARKET_TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+            mode = "dry run" if job.dry_run else "REAL"
+            st.write(f"**Release #{job.job_id}** - {len(job.requests)} {job.order_type} orders ({mode}) at {release_label}: {job.status}")
+            
+            if job.status in ('staged', 'warming'):
+                st.caption(f"Releasing in {max(0, job.release_at - time.time()):.0f}s{' (connection warmed)' if job.warmed else ''}")
+                if st.button("Cancel", key=f"cancel_release_{job.job_id}"):
+                    scheduler.cancel(job.job_id)
+                    st.rerun()
+            elif job.status == 'done':
+                latency = job.latency
+                lat_col1, lat_col2, lat_col3 = st.columns(3)
+                lat_col1.metric("Start delay", f"{(job.released_at - job.release_at) * 1000:.0f} ms")
+                lat_col2.metric("First ack", f"{latency['first_ack'] * 1000:.0f} ms" if latency['first_ack'] is not None else "-")
+                lat_col3.metric("Release to last ack", f"{latency['last_ack'] * 1000:.0f} ms" if latency['last_ack'] is not None else "-")
+                
+                if st.button("Show in Order Results", key=f"load_release_{job.job_id}"):
+                    orders_df = job.orders_df
+                    successful = int((orders_df['Order ID'] != 'Failed').sum())
+                    st.session_state.orders_result = {
+                        "successful": successful,
+                        "failed": len(orders_df) - successful,
+                        "orders_df": orders_df,
+                        "is_dry_run": job.dry_run,
+                        "order_type": job.order_type,
+                        "timestamp": datetime.datetime.fromtimestamp(job.released_at).strftime("%Y-%m-%d %H:%M:%S")
+                    }
+                    st.session_state.order_reconciler = None
+                    if not job.dry_run and job.order_type != "GTT":
+                        start_order_tracking(orders_df)
+                    discard_release(scheduler, job)
+                    st.rerun()
+            elif job.status == 'failed':
+                st.error(f"Release failed: {job.error}")
+            
+            if job.status in ('cancelled', 'failed') and st.button("Dismiss", key=f"dismiss_release_{job.job_id}"):
+                discard_release(scheduler, job)
+                st.rerun()
+    
+    staged_releases()
+
+# Releases this user staged on other replicas (they run, and are managed, there)
+def remote_releases_section():
+    backend = shared_state()
+    if backend is None:
+        return
+    
+    try:
+        remote_jobs = [job for job in backend.jobs(st.session_state.username) if job['replica'] != REPLICA_ID]
+    except Exception as e:
+        logger.error(f"Error reading shared release status: {str(e)}")
+        return
+    
+    for job in sorted(remote_jobs, key=lambda job: job['release_at']):
+        release_label = datetime.datetime.fromtimestamp(job['release_at'], zoneinfo.ZoneInfo(MARKET_TIMEZONE)).strftime('%Y-%m-%d %H:%M:%S')
+        mode = "dry run" if job['dry_run'] else "REAL"
+        st.write(f"**Release #{job['job_id']}** on {job['replica']} - {job['orders']} {job['order_type']} orders ({mode}) at {release_label}: {job['status']}")
+        if job['error']:
+            st.caption(f"Error: {job['error']}")
+
 # Navigation and Main Menu
 def main_menu():
     # Sidebar for navigation
@@ -1707,20 +3047,26 @@ def main_menu():
             ["1. Zerodha Login", "2. Upload CSV", "3. Select Stocks", "4. Review & Order", "User Profile"]
         )
         
-        if option == "1. Zerodha Login":
-            st.session_state.page = "zerodha_login"
-        elif option == "2. Upload CSV":
-            st.session_state.page = "upload_csv"
-        elif option == "3. Select Stocks":
-            st.session_state.page = "select_stocks"
-        elif option == "4. Review & Order":
-            st.session_state.page = "review_order"
-        elif option == "User Profile":
-            st.session_state.page = "profile"
+        # Only navigate when the selection changes, so pages opened from
+        # buttons (e.g. the admin dashboard) survive the next rerun
+        if option != st.session_state.get('nav_option'):
+            st.session_state.nav_option = option
+            
+            if option == "1. Zerodha Login":
+                st.session_state.page = "zerodha_login"
+            elif option == "2. Upload CSV":
+                st.session_state.page = "upload_csv"
+            elif option == "3. Select Stocks":
+                st.session_state.page = "select_stocks"
+            elif option == "4. Review & Order":
+                st.session_state.page = "review_order"
+            elif option == "User Profile":
+                st.session_state.page = "profile"
         
         # Logout button
         if st.button("Logout"):
             # Clear session state
+            discard_evicted_artifacts()
             for key in list(st.session_state.keys()):
                 del st.session_state[key]
             
@@ -1737,20 +3083,32 @@ def main_menu():
         else:
             st.warning("⚠️ Not Authenticated")
             
-        if st.session_state.stocks_df is not None:
+        if st.session_state.basket is not None:
             st.success("✅ CSV Uploaded")
         else:
             st.warning("⚠️ CSV Not Uploaded")
             
-        if st.session_state.selected_stocks is not None:
-            st.success(f"✅ {len(st.session_state.selected_stocks)} Stocks Selected")
+        selected_stocks = get_selected_stocks()
+        if selected_stocks is not None:
+            st.success(f"✅ {len(selected_stocks)} Stocks Selected")
         else:
             st.warning("⚠️ No Stocks Selected")
+        
+        # Memory held by this session's baskets and caches
+        memory_usage = session_memory_usage()
+        if memory_usage:
+            st.caption(f"Session memory: {format_bytes(sum(memory_usage.values()))}")
 
 # Main app flow
 def main():
-    # Initialize user database if it doesn't exist
-    initialize_user_db()
+    # Open the user database once per server process, creating it if needed
+    get_user_store()
+    
+    # Memory accounting and idle-session eviction
+    track_session()
+    
+    # Push-based order updates, if configured
+    start_order_postback_receiver()
     
     # Check authentication
     if not st.session_state.authenticated:
@@ -1760,6 +3118,13 @@ def main():
         if 'page' not in st.session_state:
             st.session_state.page = "zerodha_login"
         
+        # Map the shared instrument lists once Kite is connected (a running
+        # warm-up is already loading them in the background)
+        if not collect_session_warmup():
+            load_session_instruments()
+        else:
+            poll_session_warmup()
+        
         # Display the main menu in the sidebar
         main_menu()
         
@@ -1776,6 +3141,9 @@ def main():
             review_order_page()
         elif st.session_state.page == "profile":
             user_profile_page()
+        
+        # Make basket changes from this run visible to other replicas
+        publish_shared_basket()
 
 # Run the app
 if __name__ == "__main__":
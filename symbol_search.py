@@ -0,0 +1,152 @@
+"""Symbol and company-name suggestions for the Add Stock inputs.
+
+A SymbolSearch is built once per instrument list refresh over the NSE
+equities, the exchange every order and quote in the app goes to.
+Completions come from two sorted key arrays searched with bisect, which
+answer prefix queries the way a trie would without a node per character:
+one of tradingsymbols and one of every word-suffix of the company names,
+so "BANK" finds HDFC BANK as well as BANKBARODA. When prefixes don't fill
+the list, a trigram index supplies fuzzy matches for typos ("RELIANSE",
+"INFOSIS"): the query's trigrams are looked up in postings arrays and
+counted with one np.bincount over the universe, and candidates are ranked
+by trigram similarity.
+"""
+import bisect
+import re
+
+from lazy_imports import lazy_import
+from symbols import instrument_frame, normalize_names
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Suggestions returned per query
+SUGGESTION_LIMIT = 10
+
+# Prefix matches looked at per key before ranking
+PREFIX_SCAN = 200
+
+# Trigram similarity (Dice, 0-1) below which fuzzy matches are dropped
+MIN_SIMILARITY = 0.4
+
+# Shorter queries only get prefix matches; their trigrams match too much
+FUZZY_MIN_LENGTH = 4
+
+def trigrams(text):
+    """Distinct trigrams of each word, padded so word starts count."""
+    grams = set()
+    for word in text.split():
+        padded = f"  {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+# Query in the form of the index keys
+def search_key(query):
+    key = str(query).strip().upper()
+    key = re.sub(r'^[A-Z]+:', '', key)
+    return re.sub(r'\.(NS|NSE|BO|BSE)$', '', key).strip()
+
+class SymbolSearch:
+    def __init__(self, instruments):
+        self.source = instruments
+        frame = instrument_frame(instruments, ['tradingsymbol', 'name', 'instrument_type'])
+        # Equities only
+        frame = frame[frame['instrument_type'] == 'EQ']
+        frame = frame.drop_duplicates('tradingsymbol').reset_index(drop=True)
+
+        self.symbols = frame['tradingsymbol'].astype(str).to_numpy()
+        self.names = frame['name'].fillna('').astype(str).to_numpy()
+        name_keys = normalize_names(frame['name']).to_numpy()
+
+        order = np.argsort(self.symbols, kind='stable')
+        self._symbol_keys = self.symbols[order].tolist()
+        self._symbol_ids = order
+
+        suffixes = []
+        for entry, name in enumerate(name_keys):
+            words = name.split()
+            suffixes.extend((' '.join(words[start:]), entry) for start in range(len(words)))
+        suffixes.sort()
+        self._name_keys = [suffix for suffix, _ in suffixes]
+        self._name_ids = np.array([entry for _, entry in suffixes], dtype='int64')
+
+        self._symbol_grams = self._trigram_index(self.symbols)
+        self._name_grams = self._trigram_index(name_keys)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    @staticmethod
+    def _trigram_index(texts):
+        """(postings, counts): trigram -> entry ids, and each entry's trigram count."""
+        grams, entries = [], []
+        for entry, text in enumerate(texts):
+            text_grams = trigrams(text)
+            grams.extend(text_grams)
+            entries.extend([entry] * len(text_grams))
+
+        counts = np.bincount(np.array(entries, dtype='int64'), minlength=len(texts))
+        codes, uniques = pd.factorize(pd.Series(grams, dtype=object))
+        # Group the entry ids by trigram in one sort instead of growing a list per trigram
+        order = np.argsort(codes, kind='stable')
+        postings = np.split(np.array(entries, dtype='int64')[order], np.cumsum(np.bincount(codes))[:-1])
+        return dict(zip(uniques, postings)), counts
+
+    def _prefixed(self, keys, ids, prefix):
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\uffff', start, min(len(keys), start + PREFIX_SCAN))
+        return ids[start:end]
+
+    def _similarity(self, index, grams):
+        """Dice similarity of every entry to a query's trigrams."""
+        postings, counts = index
+        hits = [postings[gram] for gram in grams if gram in postings]
+        if not hits:
+            return np.zeros(len(counts))
+        shared = np.bincount(np.concatenate(hits), minlength=len(counts))
+        return 2 * shared / (counts + len(grams))
+
+    def search(self, query, limit=SUGGESTION_LIMIT):
+        """Up to limit suggestions for a partly typed symbol or company name.
+
+        Returns a list of dicts with Symbol, Name and Matched By (exact,
+        symbol, name or fuzzy), best first.
+        """
+        key = search_key(query)
+        if not key or not len(self.symbols):
+            return []
+
+        ranked, seen = [], set()
+
+        def add(entries, matched_by):
+            # Shorter symbols first: a bare prefix most likely names the parent stock
+            for entry in sorted(entries, key=lambda entry: (len(self.symbols[entry]), self.symbols[entry])):
+                if entry not in seen:
+                    seen.add(entry)
+                    ranked.append((entry, matched_by))
+
+        # TradingView writes M&M and BAJAJ-AUTO as M_M and BAJAJ_AUTO
+        for prefix in dict.fromkeys([key, key.replace('_', '&'), key.replace('_', '-')]):
+            add(self._prefixed(self._symbol_keys, self._symbol_ids, prefix).tolist(), 'symbol')
+        exact = [position for position, (entry, _) in enumerate(ranked) if self.symbols[entry] in (key, key.replace('_', '&'), key.replace('_', '-'))]
+        if exact:
+            ranked.insert(0, (ranked.pop(exact[0])[0], 'exact'))
+        name_key = ' '.join(re.sub(r'\b(LTD|LIMITED)\b', ' ', re.sub(r'[^A-Z0-9 ]+', ' ', key)).split())
+        if name_key:
+            add(self._prefixed(self._name_keys, self._name_ids, name_key).tolist(), 'name')
+
+        if len(ranked) < limit and len(key) >= FUZZY_MIN_LENGTH:
+            grams = trigrams(key)
+            score = np.maximum(self._similarity(self._symbol_grams, grams), self._similarity(self._name_grams, grams))
+            count = min(limit * 2, len(score))
+            best = np.argpartition(-score, count - 1)[:count]
+            best = best[np.argsort(-score[best], kind='stable')]
+            for entry in best[score[best] >= MIN_SIMILARITY].tolist():
+                if entry not in seen:
+                    seen.add(entry)
+                    ranked.append((entry, 'fuzzy'))
+
+        return [
+            {'Symbol': self.symbols[entry], 'Name': self.names[entry], 'Matched By': matched_by}
+            for entry, matched_by in ranked[:limit]
+        ]
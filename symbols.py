@@ -0,0 +1,159 @@
+"""Normalize symbols from charting tools and resolve them to NSE instruments.
+
+Inputs come in many spellings: TradingView's NSE:RELIANCE and M_M,
+Yahoo's RELIANCE.NS / RELIANCE.BO, company names, and six-digit BSE scrip
+codes. parse_symbols splits a whole column of them into an exchange hint
+and a lookup key with vectorized string operations, and resolve_symbols
+maps the keys to instruments through hash joins against an
+InstrumentIndex, trying in turn:
+
+    1. the tradingsymbol itself
+    2. TradingView aliases ('_' for '&' or '-', e.g. M_M, BAJAJ_AUTO)
+    3. BSE scrip codes, through the BSE instrument list
+    4. the company name (punctuation and LTD/LIMITED ignored)
+
+Every input row gets a line in the resolution report saying how it was
+matched, or that it wasn't, so unresolved rows no longer pass silently
+with a zero price.
+"""
+import re
+
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+
+EXCHANGE_SUFFIXES = {'NS': 'NSE', 'NSE': 'NSE', 'BO': 'BSE', 'BSE': 'BSE'}
+
+REPORT_COLUMNS = ['Input', 'Symbol', 'Exchange', 'Instrument Token', 'Matched By', 'Status']
+
+# Company name in a comparable form: upper case, no punctuation, no LTD/LIMITED
+def normalize_names(names):
+    names = pd.Series(names, dtype=object).fillna('').astype(str).str.upper()
+    names = names.str.replace(r'[^A-Z0-9 ]+', ' ', regex=True)
+    names = names.str.replace(r'\b(LTD|LIMITED)\b', ' ', regex=True)
+    return names.str.split().str.join(' ')
+
+# DataFrame of instrument columns from a kite.instruments() list or a mapped table
+def instrument_frame(instruments, columns):
+    """Tables from instrument_store.py provide to_frame(), which decodes only
+    the requested columns instead of building a dict per instrument."""
+    if hasattr(instruments, 'to_frame'):
+        return instruments.to_frame(columns).reindex(columns=columns)
+    return pd.DataFrame(instruments or [], columns=columns)
+
+# Split raw symbols into an exchange hint and a lookup key
+def parse_symbols(symbols):
+    """Returns a DataFrame with Input, Exchange (NSE/BSE/None) and Key."""
+    raw = pd.Series(symbols, dtype=object).fillna('').astype(str)
+    cleaned = raw.str.strip().str.upper()
+
+    # NSE:RELIANCE, BSE:500325
+    prefixed = cleaned.str.extract(r'^([A-Z]+):(.+)$')
+    exchange = prefixed[0]
+    key = prefixed[1].fillna(cleaned)
+
+    # RELIANCE.NS, RELIANCE.BO
+    suffixed = key.str.extract(r'^(.+)\.(NS|NSE|BO|BSE)$')
+    exchange = exchange.fillna(suffixed[1].map(EXCHANGE_SUFFIXES))
+    key = suffixed[0].fillna(key).str.strip()
+
+    # Six-digit numbers are BSE scrip codes
+    exchange = exchange.mask(key.str.fullmatch(r'\d{6}') & exchange.isna(), 'BSE')
+
+    return pd.DataFrame({'Input': raw, 'Exchange': exchange.where(exchange.notna(), None), 'Key': key})
+
+# Parse a TradingView watchlist export into a basket frame
+def read_watchlist(text):
+    """TradingView exports are comma separated EXCHANGE:SYMBOL entries, with
+    ###SECTION markers between groups. Returns a DataFrame with a Symbol
+    column, in watchlist order."""
+    if isinstance(text, bytes):
+        text = text.decode('utf-8-sig')
+    entries = [entry.strip() for entry in re.split(r'[,\n]', text)]
+    symbols = [entry for entry in entries if entry and not entry.startswith('###')]
+    return pd.DataFrame({'Symbol': symbols})
+
+# Hash indexes over an instrument list, built once per list
+class InstrumentIndex:
+    def __init__(self, instruments):
+        self.source = instruments
+        frame = instrument_frame(instruments, ['instrument_token', 'exchange_token', 'tradingsymbol', 'name', 'instrument_type', 'exchange'])
+        # Equities first, so names and codes shared with other segments resolve to the stock
+        frame = frame.assign(_equity=frame['instrument_type'] != 'EQ').sort_values('_equity', kind='stable')
+        self.frame = frame.reset_index(drop=True)
+
+        symbols = self.frame['tradingsymbol'].astype(str)
+        self.by_symbol = pd.Series(self.frame.index, index=symbols)[~symbols.duplicated().to_numpy()]
+        names = normalize_names(self.frame['name'])
+        self.by_name = pd.Series(self.frame.index, index=names)[(~names.duplicated() & (names != '')).to_numpy()]
+        codes = self.frame['exchange_token'].astype(str)
+        self.by_code = pd.Series(self.frame.index, index=codes)[~codes.duplicated().to_numpy()]
+
+# Resolve raw symbols against the NSE instruments (and BSE ones for scrip codes)
+def resolve_symbols(symbols, index, bse_index=None):
+    """Returns the resolution report: one row per input with the resolved
+    NSE Symbol and Instrument Token (None when unresolved), the exchange
+    hint, how it matched and a Status of Resolved, Unresolved, Empty or
+    Duplicate (an earlier row resolved to the same instrument)."""
+    parsed = parse_symbols(symbols)
+    key = parsed['Key']
+    position = key.map(index.by_symbol)
+    matched_by = pd.Series(None, index=key.index, dtype=object).mask(position.notna(), 'symbol')
+
+    for alias in ('&', '-'):
+        missing = position.isna() & key.str.contains('_', regex=False)
+        if missing.any():
+            found = key[missing].str.replace('_', alias, regex=False).map(index.by_symbol)
+            position = position.fillna(found)
+            matched_by = matched_by.mask(missing & found.reindex(key.index).notna(), 'alias')
+
+    missing = position.isna() & key.str.fullmatch(r'\d{6}')
+    if missing.any() and bse_index is not None:
+        bse_rows = key[missing].map(bse_index.by_code).dropna().astype('int64')
+        bse_symbols = bse_index.frame['tradingsymbol'].to_numpy()[bse_rows.to_numpy()]
+        found = pd.Series(bse_symbols, index=bse_rows.index).map(index.by_symbol)
+        # Fall back to the company name when the BSE symbol differs from the NSE one
+        bse_names = normalize_names(bse_index.frame['name'].to_numpy()[bse_rows.to_numpy()])
+        found = found.fillna(pd.Series(bse_names.to_numpy(), index=bse_rows.index).map(index.by_name))
+        position = position.fillna(found)
+        matched_by = matched_by.mask(found.reindex(key.index).notna() & missing, 'bse code')
+
+    missing = position.isna()
+    if missing.any():
+        found = normalize_names(key[missing]).set_axis(key[missing].index).map(index.by_name)
+        position = position.fillna(found)
+        matched_by = matched_by.mask(missing & found.reindex(key.index).notna(), 'name')
+
+    resolved = position.notna()
+    rows = position[resolved].astype('int64').to_numpy()
+    report = pd.DataFrame({
+        'Input': parsed['Input'],
+        'Symbol': pd.Series(None, index=key.index, dtype=object),
+        'Exchange': parsed['Exchange'],
+        'Instrument Token': pd.Series(None, index=key.index, dtype=object),
+        'Matched By': matched_by,
+        'Status': 'Unresolved'
+    })
+    report.loc[resolved, 'Symbol'] = index.frame['tradingsymbol'].to_numpy()[rows]
+    report.loc[resolved, 'Instrument Token'] = index.frame['instrument_token'].to_numpy()[rows]
+    report.loc[resolved, 'Status'] = 'Resolved'
+    report.loc[resolved & report['Symbol'].duplicated(), 'Status'] = 'Duplicate'
+    report.loc[key == '', 'Status'] = 'Empty'
+    return report[REPORT_COLUMNS]
+
+# Rewrite a basket's Symbol column to resolved NSE symbols
+def normalize_basket_symbols(stocks_df, index, bse_index=None):
+    """Returns (stocks_df, report).
+
+    Resolved rows get their NSE tradingsymbol, unresolved rows keep their
+    parsed key (upper case, without exchange prefix or suffix), and empty
+    rows or rows that resolve to an instrument already in the basket are
+    dropped.
+    """
+    report = resolve_symbols(stocks_df['Symbol'], index, bse_index)
+    keys = parse_symbols(stocks_df['Symbol'])['Key']
+
+    stocks_df = stocks_df.reset_index(drop=True).copy()
+    stocks_df['Symbol'] = report['Symbol'].fillna(keys).to_numpy()
+    stocks_df = stocks_df[(~report['Status'].isin(['Duplicate', 'Empty'])).to_numpy()]
+    return stocks_df.reset_index(drop=True), report
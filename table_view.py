@@ -0,0 +1,99 @@
+"""Server-side windows over large basket and order tables.
+
+st.dataframe ships the whole frame to the browser, which for a 5,000-row
+screener basket dominates both rerun time and browser memory. table_window
+does the filtering, sorting and paging on the server and returns only the
+rows of one page, and table_totals summarizes the whole filtered table
+with column-wise aggregates, so only a page of rows is serialized.
+
+Filtering is a case-insensitive substring match over the text columns.
+Categorical columns (Symbol and Name in baskets) are matched once per
+distinct value and the result mapped through the codes. Sorting only
+orders the row positions; the frame itself is sliced once, at the end.
+"""
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+# Rows per page of a paged table
+TABLE_PAGE_SIZE = 50
+
+# Rows matching a filter in any text column
+def filter_mask(df, query):
+    """Boolean array, True for rows where some text column contains query
+    (case-insensitive). An empty query matches every row."""
+    query = str(query or '').strip().lower()
+    if not query:
+        return np.ones(len(df), dtype=bool)
+
+    mask = np.zeros(len(df), dtype=bool)
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            # One test per category instead of one per row
+            hits = column.cat.categories.astype(str).str.lower().str.contains(query, regex=False)
+            codes = column.cat.codes.to_numpy()
+            mask |= (codes >= 0) & np.append(np.asarray(hits, dtype=bool), False)[codes]
+        elif pd.api.types.is_object_dtype(column.dtype) or pd.api.types.is_string_dtype(column.dtype):
+            mask |= column.astype(str).str.lower().str.contains(query, regex=False).fillna(False).to_numpy(dtype=bool)
+    return mask
+
+# Sort key for a column without missing values: categories by label, everything else as is
+def _sort_values(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        labels = column.cat.categories.astype(str)
+        # Rank of each category's label
+        rank = np.argsort(np.argsort(labels.to_numpy(), kind='stable'), kind='stable')
+        codes = column.cat.codes.to_numpy()
+        return np.where(codes >= 0, np.append(rank, 0)[codes], len(labels)).astype('int64')
+    if pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype):
+        return column.to_numpy(dtype='float64', na_value=np.nan)
+    return column.astype(str).to_numpy()
+
+# One page of a filtered, sorted table
+def table_window(df, query="", sort_by=None, ascending=True, page=1, page_size=TABLE_PAGE_SIZE):
+    """Returns (window, positions): the rows of page (1-based, clamped to
+    the last page) and the positions of every matching row in display
+    order, from which callers get the match count and totals."""
+    positions = np.flatnonzero(filter_mask(df, query))
+
+    if sort_by is not None and sort_by in df.columns and len(positions):
+        column = df[sort_by].iloc[positions]
+        # Missing values last in both directions, whatever the dtype
+        missing = column.isna().to_numpy(dtype=bool)
+        present = np.flatnonzero(~missing)
+        values = _sort_values(column.iloc[present])
+        if ascending:
+            order = np.argsort(values, kind='stable')
+        else:
+            # Sorting the reversed values keeps ties in table order
+            order = (len(values) - 1 - np.argsort(values[::-1], kind='stable'))[::-1]
+        positions = np.concatenate([positions[present[order]], positions[missing]])
+
+    pages = max(1, -(-len(positions) // page_size))
+    page = min(max(1, int(page)), pages)
+    window = df.iloc[positions[(page - 1) * page_size:page * page_size]]
+    return window, positions
+
+# Totals over the rows at positions (the whole filtered table, not a page)
+def table_totals(df, positions=None):
+    """Dict of label -> value: Rows, Selected, Quantity and Value (price
+    times quantity) when the columns exist, and the row count per Status
+    (rows without one counted as No Status, so the counts add up to Rows)."""
+    rows = df if positions is None else df.iloc[positions]
+    totals = {'Rows': len(rows)}
+
+    if 'Selected' in rows.columns:
+        totals['Selected'] = int(rows['Selected'].to_numpy(dtype=bool).sum())
+    if 'Quantity' in rows.columns:
+        quantity = pd.to_numeric(rows['Quantity'], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+        totals['Quantity'] = int(np.nansum(quantity))
+        for price_column in ('Price', 'FetchedPrice'):
+            if price_column in rows.columns:
+                price = pd.to_numeric(rows[price_column], errors='coerce').to_numpy(dtype='float64', na_value=np.nan)
+                totals['Value'] = float(np.nansum(price * quantity))
+                break
+    if 'Status' in rows.columns:
+        totals.update(rows['Status'].astype(str).fillna('No Status').value_counts(dropna=False).to_dict())
+    return totals
@@ -0,0 +1,132 @@
+"""Encrypted cache of Kite access tokens, shared by every app replica.
+
+A Kite access token stays valid until the daily reset at 06:00 IST, so a
+user who has logged in once that day doesn't need to go through the
+request token flow again: a new session, or a worker that restarted,
+rebuilds KiteConnect from the cached token with set_access_token.
+
+Tokens are stored in the state backend (see state_backend.py) under a key
+per username and API key, encrypted with Fernet (AES-128-CBC plus an
+HMAC), and expire at the next reset. The encryption key comes from the
+TOKEN_CACHE_KEY environment variable or, failing that, a key file that is
+created on first use (readable by the owner only). Replicas on several
+hosts must all be given the same key.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import os
+import time
+
+from lazy_imports import lazy_import
+from state_backend import KITE_TIMEZONE, KITE_TOKEN_RESET_TIME, key_segment, token_expiry
+
+fernet = lazy_import('cryptography.fernet')
+
+logger = logging.getLogger('zerodha_trading_tool.tokens')
+
+TOKEN_CACHE_KEY_FILE = os.environ.get("TOKEN_CACHE_KEY_FILE", "token_cache.key")
+
+# Fields of the old plaintext token record in the user database
+PLAINTEXT_TOKEN_FIELDS = ("zerodha_access_token", "zerodha_token_api_key", "zerodha_token_date")
+
+# Fernet cipher from TOKEN_CACHE_KEY, or the key file (created if missing)
+def load_cipher(key=None, key_file=TOKEN_CACHE_KEY_FILE):
+    key = key or os.environ.get("TOKEN_CACHE_KEY")
+    if not key:
+        try:
+            # O_EXCL: if several workers start together, only one key is written
+            fd = os.open(key_file, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(fernet.Fernet.generate_key())
+            logger.info(f"Created token cache key {key_file}")
+        except FileExistsError:
+            pass
+        with open(key_file, 'rb') as f:
+            key = f.read().strip()
+    return fernet.Fernet(key)
+
+class TokenCache:
+    def __init__(self, backend, cipher):
+        self.backend = backend
+        self.cipher = cipher
+
+    @staticmethod
+    def _key(username, api_key=""):
+        # The API key only appears hashed in the backend's key space
+        suffix = hashlib.sha256(api_key.encode()).hexdigest()[:16] if api_key else ""
+        return f"token:{key_segment(username)}:{suffix}"
+
+    def _records(self, keys):
+        """(key, record) for each key; record is None if it can't be decrypted."""
+        for key in keys:
+            data = self.backend.get(key)
+            if data is not None:
+                yield key, self._decrypt(data)
+
+    def _decrypt(self, data):
+        try:
+            return json.loads(self.cipher.decrypt(data))
+        except fernet.InvalidToken:
+            # Written with another key (rotated, or a replica misconfigured)
+            return None
+
+    def save(self, username, api_key, access_token, expires_at=None):
+        """Cache a token until expires_at (default: Kite's next daily reset)."""
+        expires_at = expires_at or token_expiry()
+        record = {'username': username, 'api_key': api_key, 'access_token': access_token, 'saved_at': time.time(), 'expires_at': expires_at}
+        self.backend.set(self._key(username, api_key), self.cipher.encrypt(json.dumps(record).encode()), ttl=expires_at - time.time())
+
+    def load(self, username, api_key=None):
+        """The {'api_key', 'access_token', 'saved_at', 'expires_at'} record
+        for username (and api_key, if given; otherwise the newest), or None."""
+        keys = [self._key(username, api_key)] if api_key else self.backend.keys(self._key(username))
+        records = [
+            record for _, record in self._records(keys)
+            # Never hand out a token cached for another user
+            if record is not None and record['username'] == username and record['expires_at'] > time.time()
+        ]
+        return max(records, key=lambda record: record['saved_at']) if records else None
+
+    def delete(self, username, api_key=None):
+        """Tokens that can't be decrypted are deleted too; they are useless."""
+        keys = [self._key(username, api_key)] if api_key else self.backend.keys(self._key(username))
+        for key, record in self._records(keys):
+            if record is None or record['username'] == username:
+                self.backend.delete(key)
+
+    def valid_tokens(self):
+        """The newest valid record of every user, by username."""
+        tokens = {}
+        for key, record in self._records(self.backend.keys("token:")):
+            # A record must sit under its own user's key
+            if record is None or record['expires_at'] <= time.time() or key != self._key(record['username'], record['api_key']):
+                continue
+            if record['username'] not in tokens or record['saved_at'] > tokens[record['username']]['saved_at']:
+                tokens[record['username']] = record
+        return tokens
+
+    def migrate_plaintext(self, users):
+        """Move tokens from plaintext user records into the cache.
+
+        Tokens issued on their recorded date are still valid until the
+        reset after it; those are cached, the rest dropped. The plaintext
+        fields are removed from users in place; returns how many users
+        changed.
+        """
+        changed = 0
+        for username, data in users.items():
+            if not any(field in data for field in PLAINTEXT_TOKEN_FIELDS):
+                continue
+            token, api_key, token_date = (data.pop(field, None) for field in PLAINTEXT_TOKEN_FIELDS)
+            changed += 1
+            if not token or not api_key or not token_date:
+                continue
+            # The latest a token from that date can live is the next day's reset
+            issued = datetime.datetime.combine(datetime.date.fromisoformat(token_date), KITE_TOKEN_RESET_TIME, tzinfo=KITE_TIMEZONE)
+            expires_at = token_expiry(issued)
+            if expires_at > time.time():
+                self.save(username, api_key, token, expires_at)
+                logger.info(f"Moved the access token of {username} into the encrypted token cache")
+        return changed
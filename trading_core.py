@@ -0,0 +1,926 @@
+"""Trading pipeline shared by the Streamlit app and batch_runner.py.
+
+Reading a basket CSV, fetching quotes, sizing quantities and placing
+orders live here without any Streamlit calls. Progress and user-facing
+messages go through a Reporter, so the same functions drive the web UI,
+the command line or nothing at all.
+"""
+import datetime
+import hashlib
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from basket import normalize_basket, to_numeric
+from symbols import InstrumentIndex, instrument_frame, normalize_basket_symbols, parse_symbols, read_watchlist, resolve_symbols
+from symbol_search import SymbolSearch
+from lazy_imports import lazy_import
+
+pd = lazy_import('pandas')
+np = lazy_import('numpy')
+
+logger = logging.getLogger('zerodha_trading_tool.core')
+
+# Orders per second sent to a single account (Kite allows up to 10)
+ORDER_RATE_LIMIT = 5
+
+# Append-only log of order placements and status changes
+ORDER_JOURNAL_FILE = "order_journal.jsonl"
+
+# Legs sent per basket margin call
+MARGIN_BATCH_SIZE = 50
+
+# Instruments per quote call (Kite allows up to 500)
+QUOTE_BATCH_SIZE = 500
+
+# Tick size assumed for NSE equities missing from the instrument list
+DEFAULT_TICK_SIZE = 0.05
+
+# Canonical dtypes for the order results frame returned by place_orders
+ORDERS_DTYPES = {
+    'Symbol': 'category',
+    'Quantity': 'int32',
+    'Price': 'float32',
+    'Estimated Cost': 'float32',
+    'Status': 'category',
+    'Order Type': 'category',
+    'Filled Qty': 'int32',
+    'Avg Price': 'float32',
+    'Account': 'category',
+    'Ack (ms)': 'float32',
+    'Slices': 'int32',
+    'Sent Qty': 'int32',
+    'Side': 'category'
+}
+
+# Receives progress and messages from the pipeline functions
+class Reporter:
+    """Default reporter: messages go to the log and progress is ignored.
+
+    Front ends subclass this (see StreamlitReporter in streamlit_app.py and
+    ConsoleReporter in batch_runner.py).
+    """
+
+    def progress(self, done, total, message=""):
+        pass
+
+    def info(self, message):
+        logger.info(message)
+
+    def warning(self, message):
+        logger.warning(message)
+
+    def error(self, message):
+        logger.error(message)
+
+# Apply the canonical schema to an order results DataFrame
+def normalize_orders(df):
+    if df is None or df.empty:
+        return df
+
+    df = df.reset_index(drop=True)
+
+    for col, dtype in ORDERS_DTYPES.items():
+        if col not in df.columns:
+            continue
+        if dtype == 'category':
+            df[col] = df[col].astype(str).astype('category')
+        elif dtype == 'int32':
+            df[col] = to_numeric(df[col]).fillna(0).astype('int32')
+        else:
+            df[col] = to_numeric(df[col]).astype(dtype)
+
+    return df
+
+# Function to read CSV
+def read_csv(uploaded_file, reporter=None):
+    """Reads a basket CSV, or a TradingView watchlist export (.txt)."""
+    reporter = reporter or Reporter()
+    try:
+        name = getattr(uploaded_file, 'name', uploaded_file)
+        if isinstance(name, str) and name.lower().endswith('.txt'):
+            if isinstance(uploaded_file, str):
+                with open(uploaded_file, encoding='utf-8-sig') as f:
+                    df = read_watchlist(f.read())
+            else:
+                df = read_watchlist(uploaded_file.read())
+        else:
+            df = pd.read_csv(uploaded_file)
+        logger.info(f"Successfully read {len(df)} stocks from CSV")
+        
+        # Verify required columns exist
+        required_columns = ['Symbol']
+        missing_columns = [col for col in required_columns if col not in df.columns]
+        
+        if missing_columns:
+            logger.error(f"Missing required columns: {missing_columns}")
+            reporter.error(f"The CSV file is missing these required columns: {missing_columns}")
+            reporter.info("The CSV must contain at least a 'Symbol' column.")
+            return None
+            
+        # Add a Quantity column if it doesn't exist
+        if 'Quantity' not in df.columns:
+            df['Quantity'] = 1
+        
+        # Add a Selected column
+        df['Selected'] = True
+        
+        return normalize_basket(df)
+        
+    except Exception as e:
+        logger.error(f"Error reading CSV file: {str(e)}")
+        reporter.error(f"Error reading CSV file: {str(e)}")
+        return None
+
+# Hash index over the cached NSE instrument list, rebuilt when the list changes
+def instrument_index(cache, key='available_instruments'):
+    index = cache.get(f'{key}_index')
+    if index is None or index.source is not cache[key]:
+        index = InstrumentIndex(cache[key])
+        cache[f'{key}_index'] = index
+    return index
+
+# Resolve a basket's symbols to NSE tradingsymbols, with a per-row report
+def resolve_basket_symbols(kite, stocks_df, cache=None, reporter=None):
+    """Returns (stocks_df, report); see symbols.normalize_basket_symbols.
+
+    The BSE instrument list is only downloaded when the basket has BSE
+    scrip codes in it.
+    """
+    if cache is None:
+        cache = {}
+    reporter = reporter or Reporter()
+    
+    if cache.get('available_instruments') is None:
+        cache['available_instruments'] = kite.instruments("NSE")
+    
+    bse_index = None
+    if parse_symbols(stocks_df['Symbol'])['Key'].str.fullmatch(r'\d{6}').any():
+        if cache.get('bse_instruments') is None:
+            try:
+                cache['bse_instruments'] = kite.instruments("BSE")
+            except Exception as e:
+                logger.error(f"Error fetching BSE instruments: {str(e)}")
+                reporter.warning("Could not fetch the BSE instrument list; BSE scrip codes were not resolved.")
+        if cache.get('bse_instruments') is not None:
+            bse_index = instrument_index(cache, 'bse_instruments')
+    
+    stocks_df, report = normalize_basket_symbols(stocks_df, instrument_index(cache), bse_index)
+    
+    unresolved = report[report['Status'] == 'Unresolved']
+    if len(unresolved):
+        reporter.warning(f"{len(unresolved)} symbols could not be matched to an NSE instrument: {', '.join(unresolved['Input'].head(10))}")
+    duplicates = int((report['Status'] == 'Duplicate').sum())
+    if duplicates:
+        reporter.info(f"Dropped {duplicates} rows that resolve to a stock already in the list")
+    
+    return normalize_basket(stocks_df), report
+
+# Suggestion index over the NSE equities, rebuilt when the list changes
+def symbol_search(kite, cache=None):
+    """Orders and quotes all go to NSE, so BSE-only stocks aren't suggested."""
+    if cache is None:
+        cache = {}
+    
+    if cache.get('available_instruments') is None:
+        cache['available_instruments'] = kite.instruments("NSE")
+    
+    search = cache.get('symbol_search')
+    if search is None or search.source is not cache['available_instruments']:
+        search = SymbolSearch(cache['available_instruments'])
+        cache['symbol_search'] = search
+    return search
+
+# Function to get account balance
+def get_account_balance(kite):
+    try:
+        # Get margins
+        margins = kite.margins()
+        
+        # Log full margins response for debugging
+        logger.info(f"Full margins response: {json.dumps(margins)}")
+        
+        balance_info = {}
+        
+        # Check for 'equity' segment in margins
+        if 'equity' in margins:
+            equity = margins['equity']
+            
+            # Check for 'available' dict in equity
+            if 'available' in equity and isinstance(equity['available'], dict):
+                available = equity['available']
+                
+                # Check for 'cash' in available
+                if 'cash' in available:
+                    balance_info['Available Cash'] = available['cash']
+            
+            # Check for 'utilized' dict in equity
+            if 'utilized' in equity and isinstance(equity['utilized'], dict):
+                utilized = equity['utilized']
+                
+                # Check for 'debits' in utilized
+                if 'debits' in utilized:
+                    balance_info['Used Margin'] = utilized['debits']
+        
+        return balance_info
+            
+    except Exception as e:
+        logger.error(f"Error retrieving account balance: {str(e)}")
+        return None
+
+# Function to fetch stock details from Zerodha with better permission handling
+def fetch_stock_details(kite, symbol, cache=None, reporter=None):
+    """Instrument and quote details for symbol.
+
+    The NSE instrument list is fetched once and kept in
+    cache['available_instruments'] (the app passes st.session_state; the
+    batch runner a plain dict).
+    """
+    if cache is None:
+        cache = {}
+    reporter = reporter or Reporter()
+    
+    try:
+        # Try to search in the available instruments
+        if cache.get('available_instruments') is None:
+            try:
+                cache['available_instruments'] = kite.instruments("NSE")
+            except Exception as e:
+                logger.error(f"Error fetching instruments: {str(e)}")
+                reporter.warning("Could not fetch instruments list from Zerodha. Using limited functionality.")
+                return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
+        
+        # Accept NSE:X, X.NS, M_M, company names and the like
+        index = instrument_index(cache)
+        resolved = resolve_symbols([symbol], index)['Symbol'].iloc[0]
+        
+        # Unresolved symbols come back as None or NaN
+        if pd.notna(resolved):
+            instrument = index.frame.iloc[int(index.by_symbol[resolved])].to_dict()
+            symbol = instrument['tradingsymbol']
+            
+            # Fetch the latest quote
+            try:
+                quote = kite.quote(f"NSE:{symbol}")
+                
+                if f"NSE:{symbol}" in quote:
+                    quote_data = quote[f"NSE:{symbol}"]
+                    
+                    return {
+                        'Symbol': instrument['tradingsymbol'],
+                        'Name': instrument['name'],
+                        'Exchange': instrument['exchange'],
+                        'ISIN': instrument.get('isin', 'N/A'),
+                        'LastPrice': quote_data.get('last_price', 0),
+                        'Change': quote_data.get('net_change', 0),
+                        'PctChange': round(quote_data.get('net_change', 0) / quote_data.get('last_price', 1) * 100, 2) if quote_data.get('last_price') else 0,
+                        'Volume': quote_data.get('volume', 0),
+                        'AvgPrice': quote_data.get('average_price', 0),
+                        'OHLC': {
+                            'open': quote_data.get('ohlc', {}).get('open', 0),
+                            'high': quote_data.get('ohlc', {}).get('high', 0),
+                            'low': quote_data.get('ohlc', {}).get('low', 0),
+                            'close': quote_data.get('ohlc', {}).get('close', 0)
+                        }
+                    }
+            except Exception as quote_error:
+                logger.error(f"Error fetching quote for {symbol}: {str(quote_error)}")
+                
+                if "Insufficient permission" in str(quote_error):
+                    reporter.warning(f"⚠️ Your Zerodha API key doesn't have permission to fetch quotes. You'll need to manually enter prices or upgrade your API permissions.")
+                
+                # Return basic info without quote data
+                return {
+                    'Symbol': instrument['tradingsymbol'],
+                    'Name': instrument['name'],
+                    'Exchange': instrument['exchange'],
+                    'ISIN': instrument.get('isin', 'N/A'),
+                    'LastPrice': 0,  # Set to 0 since we can't get the price
+                    'Volume': 0,
+                    'PctChange': 0
+                }
+        else:
+            logger.warning(f"Instrument not found for symbol: {symbol}")
+            return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
+                
+    except Exception as e:
+        logger.error(f"Error fetching stock details for {symbol}: {str(e)}")
+        return {"Symbol": symbol, "Name": symbol, "LastPrice": 0}
+
+# Throttle calls so a single account stays under the broker's rate limit
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart; safe to share across threads"""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        
+        if slot > now:
+            time.sleep(slot - now)
+
+# Build the API call for a single order without sending it
+def build_order_request(kite, symbol, quantity, order_type="MARKET", gtt_details=None, price=None, side="BUY"):
+    """Returns {'symbol', 'quantity', 'order_type', 'method', 'params'}.
+
+    method is the KiteConnect method to call ('place_order' or 'place_gtt')
+    and params its keyword arguments, so a request can be validated and
+    staged ahead of time and sent later by send_order_request. LIMIT
+    orders need price (see compute_limit_prices). side is "BUY" or "SELL";
+    GTT orders are always buys.
+    """
+    if side not in ("BUY", "SELL"):
+        raise ValueError(f"Unsupported side: {side}")
+    if side == "SELL" and order_type == "GTT":
+        raise ValueError("GTT orders can only buy")
+    transaction_type = kite.TRANSACTION_TYPE_SELL if side == "SELL" else kite.TRANSACTION_TYPE_BUY
+    
+    if order_type == "MARKET":
+        # Market order
+        method = 'place_order'
+        params = dict(
+            variety=kite.VARIETY_REGULAR,
+            exchange=kite.EXCHANGE_NSE,
+            tradingsymbol=symbol,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            order_type=kite.ORDER_TYPE_MARKET,
+            product=kite.PRODUCT_CNC  # CNC for delivery
+        )
+    elif order_type == "LIMIT":
+        # Regular limit order
+        if price is None or pd.isna(price) or price <= 0:
+            raise ValueError("Limit price must be greater than zero")
+        
+        method = 'place_order'
+        params = dict(
+            variety=kite.VARIETY_REGULAR,
+            exchange=kite.EXCHANGE_NSE,
+            tradingsymbol=symbol,
+            transaction_type=transaction_type,
+            quantity=quantity,
+            order_type=kite.ORDER_TYPE_LIMIT,
+            price=round(float(price), 2),
+            product=kite.PRODUCT_CNC
+        )
+    elif order_type == "GTT":
+        # GTT order
+        if gtt_details and 'trigger_price' in gtt_details and 'limit_price' in gtt_details:
+            trigger_price = gtt_details['trigger_price'].get(symbol, 0)
+            limit_price = gtt_details['limit_price'].get(symbol, 0)
+        
+            if trigger_price <= 0 or limit_price <= 0:
+                raise ValueError("Trigger price and limit price must be greater than zero")
+        
+            method = 'place_gtt'
+            params = {
+                "trigger_type": kite.GTT_TYPE_SINGLE,
+                "tradingsymbol": symbol,
+                "exchange": kite.EXCHANGE_NSE,
+                "trigger_values": [trigger_price],
+                "last_price": trigger_price,
+                "orders": [{
+                    "transaction_type": kite.TRANSACTION_TYPE_BUY,
+                    "quantity": quantity,
+                    "price": limit_price,
+                    "order_type": kite.ORDER_TYPE_LIMIT,
+                    "product": kite.PRODUCT_CNC
+                }]
+            }
+        else:
+            raise ValueError("GTT details missing trigger_price or limit_price")
+    else:
+        raise ValueError(f"Unsupported order type: {order_type}")
+    
+    return {'symbol': symbol, 'quantity': quantity, 'order_type': order_type, 'method': method, 'params': params}
+
+# Send a request from build_order_request and return its order (or GTT trigger) id
+def send_order_request(kite, request):
+    response = getattr(kite, request['method'])(**request['params'])
+    # place_gtt answers {'trigger_id': ...}; place_order the bare order id
+    return response['trigger_id'] if isinstance(response, dict) else response
+
+# Send a single order to Zerodha and return its order (or GTT trigger) id
+def submit_order(kite, symbol, quantity, order_type="MARKET", gtt_details=None, price=None, side="BUY"):
+    return send_order_request(kite, build_order_request(kite, symbol, quantity, order_type, gtt_details, price, side))
+
+# Function to place orders
+def place_orders(kite, stocks_df, order_type="MARKET", dry_run=True, gtt_details=None, rate_limiter=None, reporter=None, cache=None):
+    """Places one order per row, in row order; returns (successful, failed, orders_df).
+
+    Rows are buys unless stocks_df has a Side column (see rebalance.py),
+    in which case the results carry it too.
+    """
+    has_side = 'Side' in stocks_df.columns
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(ORDER_RATE_LIMIT)
+    reporter = reporter or Reporter()
+    if cache is None:
+        cache = {}
+    
+    successful_orders = 0
+    failed_orders = 0
+    orders_info = []
+    
+    total_stocks = len(stocks_df)
+    for i, (_, row) in enumerate(stocks_df.iterrows()):
+        try:
+            symbol = row['Symbol']
+            quantity = int(row['Quantity'])
+            
+            # Update progress
+            reporter.progress(i + 1, total_stocks, f"Processing {i+1} of {total_stocks}: {symbol}")
+            
+            limit_price = row['Limit Price'] if order_type == "LIMIT" and 'Limit Price' in row else None
+            side = str(row['Side']) if has_side else "BUY"
+            
+            if dry_run:
+                if order_type == "LIMIT" and (limit_price is None or pd.isna(limit_price)):
+                    raise ValueError("No limit price")
+                logger.info(f"[DRY RUN] Would place {order_type} {side} order for {quantity} shares of {symbol}")
+                order_id = f"dry-run-{successful_orders+1}"
+                successful_orders += 1
+            else:
+                rate_limiter.wait()
+                order_id = submit_order(kite, symbol, quantity, order_type, gtt_details, limit_price, side)
+                
+                logger.info(f"Successfully placed {order_type} {side} order for {quantity} shares of {symbol}, Order ID: {order_id}")
+                successful_orders += 1
+            
+            # Get price from the row if available (missing prices are NaN); limit orders cost at most their limit
+            price = limit_price if limit_price is not None else (row['Price'] if 'Price' in row else np.nan)
+            if pd.isna(price) or price == 0:
+                # Try to fetch price from Zerodha
+                stock_details = fetch_stock_details(kite, symbol, cache, reporter) if kite is not None else None
+                if stock_details and 'LastPrice' in stock_details:
+                    price = stock_details['LastPrice']
+            
+            if pd.notna(price) and price != 0:
+                price = float(price)
+                estimated_cost = price * quantity
+            else:
+                estimated_cost = np.nan
+                
+            orders_info.append({
+                'Symbol': symbol,
+                'Quantity': quantity,
+                'Order ID': order_id,
+                'Status': 'Success' if not dry_run else 'Dry Run',
+                'Price': price,
+                'Estimated Cost': estimated_cost,
+                'Order Type': order_type,
+                **({'Side': side} if has_side else {})
+            })
+            
+        except Exception as e:
+            logger.error(f"Error placing order for {symbol}: {str(e)}")
+            failed_orders += 1
+            
+            orders_info.append({
+                'Symbol': symbol,
+                'Quantity': row['Quantity'] if 'Quantity' in row else 'N/A',
+                'Order ID': 'Failed',
+                'Status': f'Error: {str(e)}',
+                'Price': row['Price'] if 'Price' in row else 'N/A',
+                'Estimated Cost': 'N/A',
+                'Order Type': order_type,
+                **({'Side': row['Side']} if has_side else {})
+            })
+    
+    # Create a DataFrame with order information
+    orders_df = normalize_orders(pd.DataFrame(orders_info))
+    logger.info(f"Order summary: {successful_orders} successful, {failed_orders} failed")
+    
+    return successful_orders, failed_orders, orders_df
+
+# Validate a basket and pre-build every order request for a later release
+def stage_order_requests(kite, stocks_df, order_type="MARKET", gtt_details=None, cache=None, reporter=None):
+    """Returns (requests, problems).
+
+    Symbols are resolved against the NSE instrument list, quantities fixed
+    to whole shares and GTT parameters computed now, so releasing the
+    basket only has to send the requests. problems lists one message per
+    leg that could not be staged; those legs are left out of requests.
+    """
+    if cache is None:
+        cache = {}
+    reporter = reporter or Reporter()
+    
+    if cache.get('available_instruments') is None:
+        try:
+            cache['available_instruments'] = kite.instruments("NSE")
+        except Exception as e:
+            logger.error(f"Error fetching instruments: {str(e)}")
+            reporter.warning("Could not fetch instruments list from Zerodha; symbols were not verified.")
+    
+    known_symbols = None
+    if cache.get('available_instruments') is not None:
+        known_symbols = set(instrument_frame(cache['available_instruments'], ['tradingsymbol'])['tradingsymbol'])
+    
+    prices = stocks_df['Price'] if 'Price' in stocks_df.columns else pd.Series(np.nan, index=stocks_df.index)
+    limit_prices = stocks_df['Limit Price'] if 'Limit Price' in stocks_df.columns else pd.Series(np.nan, index=stocks_df.index)
+    
+    requests = []
+    problems = []
+    for symbol, quantity, price, limit_price in zip(stocks_df['Symbol'].astype(str), stocks_df['Quantity'], prices, limit_prices):
+        symbol = symbol.strip().upper()
+        
+        if known_symbols is not None and symbol not in known_symbols:
+            problems.append(f"{symbol}: not found in the NSE instrument list")
+            continue
+        if pd.isna(quantity) or int(quantity) < 1:
+            problems.append(f"{symbol}: quantity must be at least 1")
+            continue
+        
+        try:
+            request = build_order_request(kite, symbol, int(quantity), order_type, gtt_details, limit_price)
+        except ValueError as e:
+            problems.append(f"{symbol}: {str(e)}")
+            continue
+        
+        if order_type == "LIMIT":
+            price = limit_price
+        request['price'] = float(price) if pd.notna(price) and price > 0 else np.nan
+        requests.append(request)
+    
+    logger.info(f"Staged {len(requests)} {order_type} order requests, {len(problems)} legs rejected")
+    
+    return requests, problems
+
+# Fire pre-built order requests through the rate limiter and time each acknowledgement
+def release_order_requests(kite, requests, dry_run=True, rate_limiter=None, max_workers=ORDER_RATE_LIMIT):
+    """Returns (orders_df, latency).
+
+    Requests are sent from a small thread pool so a slow acknowledgement
+    doesn't hold back the next slot of the rate limiter. latency holds the
+    seconds from release to the first, median and last acknowledgement.
+    """
+    if rate_limiter is None:
+        rate_limiter = RateLimiter(ORDER_RATE_LIMIT)
+    
+    released_at = time.perf_counter()
+    
+    def fire(position, request):
+        rate_limiter.wait()
+        try:
+            if dry_run:
+                logger.info(f"[DRY RUN] Would place {request['order_type']} order for {request['quantity']} shares of {request['symbol']}")
+                order_id = f"dry-run-{position + 1}"
+                status = 'Dry Run'
+            else:
+                order_id = send_order_request(kite, request)
+                status = 'Success'
+        except Exception as e:
+            logger.error(f"Error placing order for {request['symbol']}: {str(e)}")
+            order_id = 'Failed'
+            status = f'Error: {str(e)}'
+        
+        return {
+            'Symbol': request['symbol'],
+            'Quantity': request['quantity'],
+            'Order ID': order_id,
+            'Status': status,
+            'Price': request.get('price', np.nan),
+            'Estimated Cost': request.get('price', np.nan) * request['quantity'],
+            'Order Type': request['order_type'],
+            'Ack (ms)': round((time.perf_counter() - released_at) * 1000, 1)
+        }
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(len(requests), max_workers))) as executor:
+        rows = list(executor.map(fire, range(len(requests)), requests))
+    
+    acks = sorted(row['Ack (ms)'] / 1000 for row in rows)
+    latency = {
+        'orders': len(rows),
+        'first_ack': acks[0] if acks else None,
+        'median_ack': acks[len(acks) // 2] if acks else None,
+        'last_ack': acks[-1] if acks else None
+    }
+    
+    logger.info(f"Released {len(rows)} orders; last acknowledgement {latency['last_ack'] or 0:.3f}s after release")
+    
+    return normalize_orders(pd.DataFrame(rows)), latency
+
+# Use Price, then FetchedPrice, then one batched LTP call for legs without a price
+def fill_missing_prices(kite, stocks_df):
+    df = stocks_df.copy()
+    
+    if 'Price' in df.columns:
+        prices = df['Price'].astype('float64')
+    else:
+        prices = pd.Series(np.nan, index=df.index)
+    if 'FetchedPrice' in df.columns:
+        prices = prices.where(prices > 0, df['FetchedPrice'].astype('float64'))
+    
+    missing = prices.isna() | (prices <= 0)
+    if missing.any() and kite is not None:
+        keys = [f"NSE:{symbol}" for symbol in df.loc[missing, 'Symbol'].astype(str)]
+        try:
+            ltp = kite.ltp(keys)
+            prices[missing] = [ltp.get(key, {}).get('last_price', np.nan) for key in keys]
+        except Exception as e:
+            logger.error(f"Error fetching last traded prices: {str(e)}")
+    
+    df['Price'] = prices.astype('float32')
+    return df
+
+# Last price and circuit limits for many symbols with batched quote calls
+def fetch_quotes(kite, symbols):
+    """Returns a DataFrame indexed by symbol with last_price,
+    lower_circuit_limit and upper_circuit_limit (NaN where unavailable)."""
+    symbols = list(dict.fromkeys(str(symbol) for symbol in symbols))
+    columns = ['last_price', 'lower_circuit_limit', 'upper_circuit_limit']
+    
+    rows = {}
+    for start in range(0, len(symbols), QUOTE_BATCH_SIZE):
+        keys = [f"NSE:{symbol}" for symbol in symbols[start:start + QUOTE_BATCH_SIZE]]
+        quotes = kite.quote(keys)
+        for key in keys:
+            if key in quotes:
+                rows[key[4:]] = [quotes[key].get(column) for column in columns]
+    
+    quotes_df = pd.DataFrame.from_dict(rows, orient='index', columns=columns).reindex(symbols)
+    return quotes_df.astype('float64')
+
+# Tick size of each symbol from the instrument list
+def tick_sizes(symbols, instruments=None):
+    ticks = {}
+    if instruments:
+        frame = instrument_frame(instruments, ['tradingsymbol', 'tick_size'])
+        ticks = dict(zip(frame['tradingsymbol'], frame['tick_size']))
+    
+    sizes = pd.Series([ticks.get(str(symbol)) for symbol in symbols], dtype='float64')
+    return sizes.where(sizes > 0, DEFAULT_TICK_SIZE).to_numpy()
+
+# Limit prices for a whole basket in one vectorized pass
+def compute_limit_prices(stocks_df, quotes_df, ticks, offset_pct=0.0, base="LTP"):
+    """Returns stocks_df with Base Price, Limit Price, Lower/Upper Circuit and Band Flag columns.
+
+    The base is the last traded price from quotes_df ("LTP") or the
+    basket's own Price column ("Price"), falling back to LTP where the
+    basket has no price. The offset is applied, the result rounded down
+    to the tick size (a buy never pays more than intended; sells in a
+    Side column round up) and clamped
+    into the day's circuit band. Band Flag explains legs whose price was
+    clamped or couldn't be computed; those orders would be rejected as
+    submitted, so they are flagged instead of sent blindly.
+    """
+    df = stocks_df.reset_index(drop=True).copy()
+    quotes = quotes_df.reindex(df['Symbol'].astype(str))
+    
+    ltp = quotes['last_price'].to_numpy()
+    if base == "Price" and 'Price' in df.columns:
+        base_price = df['Price'].astype('float64').to_numpy()
+        base_price = np.where(base_price > 0, base_price, ltp)
+    else:
+        base_price = ltp
+    
+    lower = quotes['lower_circuit_limit'].to_numpy()
+    upper = quotes['upper_circuit_limit'].to_numpy()
+    
+    raw = base_price * (1 + offset_pct / 100)
+    steps = np.round(raw / ticks, 6)
+    if 'Side' in df.columns:
+        # Sells round up instead, so they never accept less than intended
+        limit = np.where(df['Side'].astype(str).to_numpy() == "SELL", np.ceil(steps), np.floor(steps)) * ticks
+    else:
+        limit = np.floor(steps) * ticks
+    
+    below = limit < lower
+    above = limit > upper
+    # The band edges are themselves on the tick grid
+    limit = np.clip(limit, np.where(np.isnan(lower), -np.inf, lower), np.where(np.isnan(upper), np.inf, upper))
+    
+    flags = np.select(
+        [np.isnan(base_price) | (base_price <= 0), np.isnan(lower) | np.isnan(upper), below, above],
+        ["No price", "No circuit band", "Below lower circuit, raised to band", "Above upper circuit, lowered to band"],
+        default=""
+    )
+    
+    df['Base Price'] = base_price.astype('float32')
+    # Kept as float64 so the price sent is exactly on the tick grid
+    df['Limit Price'] = np.where(np.isnan(base_price) | (base_price <= 0), np.nan, np.round(limit, 2))
+    df['Tick Size'] = ticks.astype('float32')
+    df['Lower Circuit'] = lower.astype('float32')
+    df['Upper Circuit'] = upper.astype('float32')
+    df['Band Flag'] = pd.Series(flags, dtype=object).replace("", None)
+    
+    return df
+
+# Quote the basket once and price every leg as a LIMIT order
+def price_limit_orders(kite, stocks_df, offset_pct=0.0, base="LTP", cache=None, reporter=None):
+    if cache is None:
+        cache = {}
+    reporter = reporter or Reporter()
+    
+    if cache.get('available_instruments') is None:
+        try:
+            cache['available_instruments'] = kite.instruments("NSE")
+        except Exception as e:
+            logger.error(f"Error fetching instruments: {str(e)}")
+            reporter.warning(f"Could not fetch instruments list from Zerodha; assuming a tick size of {DEFAULT_TICK_SIZE}.")
+    
+    symbols = stocks_df['Symbol'].astype(str).str.strip().str.upper()
+    quotes_df = fetch_quotes(kite, symbols)
+    priced_df = compute_limit_prices(stocks_df.assign(Symbol=symbols.to_numpy()), quotes_df, tick_sizes(symbols, cache.get('available_instruments')), offset_pct, base)
+    
+    flagged = int(priced_df['Band Flag'].notna().sum())
+    if flagged:
+        reporter.warning(f"{flagged} of {len(priced_df)} legs need attention before sending, see Band Flag")
+    
+    return priced_df
+
+# Stable key for the legs of a basket (symbol and quantity, in order)
+def basket_key(stocks_df):
+    legs = zip(stocks_df['Symbol'].astype(str), stocks_df['Quantity'].astype(int))
+    return hashlib.sha256(json.dumps([[symbol, int(quantity)] for symbol, quantity in legs]).encode()).hexdigest()
+
+# Parameters of one delivery BUY leg for Kite's margin endpoints
+def margin_order_params(kite, symbol, quantity):
+    return {
+        "exchange": kite.EXCHANGE_NSE,
+        "tradingsymbol": symbol,
+        "transaction_type": kite.TRANSACTION_TYPE_BUY,
+        "variety": kite.VARIETY_REGULAR,
+        "product": kite.PRODUCT_CNC,
+        "order_type": kite.ORDER_TYPE_MARKET,
+        "quantity": int(quantity),
+        "price": 0,
+        "trigger_price": 0
+    }
+
+# Required margin and charges for a basket from Kite's basket margin API
+def check_basket_margins(kite, stocks_df, available_cash=None):
+    """Returns (legs_df, summary).
+
+    Legs are sent MARGIN_BATCH_SIZE at a time to basket_order_margins, which
+    prices them at the current market and accounts for margin benefits
+    across the basket. legs_df has the required margin and charges of each
+    leg and, when available_cash is given, the shortfall of each leg when
+    the basket is placed in order. summary has the basket totals.
+    """
+    symbols = stocks_df['Symbol'].astype(str).tolist()
+    quantities = stocks_df['Quantity'].astype(int).tolist()
+    
+    required = []
+    charges = []
+    basket_required = 0.0
+    basket_charges = 0.0
+    
+    for start in range(0, len(symbols), MARGIN_BATCH_SIZE):
+        params = [margin_order_params(kite, symbol, quantity)
+                  for symbol, quantity in zip(symbols[start:start + MARGIN_BATCH_SIZE], quantities[start:start + MARGIN_BATCH_SIZE])]
+        response = kite.basket_order_margins(params, consider_positions=True)
+        
+        for order in response.get('orders', []):
+            required.append(float(order.get('total', 0) or 0))
+            charges.append(float((order.get('charges') or {}).get('total', 0) or 0))
+        
+        basket_required += float((response.get('final') or response.get('initial') or {}).get('total', 0) or 0)
+        basket_charges += sum(charges[start:])
+    
+    if len(required) != len(symbols):
+        raise ValueError(f"Margin API returned {len(required)} legs for a basket of {len(symbols)}")
+    
+    legs_df = pd.DataFrame({
+        'Symbol': symbols,
+        'Quantity': np.array(quantities, dtype='int32'),
+        'Required Margin': np.array(required, dtype='float64'),
+        'Charges': np.array(charges, dtype='float64')
+    })
+    legs_df['Total'] = legs_df['Required Margin'] + legs_df['Charges']
+    
+    summary = {
+        'required_margin': sum(required),
+        'basket_margin': basket_required,
+        'charges': basket_charges,
+        'total': basket_required + basket_charges,
+        'available_cash': available_cash,
+        'shortfall': None
+    }
+    
+    if available_cash is not None:
+        # Each leg is short by whatever of it no longer fits once the legs before it are placed
+        spent = legs_df['Total'].cumsum()
+        legs_df['Shortfall'] = np.minimum(legs_df['Total'], np.maximum(spent - available_cash, 0))
+        summary['shortfall'] = max(0.0, summary['total'] - available_cash)
+    
+    return legs_df, summary
+
+# Reduce quantities until the basket's margin and charges fit the available cash
+def trim_to_margin(kite, stocks_df, available_cash, max_rounds=3):
+    """Returns (trimmed_df, legs_df, summary).
+
+    Quantities are scaled down proportionally from the per-leg costs the
+    margin API reports, then the trimmed basket is checked again (margin
+    benefits and charges don't scale exactly). Legs trimmed to zero shares
+    are dropped.
+    """
+    df = stocks_df.copy()
+    legs_df, summary = check_basket_margins(kite, df, available_cash)
+    
+    for _ in range(max_rounds):
+        if summary['shortfall'] <= 0 or df.empty:
+            break
+        
+        factor = available_cash / summary['total'] if summary['total'] > 0 else 0
+        # Aim slightly below the limit so the re-check usually passes
+        df['Quantity'] = np.floor(df['Quantity'].to_numpy() * factor * 0.995).astype('int32')
+        df = df[df['Quantity'] > 0]
+        if df.empty:
+            break
+        legs_df, summary = check_basket_margins(kite, df, available_cash)
+    
+    logger.info(f"Trimmed basket to {len(df)} legs needing ₹{summary['total']:.2f} of ₹{available_cash:.2f}")
+    
+    return df, legs_df, summary
+
+# Calculate optimal quantities based on available balance
+def calculate_optimal_quantities(stocks_df, available_balance):
+    try:
+        # Create a working copy
+        working_df = stocks_df.copy()
+        
+        # Ensure Price column exists and is numeric
+        if 'Price' not in working_df.columns:
+            working_df['Price'] = 0
+        
+        # Convert Price to numeric, handling non-numeric values
+        working_df['Price'] = pd.to_numeric(working_df['Price'].astype(str).str.replace(',', ''), errors='coerce')
+        
+        # Replace NaN or 0 prices with fetched prices if available
+        for i, row in working_df.iterrows():
+            if pd.isna(row['Price']) or row['Price'] == 0:
+                if 'FetchedPrice' in row and row['FetchedPrice'] > 0:
+                    working_df.at[i, 'Price'] = row['FetchedPrice']
+        
+        # Filter out rows with invalid prices
+        valid_df = working_df[working_df['Price'] > 0].copy()
+        
+        if valid_df.empty:
+            return working_df, "No valid prices found for any stock"
+        
+        # Calculate the total cost with quantity = 1 for each stock
+        valid_df['Cost'] = valid_df['Price']
+        
+        # Total cost if we buy 1 share of each stock
+        total_base_cost = valid_df['Cost'].sum()
+        
+        if total_base_cost > 0:
+            # Calculate allocation ratio
+            allocation_ratio = available_balance / total_base_cost
+            
+            # Calculate optimal quantity for each stock
+            valid_df['OptimalQuantity'] = (allocation_ratio * valid_df['Price'] / valid_df['Price']).apply(lambda x: max(1, int(x)))
+            
+            # Check if we're within budget
+            valid_df['TotalCost'] = valid_df['OptimalQuantity'] * valid_df['Price']
+            total_cost = valid_df['TotalCost'].sum()
+            
+            # If we're over budget, reduce quantities proportionally
+            if total_cost > available_balance:
+                reduction_factor = available_balance / total_cost
+                valid_df['OptimalQuantity'] = (valid_df['OptimalQuantity'] * reduction_factor).apply(lambda x: max(1, int(x)))
+                
+                # Recalculate final cost
+                valid_df['TotalCost'] = valid_df['OptimalQuantity'] * valid_df['Price']
+            
+            # Update the original dataframe with optimal quantities
+            for i, row in valid_df.iterrows():
+                idx = working_df.index.get_loc(i)
+                working_df.at[idx, 'Quantity'] = row['OptimalQuantity']
+            
+            # Calculate the final total cost
+            final_total_cost = (working_df['Price'] * working_df['Quantity']).sum()
+            
+            return working_df, f"Optimized quantities to use ₹{final_total_cost:.2f} of available ₹{available_balance:.2f}"
+        else:
+            return working_df, "Could not calculate optimal quantities due to invalid prices"
+    
+    except Exception as e:
+        logger.error(f"Error calculating optimal quantities: {str(e)}")
+        return stocks_df, f"Error calculating optimal quantities: {str(e)}"
+
+# Append events to the order journal
+_journal_lock = threading.Lock()
+
+def append_order_journal(events, username=None):
+    if not events:
+        return
+    
+    timestamp = datetime.datetime.now().isoformat()
+    
+    try:
+        with _journal_lock, open(ORDER_JOURNAL_FILE, 'a') as f:
+            for event in events:
+                f.write(json.dumps({'timestamp': timestamp, 'username': username, **event}, default=str) + "\n")
+    except Exception as e:
+        logger.error(f"Error writing order journal: {str(e)}")
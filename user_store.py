@@ -0,0 +1,221 @@
+"""User accounts in SQLite, with the aggregates the admin dashboard shows.
+
+The user database used to be one JSON file that every page read whole,
+so the admin dashboard built a row per user on each rerun. UserStore
+keeps one row per user in an indexed table instead:
+
+    point lookups    by username (the primary key)
+    pages            ORDER BY username with LIMIT/OFFSET, optionally over a
+                     username prefix, which is a range scan on the key
+    counts           users, admins and users with an API key, kept in a
+                     counters table by triggers on every insert, update
+                     and delete, so they cost one row read
+    sign-ups         users created per day, kept the same way
+
+Fields other than the fixed columns (older records may carry extra keys)
+are kept as JSON in the extra column, so records round-trip unchanged.
+An existing users.json is imported when the database is first created.
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+
+from state_backend import thread_connection
+
+logger = logging.getLogger('zerodha_trading_tool.users')
+
+USER_DB_PATH = os.environ.get("USER_DB_PATH", "users.db")
+
+# Columns of the users table, after username; everything else goes to extra
+USER_COLUMNS = ("password", "admin", "created_at", "zerodha_api_key", "zerodha_api_secret")
+
+# Users per page of the admin dashboard
+USER_PAGE_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    username TEXT PRIMARY KEY,
+    password TEXT NOT NULL,
+    admin INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL DEFAULT '',
+    zerodha_api_key TEXT NOT NULL DEFAULT '',
+    zerodha_api_secret TEXT NOT NULL DEFAULT '',
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS user_counts (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO user_counts (name, value) VALUES ('users', 0), ('admins', 0), ('api_keys', 0);
+CREATE TABLE IF NOT EXISTS user_signups (day TEXT PRIMARY KEY, users INTEGER NOT NULL);
+
+CREATE TRIGGER IF NOT EXISTS users_insert AFTER INSERT ON users BEGIN
+    UPDATE user_counts SET value = value + CASE name
+        WHEN 'users' THEN 1
+        WHEN 'admins' THEN NEW.admin != 0
+        WHEN 'api_keys' THEN NEW.zerodha_api_key != ''
+    END;
+    INSERT INTO user_signups (day, users) VALUES (substr(NEW.created_at, 1, 10), 1)
+        ON CONFLICT(day) DO UPDATE SET users = users + 1;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_delete AFTER DELETE ON users BEGIN
+    UPDATE user_counts SET value = value - CASE name
+        WHEN 'users' THEN 1
+        WHEN 'admins' THEN OLD.admin != 0
+        WHEN 'api_keys' THEN OLD.zerodha_api_key != ''
+    END;
+    UPDATE user_signups SET users = users - 1 WHERE day = substr(OLD.created_at, 1, 10);
+    DELETE FROM user_signups WHERE users <= 0;
+END;
+
+CREATE TRIGGER IF NOT EXISTS users_update AFTER UPDATE OF admin, zerodha_api_key, created_at ON users BEGIN
+    UPDATE user_counts SET value = value + CASE name
+        WHEN 'admins' THEN (NEW.admin != 0) - (OLD.admin != 0)
+        WHEN 'api_keys' THEN (NEW.zerodha_api_key != '') - (OLD.zerodha_api_key != '')
+        ELSE 0
+    END;
+    UPDATE user_signups SET users = users - 1 WHERE day = substr(OLD.created_at, 1, 10);
+    INSERT INTO user_signups (day, users) VALUES (substr(NEW.created_at, 1, 10), 1)
+        ON CONFLICT(day) DO UPDATE SET users = users + 1;
+    DELETE FROM user_signups WHERE users <= 0;
+END;
+"""
+
+# Table row for a user record, and back
+def _to_row(username, record):
+    extra = {key: value for key, value in record.items() if key not in USER_COLUMNS}
+    return (
+        username,
+        record.get("password", ""),
+        int(bool(record.get("admin", False))),
+        record.get("created_at") or "",
+        record.get("zerodha_api_key") or "",
+        record.get("zerodha_api_secret") or "",
+        json.dumps(extra) if extra else None
+    )
+
+def _from_row(row):
+    record = {
+        "password": row[1],
+        "admin": bool(row[2]),
+        "created_at": row[3],
+        "zerodha_api_key": row[4],
+        "zerodha_api_secret": row[5]
+    }
+    if row[6]:
+        record.update(json.loads(row[6]))
+    return record
+
+# Username range covered by a prefix, for range scans on the primary key
+def _prefix_range(prefix):
+    return prefix, prefix + '\uffff'
+
+class UserStore:
+    def __init__(self, path=USER_DB_PATH, import_file=None):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as db:
+            db.executescript(SCHEMA)
+        if import_file and self.count() == 0 and os.path.exists(import_file):
+            self.import_json(import_file)
+
+    def _connection(self):
+        return thread_connection(self._local, self.path)
+
+    def import_json(self, path):
+        """Load a users.json written by earlier versions of the app."""
+        with open(path) as f:
+            users = json.load(f)
+        with self._connection() as db:
+            db.executemany("INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?, ?, ?)", [_to_row(username, record) for username, record in users.items()])
+        logger.info(f"Imported {len(users)} users from {path}")
+
+    def get(self, username):
+        """A user's record, or None."""
+        row = self._connection().execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+        return _from_row(row) if row is not None else None
+
+    def existing(self, usernames):
+        """The given usernames that have an account."""
+        usernames = list(usernames)
+        found = set()
+        # Chunks stay under SQLite's bound parameter limit
+        for start in range(0, len(usernames), 500):
+            chunk = usernames[start:start + 500]
+            rows = self._connection().execute(f"SELECT username FROM users WHERE username IN ({','.join('?' * len(chunk))})", chunk).fetchall()
+            found.update(row[0] for row in rows)
+        return found
+
+    def add(self, username, record):
+        """False if the username is taken."""
+        try:
+            with self._connection() as db:
+                db.execute("INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?)", _to_row(username, record))
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def update(self, username, fields):
+        """Set fields of a user's record; False if there is no such user."""
+        with self._connection() as db:
+            row = db.execute("SELECT * FROM users WHERE username = ?", (username,)).fetchone()
+            if row is None:
+                return False
+            record = _from_row(row)
+            record.update(fields)
+            db.execute(
+                "UPDATE users SET password = ?, admin = ?, created_at = ?, zerodha_api_key = ?, zerodha_api_secret = ?, extra = ? WHERE username = ?",
+                _to_row(username, record)[1:] + (username,)
+            )
+        return True
+
+    def put(self, username, record):
+        """Insert or replace a user's whole record."""
+        with self._connection() as db:
+            db.execute(
+                "INSERT INTO users VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(username) DO UPDATE SET "
+                "password = excluded.password, admin = excluded.admin, created_at = excluded.created_at, "
+                "zerodha_api_key = excluded.zerodha_api_key, zerodha_api_secret = excluded.zerodha_api_secret, extra = excluded.extra",
+                _to_row(username, record)
+            )
+
+    def with_extra_fields(self, fields):
+        """Records, by username, carrying any of the given extra fields."""
+        condition = ' OR '.join("json_extract(extra, ?) IS NOT NULL" for _ in fields)
+        rows = self._connection().execute(f"SELECT * FROM users WHERE extra IS NOT NULL AND ({condition})", [f'$."{field}"' for field in fields])
+        return {row[0]: _from_row(row) for row in rows}
+
+    def delete(self, username):
+        """False if there is no such user."""
+        with self._connection() as db:
+            return db.execute("DELETE FROM users WHERE username = ?", (username,)).rowcount > 0
+
+    def page(self, prefix="", offset=0, limit=USER_PAGE_SIZE):
+        """One page of users in username order, as dicts with Username,
+        Admin, Created and API Key Set."""
+        low, high = _prefix_range(prefix)
+        rows = self._connection().execute(
+            "SELECT username, admin, created_at, zerodha_api_key != '' FROM users "
+            "WHERE username >= ? AND username < ? ORDER BY username LIMIT ? OFFSET ?",
+            (low, high, limit, offset)
+        ).fetchall()
+        return [
+            {"Username": row[0], "Admin": "Yes" if row[1] else "No", "Created": row[2] or "Unknown", "API Key Set": "Yes" if row[3] else "No"}
+            for row in rows
+        ]
+
+    def count(self, prefix=""):
+        """Users whose username starts with prefix."""
+        if not prefix:
+            return self.counts()['users']
+        return self._connection().execute("SELECT COUNT(*) FROM users WHERE username >= ? AND username < ?", _prefix_range(prefix)).fetchone()[0]
+
+    def counts(self):
+        """{'users', 'admins', 'api_keys'} totals."""
+        return dict(self._connection().execute("SELECT name, value FROM user_counts").fetchall())
+
+    def signups(self, since=None):
+        """(day, users) pairs in day order, from since (YYYY-MM-DD) on."""
+        return self._connection().execute(
+            "SELECT day, users FROM user_signups WHERE day >= ? ORDER BY day", (since or "",)
+        ).fetchall()